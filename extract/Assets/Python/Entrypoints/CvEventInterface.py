@@ -16,7 +16,7 @@ from CvPythonExtensions import *
 # ExtractSkeleton 11/2020 lfgr START
 import CvPythonExtensions
 import extract_skeleton
-extract_skeleton.extract_skeleton( CvPythonExtensions )
+extract_skeleton.extract_skeleton( CvPythonExtensions, "~/Documents/My Games/Beyond the Sword/Logs/skeleton.json" )
 # ExtractSkeleton END
 
 normalEventManager = CvEventManager.CvEventManager()
@@ -1,5 +1,7 @@
 import inspect
+import os
 import sys
+import time
 
 import simplejson as json
 
@@ -8,10 +10,63 @@ import simplejson as json
 # TODO: Handle str vs. unicode (?)
 
 
+# Types whose instances share the docstring of their type
+_VALUE_TYPES = (bool, int, float, str, unicode)
+_SHARED_DOC_TYPES = _VALUE_TYPES + (dict,)
+
+
 class DocTreeMaker( object ) :
 	def __init__( self, iMaxDepth = 3 ) :
 		self._sIndentStr = "  "
 		self._iMaxDepth = iMaxDepth
+		self._dTypeDocs = {} # Docstrings of _SHARED_DOC_TYPES and enum types
+	
+	def _get_type_doc( self, obj ) :
+		""" Returns inspect.getdoc( obj ), computed only once per type of obj. """
+		tp = type( obj )
+		try :
+			return self._dTypeDocs[tp]
+		except KeyError :
+			sDoc = inspect.getdoc( obj )
+			self._dTypeDocs[tp] = sDoc
+			return sDoc
+	
+	def _get_members( self, obj ) :
+		"""
+		Returns the (name, value) pairs of the public members and __init__ of a module or class, sorted by name.
+		Unlike inspect.getmembers, this reads the __dict__ of obj (and of its bases) directly, and skips attributes
+		that can't be retrieved.
+		"""
+		bClass = inspect.isclass( obj )
+		if bClass :
+			lDicts = [klass.__dict__ for klass in inspect.getmro( obj )]
+		else :
+			lDicts = [obj.__dict__]
+		
+		dMembers = {}
+		for dAttrs in lDicts :
+			for sMemberName, memberObj in dAttrs.items() :
+				if sMemberName in dMembers :
+					continue # Overridden in a subclass
+				if sMemberName == "__init__" or not sMemberName.startswith( "_" ) :
+					dMembers[sMemberName] = memberObj
+		
+		lMembers = []
+		lNames = dMembers.keys()
+		lNames.sort()
+		for sMemberName in lNames :
+			memberObj = dMembers[sMemberName]
+			if bClass :
+				# Same as getattr( obj, sMemberName ), e.g. functions become unbound methods
+				fGet = getattr( type( memberObj ), "__get__", None )
+				if fGet is not None :
+					try :
+						memberObj = fGet( memberObj, None, obj )
+					except Exception, e :
+						print "Could not get member " + sMemberName + ", error: " + str( e )
+						continue
+			lMembers.append( ( sMemberName, memberObj ) )
+		return lMembers
 	
 	def make_doc_tree( self, obj, sName, iDepth = 0, bEnumItem = False ) :
 		result = { "name" : sName }
@@ -19,7 +74,7 @@ class DocTreeMaker( object ) :
 		if inspect.isclass(tp):
 			result["type"] = tp.__name__
 
-		if tp in (bool, int, float, str, unicode) :
+		if tp in _VALUE_TYPES :
 			result["value"] = obj
 		elif bEnumItem :
 			result["value"] = int( obj ) # TODO?
@@ -32,7 +87,10 @@ class DocTreeMaker( object ) :
 			result["setter"] = obj.fset is not None
 			result["deleter"] = obj.fdel is not None
 		
-		sDoc = inspect.getdoc( obj )
+		if bEnumItem or tp in _SHARED_DOC_TYPES :
+			sDoc = self._get_type_doc( obj )
+		else :
+			sDoc = inspect.getdoc( obj )
 		if sDoc is not None and sDoc != "" :
 			result["doc"] = sDoc
 
@@ -44,27 +102,113 @@ class DocTreeMaker( object ) :
 				
 				members = None
 				try :
-					members = inspect.getmembers( obj ) # Already sorted by name
+					members = self._get_members( obj )
 				except Exception, e :
 					print "Could not get members, error: " + str( e )
 
 				if members :
 					encodedMembers = []
 					for sMemberName, memberObj in members :
-						if sMemberName == "__init__" or not sMemberName.startswith( "_" ) :
-							bEnumItem = bEnum and type( memberObj ) == obj
-							encodedMembers.append( self.make_doc_tree( memberObj, sMemberName, iDepth + 1, bEnumItem ) )
+						bEnumItem = bEnum and type( memberObj ) == obj
+						encodedMembers.append( self.make_doc_tree( memberObj, sMemberName, iDepth + 1, bEnumItem ) )
 					result["members"] = encodedMembers
 
 		return result
 
 
-def extract_skeleton( module, out = sys.stdout, iMaxDepth = 3 ) :
-	sys.stdout.write( "------------------------------------------------------------------------\n" )
-	sys.stdout.write( "Tree for %s START\n" % module.__name__ )
+def _count_members( tree ) :
+	iCount = 0
+	for member in tree.get( "members", [] ) :
+		iCount += 1 + _count_members( member )
+	return iCount
+
+
+# Fields of a node in the compact format
+_COMPACT_STRING_FIELDS = { "name" : 1, "type" : 2, "doc" : 3 }
+_COMPACT_STRIDE = 7
+
+def make_compact_tree( tree ) :
+	"""
+	Converts a doc tree to the compact skeleton format, with a string table and a flat node table.
+	See cyskeleton/compact.py in CySkeleton-generate for a description.
+	"""
+	lStrings = []
+	dStringIndices = {}
+	lShapes = []
+	dShapeIndices = {}
+	lNodes = []
+	lExtras = []
+	
+	# Breadth-first, so the members of each node are consecutive
+	lQueue = [tree]
+	iIdx = 0
+	while iIdx < len( lQueue ) :
+		node = lQueue[iIdx]
+		iIdx += 1
+		tShape = tuple( node.keys() )
+		if tShape not in dShapeIndices :
+			dShapeIndices[tShape] = len( lShapes )
+			lShapes.append( list( tShape ) )
+		lRecord = [dShapeIndices[tShape], -1, -1, -1, -1, 0, -1]
+		lExtraValues = []
+		for sKey in tShape :
+			value = node[sKey]
+			if sKey in _COMPACT_STRING_FIELDS :
+				if value not in dStringIndices :
+					dStringIndices[value] = len( lStrings )
+					lStrings.append( value )
+				lRecord[_COMPACT_STRING_FIELDS[sKey]] = dStringIndices[value]
+			elif sKey == "members" :
+				lRecord[4] = len( lQueue )
+				lRecord[5] = len( value )
+				lQueue.extend( value )
+			else :
+				lExtraValues.append( value )
+		if lExtraValues :
+			lRecord[6] = len( lExtras )
+			lExtras.append( lExtraValues )
+		lNodes.extend( lRecord )
 	
-	json.dump( DocTreeMaker( iMaxDepth ).make_doc_tree( module, module.__name__ ), out )
-	out.write( "\n" )
+	return { "format" : "cyskeleton-compact", "version" : 1, "strings" : lStrings, "shapes" : lShapes,
+			"nodes" : lNodes, "extras" : lExtras }
+
+
+def extract_skeleton( module, sOutPath = None, iMaxDepth = 3, bCompact = False ) :
+	"""
+	Writes the doc tree of module as JSON to the file sOutPath ("~" is expanded), and a short summary to the log.
+	If sOutPath is None or can't be written, the JSON is written to the log between the START and END markers
+	instead (see tools/retrieve_extract.py). If bCompact is True, the tree is written in the compact format.
+	"""
+	fStart = time.time()
+	tree = DocTreeMaker( iMaxDepth ).make_doc_tree( module, module.__name__ )
+	fTraversed = time.time()
+	iMembers = _count_members( tree )
+	if bCompact :
+		tree = make_compact_tree( tree )
+	sJson = json.dumps( tree, check_circular = False ) + "\n" # The tree is acyclic, this enables the fast encoder
+	fEncoded = time.time()
+	
+	sys.stdout.write( "------------------------------------------------------------------------\n" )
+	bWritten = False
+	if sOutPath is not None :
+		sOutPath = os.path.expanduser( sOutPath )
+		try :
+			fp = open( sOutPath, "w" )
+			try :
+				fp.write( sJson )
+			finally :
+				fp.close()
+			bWritten = True
+		except IOError, e :
+			sys.stdout.write( "Could not write %s, error: %s\n" % ( sOutPath, str( e ) ) )
 	
-	sys.stdout.write( "Tree for %s END\n" % module.__name__ )
+	if bWritten :
+		sys.stdout.write( "Tree for %s written to %s (%d bytes, %d members)\n"
+				% ( module.__name__, sOutPath, len( sJson ), iMembers ) )
+	else :
+		sys.stdout.write( "Tree for %s START\n" % module.__name__ )
+		sys.stdout.write( sJson )
+		sys.stdout.write( "Tree for %s END\n" % module.__name__ )
+	sys.stdout.write( "Tree for %s took %.2f s (traversal %.2f s, encoding %.2f s)\n"
+			% ( module.__name__, time.time() - fStart, fTraversed - fStart, fEncoded - fTraversed ) )
 	sys.stdout.write( "------------------------------------------------------------------------\n" )
@@ -142,6 +142,29 @@ class JSONEncoder(object):
         if markers is not None:
             del markers[markerid]
 
+    def _convert_key(self, key):
+        """
+        Return key as a string, or None if it should be skipped.
+        """
+        if isinstance(key, (str, unicode)):
+            return key
+        # JavaScript is weakly typed for these, so it makes sense to
+        # also allow them.  Many encoders seem to do something like this.
+        elif isinstance(key, float):
+            return floatstr(key, self.allow_nan)
+        elif isinstance(key, (int, long)):
+            return str(key)
+        elif key is True:
+            return 'true'
+        elif key is False:
+            return 'false'
+        elif key is None:
+            return 'null'
+        elif self.skipkeys:
+            return None
+        else:
+            raise TypeError("key %r is not a string" % (key,))
+
     def _iterencode_dict(self, dct, markers=None):
         if not dct:
             yield '{}'
@@ -157,26 +180,10 @@ class JSONEncoder(object):
             encoder = encode_basestring_ascii
         else:
             encoder = encode_basestring
-        allow_nan = self.allow_nan
         for key, value in dct.iteritems():
-            if isinstance(key, (str, unicode)):
-                pass
-            # JavaScript is weakly typed for these, so it makes sense to
-            # also allow them.  Many encoders seem to do something like this.
-            elif isinstance(key, float):
-                key = floatstr(key, allow_nan)
-            elif isinstance(key, (int, long)):
-                key = str(key)
-            elif key is True:
-                key = 'true'
-            elif key is False:
-                key = 'false'
-            elif key is None:
-                key = 'null'
-            elif self.skipkeys:
+            key = self._convert_key(key)
+            if key is None:
                 continue
-            else:
-                raise TypeError("key %r is not a string" % (key,))
             if first:
                 first = False
             else:
@@ -247,6 +254,73 @@ class JSONEncoder(object):
         """
         raise TypeError("%r is not JSON serializable" % (o,))
 
+    def _encode_tree(self, o):
+        """
+        Return the same as encode(o) with ensure_ascii, but faster for
+        trees of dicts, lists, strings, ints and bools (such as the output
+        of DocTreeMaker). There is no check for circular references.
+        """
+        chunks = []
+        append = chunks.append
+        escape_search = ESCAPE_ASCII.search
+        convert_key = self._convert_key
+        iterencode = self._iterencode
+
+        def encode_string(s):
+            if escape_search(s) is None:
+                return '"' + str(s) + '"'
+            return encode_basestring_ascii(s)
+
+        def encode(o):
+            t = type(o)
+            if t is str or t is unicode:
+                append(encode_string(o))
+            elif t is dict:
+                if not o:
+                    append('{}')
+                    return
+                append('{')
+                first = True
+                for key, value in o.iteritems():
+                    if type(key) is not str:
+                        key = convert_key(key)
+                        if key is None:
+                            continue
+                    if first:
+                        first = False
+                        append(encode_string(key) + ':')
+                    else:
+                        append(', ' + encode_string(key) + ':')
+                    encode(value)
+                append('}')
+            elif t is list or t is tuple:
+                if not o:
+                    append('[]')
+                    return
+                append('[')
+                first = True
+                for value in o:
+                    if first:
+                        first = False
+                    else:
+                        append(', ')
+                    encode(value)
+                append(']')
+            elif t is bool:
+                if o:
+                    append('true')
+                else:
+                    append('false')
+            elif t is int or t is long:
+                append(str(o))
+            else:
+                # None, floats, subclasses and custom objects
+                for chunk in iterencode(o, None):
+                    append(chunk)
+
+        encode(o)
+        return ''.join(chunks)
+
     def encode(self, o):
         """
         Return a JSON string representation of a Python data structure.
@@ -254,6 +328,8 @@ class JSONEncoder(object):
         >>> JSONEncoder().encode({"foo": ["bar", "baz"]})
         '{"foo":["bar", "baz"]}'
         """
+        if self.ensure_ascii and not self.check_circular:
+            return self._encode_tree(o)
         # This doesn't pass the iterator directly to ''.join() because it
         # sucks at reporting exceptions.  It's going to do this internally
         # anyway because it uses PySequence_Fast or similar.
@@ -0,0 +1,145 @@
+"""
+Offline benchmark for extract_skeleton.py. Builds a stand-in for the CvPythonExtensions module (classes with
+instancemethods that have BtS-style docstrings and properties, enum types with "name" and "values", module functions
+and values) out of plain Python objects, and times the traversal (DocTreeMaker.make_doc_tree) and the encoding phase
+of extract_skeleton on it.
+
+Like the mod itself, this needs Python 2 (2.4 to 2.7). Run it from anywhere, e.g.
+	python2 tools/bench_doc_tree.py [--scale N] [--compact]
+"""
+
+import optparse
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+_sAssetsDir = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "Assets", "Python" )
+sys.path[0:0] = [_sAssetsDir, os.path.join( _sAssetsDir, "simplejson" )]
+
+import extract_skeleton
+import simplejson as json
+
+
+_RETURN_TYPES = ["int", "int", "int", "bool", "bool", "float", "void", "void", "wstring", "std::wstring", "CyPlot*",
+		"CyUnit*", "CyCity*", "PlayerTypes", "TeamTypes", "UnitTypes", "python::tuple"]
+_ARGS = ["int iIndex", "int iI", "int iPlayer", "bool bTestVisible", "int /*PlayerTypes*/ ePlayer", "UnitTypes eUnit",
+		"CyPlot* pPlot", "CyUnit* pOther", "int iX", "int iY", "float fValue", "string szText", "TeamTypes eTeam",
+		"BuildingTypes eBuilding", "std::wstring szName", "bool bIgnoreCost"]
+_DESCRIPTIONS = ["", "", "", "returns the number of units", "Returns whether the plot is visible",
+		"sets the value", "Returns the owner (PlayerTypes)"]
+
+
+class _Instance( object ) :
+	""" Stands in for Boost.Python.instance, the base of all Boost.Python classes """
+	pass
+
+
+def _make_method( sDoc ) :
+	def method( self, *args ) :
+		pass
+	method.__doc__ = sDoc
+	return method
+
+def _make_doc( rng ) :
+	""" Returns a docstring like those of BtS functions, e.g. "int (CyUnit* pOther) - returns ..." """
+	lArgs = []
+	for iArg in range( rng.choice( [0, 0, 1, 1, 1, 2, 2, 3] ) ) :
+		lArgs.append( rng.choice( _ARGS ) )
+	sDoc = rng.choice( _RETURN_TYPES ) + " (" + ", ".join( lArgs ) + ")"
+	sDescription = rng.choice( _DESCRIPTIONS )
+	if sDescription :
+		sDoc = sDoc + " - " + sDescription
+	return sDoc
+
+def _make_class( rng, sName, iMethods, iProperties ) :
+	dAttrs = { "__init__" : _make_method( None ) }
+	for iMethod in range( iMethods ) :
+		dAttrs["method%d" % iMethod] = _make_method( _make_doc( rng ) )
+	for iProperty in range( iProperties ) :
+		dAttrs["iProperty%d" % iProperty] = property( lambda self : 0, lambda self, value : None )
+	return type( sName, ( _Instance, ), dAttrs )
+
+def _make_enum( sName, iValues ) :
+	""" Returns an enum type like those of Boost.Python, with its items as attributes and in "values" """
+	tp = type( sName, ( int, ), { "name" : property( lambda self : "" ) } )
+	dValues = {}
+	for iValue in range( iValues ) :
+		item = tp( iValue - 1 )
+		setattr( tp, "%s_%d" % ( sName.upper(), iValue ), item )
+		dValues[iValue - 1] = item
+	tp.values = dValues
+	return tp
+
+def make_module( iClasses = 142, iMethods = 38, iProperties = 1, iEnums = 158, iEnumValues = 20, iFunctions = 156,
+		iSeed = 0 ) :
+	"""
+	Returns a module with the given numbers of classes (with iMethods methods and iProperties properties each),
+	enums (with iEnumValues items each) and functions. The defaults resemble the CvPythonExtensions module of BtS.
+	"""
+	rng = random.Random( iSeed )
+	module = types.ModuleType( "CvPythonExtensions", "Civilization IV Player Class" )
+	for iClass in range( iClasses ) :
+		sName = "CyClass%d" % iClass
+		setattr( module, sName, _make_class( rng, sName, iMethods, iProperties ) )
+	for iEnum in range( iEnums ) :
+		sName = "Enum%dTypes" % iEnum
+		setattr( module, sName, _make_enum( sName, iEnumValues ) )
+	for iFunction in range( iFunctions ) :
+		setattr( module, "function%d" % iFunction, _make_method( _make_doc( rng ) ) )
+	module.true = 1
+	module.false = 0
+	return module
+
+
+def _best_time( fRun, iRepeat ) :
+	""" Returns the best time of iRepeat calls of fRun, and the result of the last call """
+	fBest = None
+	result = None
+	for iRun in range( iRepeat ) :
+		fStart = time.time()
+		result = fRun()
+		fElapsed = time.time() - fStart
+		if fBest is None or fElapsed < fBest :
+			fBest = fElapsed
+	return fBest, result
+
+
+def main() :
+	parser = optparse.OptionParser( usage = "%prog [options]" )
+	parser.add_option( "--scale", type = "int", default = 1,
+			help = "Factor for the numbers of classes, enums and functions (default: %default)" )
+	parser.add_option( "--methods", type = "int", default = 38, help = "Methods per class (default: %default)" )
+	parser.add_option( "--properties", type = "int", default = 1, help = "Properties per class (default: %default)" )
+	parser.add_option( "--enum-values", type = "int", default = 20, help = "Items per enum (default: %default)" )
+	parser.add_option( "--repeat", type = "int", default = 3,
+			help = "Number of runs; the best time is reported (default: %default)" )
+	parser.add_option( "--compact", action = "store_true", default = False,
+			help = "Also time the conversion to the compact format" )
+	options, lArgs = parser.parse_args()
+
+	module = make_module( 142 * options.scale, options.methods, options.properties, 158 * options.scale,
+			options.enum_values, 156 * options.scale )
+
+	fTraversal, tree = _best_time( lambda : extract_skeleton.DocTreeMaker().make_doc_tree( module, module.__name__ ),
+			options.repeat )
+	print( "%d members" % extract_skeleton._count_members( tree ) )
+	print( "traversal: %8.1f ms" % ( fTraversal * 1000 ) )
+	if options.compact :
+		fCompact, tree = _best_time( lambda : extract_skeleton.make_compact_tree( tree ), options.repeat )
+		print( "compact:   %8.1f ms" % ( fCompact * 1000 ) )
+	fEncoding, sJson = _best_time( lambda : json.dumps( tree, check_circular = False ), options.repeat )
+	print( "encoding:  %8.1f ms (%d bytes)" % ( fEncoding * 1000, len( sJson ) ) )
+
+	# One run of the whole extraction, as in the game, to check that it works
+	iFd, sPath = tempfile.mkstemp( suffix = ".json" )
+	os.close( iFd )
+	try :
+		extract_skeleton.extract_skeleton( module, sPath, bCompact = options.compact )
+	finally :
+		os.remove( sPath )
+
+if __name__ == "__main__" :
+	main()
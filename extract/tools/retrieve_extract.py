@@ -2,7 +2,11 @@
 Recovers output of the Extract mod and writes it into the file skeleton.json
 """
 
+import argparse
+import mmap
 import os
+import sys
+import time
 
 
 # Input and output file, change this if necessary
@@ -13,25 +17,98 @@ OUT_FILE = "skeleton.json"
 START_LINE = "Tree for CvPythonExtensions START"
 END_LINE = "Tree for CvPythonExtensions END"
 
+_START = START_LINE.encode( "ascii" )
+_END = END_LINE.encode( "ascii" )
 
-# Expand "~"
-inPath = os.path.expanduser( LOG_FILE )
-outPath = os.path.expanduser( OUT_FILE )
-
-try :
-	has_written = False
-	with open( inPath, "r" ) as inFp :
-		with open( outPath, "w" ) as outFp :
-			writing = False
-			for line in inFp :
-				if line.strip() == START_LINE :
-					writing = True
-					has_written = True
-				elif line.strip() == END_LINE :
-					writing = False
-				elif writing :
-					outFp.write( line )
-	if not has_written :
+
+def find_last_tree( data, searchFrom = 0 ) :
+	"""
+	Returns the byte range ( start, end ) of the lines between the last START/END marker pair in data, or None.
+	Only END markers at or after searchFrom are considered.
+	"""
+	endPos = data.rfind( _END, max( 0, searchFrom ) )
+	while endPos != -1 :
+		endLinePos = data.rfind( b"\n", 0, endPos ) + 1
+		startPos = data.rfind( _START, 0, endLinePos )
+		if startPos != -1 :
+			contentPos = data.find( b"\n", startPos ) + 1
+			if 0 < contentPos <= endLinePos :
+				return contentPos, endLinePos
+		# END without START, try an earlier one
+		endPos = data.rfind( _END, max( 0, searchFrom ), endPos )
+	return None
+
+
+def _scan( inPath, searchFrom = 0 ) :
+	"""
+	Returns ( size, tree ), where tree is the content between the last marker pair of the file (or None).
+	"""
+	with open( inPath, "rb" ) as inFp :
+		size = os.fstat( inFp.fileno() ).st_size
+		if size == 0 :
+			return 0, None # Can't map empty files
+		with mmap.mmap( inFp.fileno(), size, access = mmap.ACCESS_READ ) as data :
+			treeRange = find_last_tree( data, searchFrom )
+			if treeRange is None :
+				return size, None
+			return size, data[treeRange[0]:treeRange[1]]
+
+
+def retrieve( inPath, outPath ) :
+	size, tree = _scan( inPath )
+	if tree is None :
 		print( "ERROR: Tree not found in log" )
-except IOError as e :
-	print( "Error opening file '" + e.filename + "'" )
\ No newline at end of file
+		return False
+	with open( outPath, "wb" ) as outFp :
+		outFp.write( tree )
+	return True
+
+
+def follow( inPath, outPath, interval = 1.0 ) :
+	"""
+	Waits until a new tree is written to the log, then writes it to outPath.
+	"""
+	try :
+		searchFrom = os.path.getsize( inPath )
+	except OSError :
+		searchFrom = 0 # Not created yet
+	print( "Waiting for a new tree in '" + inPath + "'..." )
+	while True :
+		try :
+			size, tree = _scan( inPath, searchFrom - len( _END ) )
+		except OSError :
+			size, tree = 0, None
+		if tree is not None :
+			with open( outPath, "wb" ) as outFp :
+				outFp.write( tree )
+			return
+		if size < searchFrom :
+			searchFrom = 0 # The log was restarted, search it from the beginning
+		time.sleep( interval )
+
+
+def main() :
+	parser = argparse.ArgumentParser( description = __doc__ )
+	parser.add_argument( "log_file", nargs = "?", default = LOG_FILE, help = "The python log (default: %(default)s)." )
+	parser.add_argument( "out_file", nargs = "?", default = OUT_FILE, help = "The output file (default: %(default)s)." )
+	parser.add_argument( "--follow", action = "store_true",
+			help = "Wait for the game to write a new tree to the log, and write it as soon as it is complete." )
+	args = parser.parse_args()
+
+	# Expand "~"
+	inPath = os.path.expanduser( args.log_file )
+	outPath = os.path.expanduser( args.out_file )
+
+	try :
+		if args.follow :
+			follow( inPath, outPath )
+		elif not retrieve( inPath, outPath ) :
+			sys.exit( 1 )
+	except IOError as e :
+		print( "Error opening file '" + e.filename + "'" )
+		sys.exit( 1 )
+	except KeyboardInterrupt :
+		sys.exit( 1 )
+
+if __name__ == "__main__" :
+	main()
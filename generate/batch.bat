@@ -0,0 +1,3 @@
+@echo off
+set PYTHONPATH=%PYTHONPATH%;.
+py cyskeleton/batch.py %*
\ No newline at end of file
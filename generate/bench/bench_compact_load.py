@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark for loading skeletons in the compact format, compared to json.load of the usual format.
+Each measurement runs in a fresh process, so the memory use is not affected by earlier measurements. Memory is
+measured as the resident set size (RSS) after loading, and the increase of RSS by loading (Linux only).
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_compact_load.py [--scale 1 10 ...]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import model
+from cyskeleton import preprocess
+
+import synthetic
+
+
+_MODES = {
+	"json" : "json.load, then collect custom types",
+	"compact-lazy" : "compact.load, then collect custom types",
+	"compact-full" : "compact.load, then convert all members",
+	"json-model" : "json.load and model.from_json, then walk all members (like generate)",
+	"compact-model" : "compact.load_model, then convert and walk one member at a time (like generate)",
+}
+
+
+def _rss_mb() -> float :
+	with open( "/proc/self/statm", "r" ) as fp :
+		return int( fp.read().split()[1] ) * resource.getpagesize() / ( 1024 * 1024 )
+
+
+def _child( mode : str, path : str ) -> None :
+	""" Runs one measurement and prints the load time, the RSS before loading and the RSS after. """
+	rssBefore = _rss_mb()
+	start = time.perf_counter()
+	with open( path, "r" ) as fp :
+		if mode == "json" :
+			data = json.load( fp )
+			preprocess._custom_type_members( data["members"] )
+		elif mode == "compact-lazy" :
+			data = compact.load( fp )
+			preprocess._custom_type_members( data["members"] )
+		elif mode == "compact-full" :
+			data = compact.load( fp )
+			data["members"] = list( data["members"] )
+		else :
+			data = model.from_json( json.load( fp ) ) if mode == "json-model" else compact.load_model( fp )
+			for member in data.members :
+				pass
+	elapsed = time.perf_counter() - start
+	print( json.dumps( [elapsed, rssBefore, _rss_mb()] ) )
+
+
+def _measure( mode : str, path : str ) -> Tuple[float, float, float] :
+	output = subprocess.run( [sys.executable, __file__, "--child", mode, path], check = True,
+			stdout = subprocess.PIPE, universal_newlines = True ).stdout
+	return tuple( json.loads( output ) )
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to scale up." )
+	parser.add_argument( "--scale", type = int, nargs = "+", default = [1, 10],
+			help = "Factors to scale up the skeleton by." )
+	parser.add_argument( "--child", nargs = 2, metavar = ("MODE", "PATH"), help = argparse.SUPPRESS )
+	args = parser.parse_args()
+
+	if args.child is not None :
+		_child( *args.child )
+		return
+
+	with open( args.input, "r" ) as fp :
+		data = json.load( fp )
+	for mode, description in _MODES.items() :
+		print( f"{mode}: {description}" )
+	print( f"{'scale':>5} {'mode':<13} {'size':>9} {'load':>8} {'RSS':>9} {'RSS+':>9}" )
+	with tempfile.TemporaryDirectory() as tmpDir :
+		for scale in args.scale :
+			scaled = synthetic.scale_skeleton( data, scale )
+			paths = { "json" : os.path.join( tmpDir, f"skeleton_{scale}.json" ),
+					"compact" : os.path.join( tmpDir, f"skeleton_{scale}.compact.json" ) }
+			with open( paths["json"], "w" ) as fp :
+				json.dump( scaled, fp )
+			with open( paths["compact"], "w" ) as fp :
+				json.dump( compact.to_compact( scaled ), fp, separators = (",", ":") )
+			for mode in _MODES :
+				path = paths["compact"] if mode.startswith( "compact" ) else paths["json"]
+				elapsed, rssBefore, rssAfter = _measure( mode, path )
+				print( f"{scale:5} {mode:<13} {os.path.getsize( path ) / 1024:7.0f}KB {elapsed:7.3f}s"
+						f" {rssAfter:7.1f}MB {rssAfter - rssBefore:7.1f}MB" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the typed node model (cyskeleton.model), compared to the plain JSON dict tree it replaces.
+Measures the memory held by a preprocessed, scaled-up skeleton in both representations and the time for a traversal
+that reads what generation reads (names, types, docs, members, signatures).
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_node_model.py [--scale N]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import time
+import tracemalloc
+
+from cyskeleton.common import *
+from cyskeleton import model
+from cyskeleton import preprocess
+
+import synthetic
+
+
+def _traverse_dict( data : JsonObj ) -> int :
+	count = len( data["name"] ) + len( data["type"] )
+	if "doc" in data :
+		count += len( data["doc"] )
+	if "signature" in data :
+		sig = data["signature"]
+		count += len( sig.get( "return-type", "Any" ) )
+		for arg in sig.get( "args" ) :
+			count += len( arg["name"] ) + len( arg.get( "type", "Any" ) )
+	for member in data.get( "members", () ) :
+		count += _traverse_dict( member )
+	return count
+
+def _traverse_model( node : model.Node ) -> int :
+	count = len( node.name ) + len( node.type )
+	if node.doc is not None :
+		count += len( node.doc )
+	sig = getattr( node, "signature", None )
+	if sig is not None :
+		count += len( sig.returnType if sig.returnType is not None else "Any" )
+		for arg in sig.args :
+			count += len( arg.name ) + len( arg.type if arg.type is not None else "Any" )
+	for member in getattr( node, "members", None ) or () :
+		count += _traverse_model( member )
+	return count
+
+
+def _measure_memory( build : Callable[[], Any] ) -> Tuple[Any, int] :
+	""" Returns the result of build and the memory it holds, in bytes. """
+	gc.collect()
+	tracemalloc.start()
+	result = build()
+	gc.collect()
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return result, size
+
+def _time_traversal( traverse : Callable[[Any], int], root : Any, repeat : int ) -> Tuple[float, int] :
+	best = float( "inf" )
+	count = 0
+	for _ in range( repeat ) :
+		start = time.perf_counter()
+		count = traverse( root )
+		best = min( best, time.perf_counter() - start )
+	return best, count
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to scale up." )
+	parser.add_argument( "--config", default = "config_default.json", help = "The configuration file to use." )
+	parser.add_argument( "--scale", type = int, default = 10, help = "Factor to scale up the skeleton by." )
+	parser.add_argument( "--repeat", type = int, default = 5, help = "Number of traversals (the best is reported)." )
+	args = parser.parse_args()
+
+	with open( args.input, "r" ) as fp :
+		data = synthetic.scale_skeleton( json.load( fp ), args.scale )
+	with open( args.config, "r" ) as fp :
+		conf = json.load( fp )
+	module = model.from_json( data )
+	with contextlib.redirect_stdout( io.StringIO() ) :
+		preprocess.Preprocess( module, conf )
+	text = json.dumps( module.to_json() )
+	del data, module
+	print( f"Preprocessed skeleton scaled {args.scale}x: {len( text ) / 1024 / 1024:.1f} MB of JSON" )
+
+	tree, dictSize = _measure_memory( lambda : json.loads( text ) )
+	dictTime, dictCount = _time_traversal( _traverse_dict, tree, args.repeat )
+	del tree
+	root, modelSize = _measure_memory( lambda : model.from_json( json.loads( text ) ) )
+	modelTime, modelCount = _time_traversal( _traverse_model, root, args.repeat )
+	assert dictCount == modelCount
+
+	print( f"{'':6} {'memory':>10} {'traversal':>10}" )
+	print( f"{'dicts':6} {dictSize / 1024 / 1024:8.1f}MB {dictTime * 1000:8.1f}ms" )
+	print( f"{'model':6} {modelSize / 1024 / 1024:8.1f}MB {modelTime * 1000:8.1f}ms"
+			f" ({modelSize / dictSize:.2f}x memory, {dictTime / modelTime:.2f}x faster)" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for parallel preprocessing (preprocess --jobs) on a synthetic skeleton.
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_parallel_preprocess.py [--scale N] [--jobs 1 2 4 ...]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from cyskeleton.common import *
+from cyskeleton import model
+from cyskeleton import preprocess
+
+import synthetic
+
+
+def _run( data : JsonObj, conf : JsonObj, jobs : int ) -> Tuple[float, str, str] :
+	module = model.from_json( data )
+	out = io.StringIO()
+	with contextlib.redirect_stdout( out ) :
+		start = time.perf_counter()
+		preprocess.Preprocess( module, conf, verbosity = 3, jobs = jobs )
+		elapsed = time.perf_counter() - start
+	return elapsed, json.dumps( module.to_json(), indent = "\t" ), out.getvalue()
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to scale up." )
+	parser.add_argument( "--config", default = "config_default.json", help = "The configuration file to use." )
+	parser.add_argument( "--scale", type = int, default = 10, help = "Factor to scale up the skeleton by." )
+	parser.add_argument( "--jobs", type = int, nargs = "+", default = [2, 4, os.cpu_count() or 1],
+			help = "Numbers of processes to compare against serial preprocessing." )
+	args = parser.parse_args()
+
+	with open( args.input, "r" ) as fp :
+		data = synthetic.scale_skeleton( json.load( fp ), args.scale )
+	with open( args.config, "r" ) as fp :
+		conf = json.load( fp )
+	print( f"{len( data['members'] )} module members" )
+
+	serialTime, serialResult, serialOutput = _run( data, conf, 1 )
+	print( f"serial:  {serialTime:7.2f} s" )
+	for jobs in sorted( set( args.jobs ) ) :
+		if jobs <= 1 :
+			continue
+		parallelTime, parallelResult, parallelOutput = _run( data, conf, jobs )
+		assert parallelResult == serialResult, f"Result with {jobs} jobs differs from serial result"
+		assert parallelOutput == serialOutput, f"Output with {jobs} jobs differs from serial output"
+		print( f"{jobs:2} jobs: {parallelTime:7.2f} s ({serialTime / parallelTime:.2f}x)" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Load test for the query server (cyskeleton/serve.py). Preprocesses a skeleton, starts the server on it and sends a mix
+of lookup, complete, signature and methodsByType requests, first one at a time (reporting the latency per request,
+including the round trip through the pipes) and then pipelined (reporting the throughput).
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_serve.py [--requests 20000]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from cyskeleton.common import *
+from cyskeleton import model
+from cyskeleton import preprocess
+
+
+def _make_requests( skeleton : model.Module, count : int, seed : int = 0 ) -> List[str] :
+	""" Returns count requests (as lines) for members of the skeleton. """
+	rng = random.Random( seed )
+	paths = []
+	types = set()
+	for member in skeleton.members or () :
+		paths.append( member.name )
+		for classMember in getattr( member, "members", None ) or () :
+			paths.append( f"{member.name}.{classMember.name}" )
+			if isinstance( classMember, model.FunctionNode ) and classMember.signature is not None :
+				types.add( classMember.signature.returnType )
+	types.discard( None )
+	typeList = sorted( types )
+	requests = []
+	for requestId in range( count ) :
+		kind = rng.choice( ( "lookup", "complete", "complete", "signature", "methodsByType" ) )
+		path = rng.choice( paths )
+		if kind == "lookup" :
+			params : JsonObj = { "path" : path }
+		elif kind == "complete" :
+			params = { "prefix" : path[:rng.randint( 1, len( path ) )].lower(), "limit" : 20 }
+		elif kind == "signature" :
+			params = { "path" : path }
+		else :
+			params = { "type" : rng.choice( typeList ), "role" : rng.choice( ( "returns", "takes" ) ) }
+		requests.append( json.dumps( { "jsonrpc" : "2.0", "id" : requestId, "method" : kind, "params" : params } )
+				+ "\n" )
+	return requests
+
+
+def _percentile( values : List[float], fraction : float ) -> float :
+	return sorted( values )[min( len( values ) - 1, int( len( values ) * fraction ) )]
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to serve (preprocessed first)." )
+	parser.add_argument( "--config", default = "config_default.json", help = "The configuration file to use." )
+	parser.add_argument( "--requests", type = int, default = 20000, help = "Number of requests per run." )
+	args = parser.parse_args()
+
+	with open( args.config, "r" ) as fp :
+		conf = json.load( fp )
+	with open( args.input, "r" ) as fp :
+		skeleton = model.from_json( json.load( fp ) )
+	with contextlib.redirect_stdout( io.StringIO() ) :
+		preprocess.Preprocess( skeleton, conf )
+	requests = _make_requests( skeleton, args.requests )
+
+	with tempfile.TemporaryDirectory() as tmpDir :
+		path = os.path.join( tmpDir, "skeleton_proc.json" )
+		with open( path, "w" ) as fp :
+			json.dump( skeleton.to_json(), fp )
+		start = time.perf_counter()
+		server = subprocess.Popen( [sys.executable, "-m", "cyskeleton", "serve", path], stdin = subprocess.PIPE,
+				stdout = subprocess.PIPE, universal_newlines = True, bufsize = 1 )
+		try :
+			# The first response arrives once the skeleton is loaded
+			server.stdin.write( requests[0] )
+			server.stdout.readline()
+			print( f"startup (load and index): {( time.perf_counter() - start ) * 1000:8.1f}ms" )
+
+			latencies = []
+			for request in requests :
+				start = time.perf_counter()
+				server.stdin.write( request )
+				response = json.loads( server.stdout.readline() )
+				latencies.append( time.perf_counter() - start )
+				assert "result" in response, response
+			print( f"sequential: {len( requests ) / sum( latencies ):8.0f} requests/s,"
+					f" latency p50 {_percentile( latencies, 0.5 ) * 1000:.3f}ms,"
+					f" p99 {_percentile( latencies, 0.99 ) * 1000:.3f}ms,"
+					f" max {max( latencies ) * 1000:.3f}ms" )
+
+			def write_all() -> None :
+				for request in requests :
+					server.stdin.write( request )
+				server.stdin.flush()
+			writer = threading.Thread( target = write_all )
+			start = time.perf_counter()
+			writer.start()
+			for _ in requests :
+				server.stdout.readline()
+			elapsed = time.perf_counter() - start
+			writer.join()
+			print( f"pipelined:  {len( requests ) / elapsed:8.0f} requests/s" )
+		finally :
+			server.stdin.close()
+			server.wait()
+
+if __name__ == "__main__" :
+	main()
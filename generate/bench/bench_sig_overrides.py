@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark for signature override matching in Preprocess, using thousands of synthetic overrides.
+Compares the override index against a linear scan over all overrides (the previous implementation).
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_sig_overrides.py [--overrides N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from cyskeleton.common import *
+from cyskeleton import model
+from cyskeleton import preprocess
+
+
+class _LinearSigOverrides :
+	""" Drop-in replacement for preprocess._SigOverrideIndex that tries every override for every path. """
+	def __init__( self, sigOverrides : Sequence[preprocess.SigOverride] ) -> None :
+		self._sigOverrides = sigOverrides
+
+	def matches( self, path : str ) -> Iterator[Tuple[preprocess.SigOverride, str]] :
+		for sigOverride in self._sigOverrides :
+			newSig = sigOverride.try_make_new_sig( path )
+			if newSig is not None :
+				yield sigOverride, newSig
+
+
+def make_overrides( data : JsonObj, count : int ) -> List[JsonObj] :
+	"""
+	Creates `count` synthetic overrides: half exact paths, half patterns, spread over the classes of the module.
+	Some of them match existing methods, the others match nothing.
+	"""
+	moduleName = data["name"]
+	classes = [member for member in data["members"] if member["type"] == "class" and member.get( "members" )]
+	result = []
+	for idx in range( count ) :
+		cls = classes[idx % len( classes )]
+		method = cls["members"][idx % len( cls["members"] )]["name"]
+		if idx % 2 == 0 :
+			path = f"{moduleName}.{cls['name']}.{method}"
+			if idx % 4 == 0 :
+				path += f"Missing{idx}"
+			result.append( { "path" : path, "signature" : "int ()" } )
+		else :
+			pattern = f"{moduleName}\\.{cls['name']}\\.{method[:3]}([A-Za-z]*)"
+			if idx % 3 == 0 :
+				pattern += f"Missing{idx}"
+			result.append( { "pathPattern" : pattern, "signature" : "int (int i{0})" } )
+	return result
+
+
+def _run( data : JsonObj, conf : JsonObj, repeat : int ) -> Tuple[float, JsonObj, str] :
+	best = float( "inf" )
+	result : JsonObj = {}
+	output = ""
+	for _ in range( repeat ) :
+		module = model.from_json( data )
+		buf = io.StringIO()
+		with contextlib.redirect_stdout( buf ) :
+			start = time.perf_counter()
+			preprocess.Preprocess( module, conf )
+			best = min( best, time.perf_counter() - start )
+		result, output = module.to_json(), buf.getvalue()
+	return best, result, output
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to preprocess." )
+	parser.add_argument( "--overrides", type = int, default = 2000, help = "Number of synthetic overrides." )
+	parser.add_argument( "--repeat", type = int, default = 3, help = "Number of runs; the best time is reported." )
+	args = parser.parse_args()
+
+	with open( args.input, "r" ) as fp :
+		data = json.load( fp )
+	conf = { "sig-overrides" : make_overrides( data, args.overrides ) }
+
+	indexedTime, indexedResult, indexedOutput = _run( data, conf, args.repeat )
+
+	origIndex = preprocess._SigOverrideIndex
+	preprocess._SigOverrideIndex = _LinearSigOverrides # type: ignore
+	try :
+		linearTime, linearResult, linearOutput = _run( data, conf, args.repeat )
+	finally :
+		preprocess._SigOverrideIndex = origIndex # type: ignore
+
+	assert indexedResult == linearResult, "Index and linear scan produced different results"
+	assert indexedOutput == linearOutput, "Index and linear scan produced different warnings"
+
+	print( f"{args.overrides} overrides, {indexedOutput.count( 'unused' )} unused" )
+	print( f"linear scan: {linearTime * 1000:9.1f} ms" )
+	print( f"index:       {indexedTime * 1000:9.1f} ms ({linearTime / indexedTime:.1f}x)" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of preprocessing and generation on a real skeleton and on synthetic, scaled-up skeletons.
+For each scale, a fresh process loads the skeleton, preprocesses it and generates the module, and reports the wall time
+of each phase, the time spent in signature parsing (sig_util.SigParseCache) and TypeContext.cpp_to_python_type during
+preprocessing, and the peak RSS of the process (Linux only). The hot paths are timed by wrapping them, which adds a
+little overhead.
+
+Results can be stored as a baseline and later compared against it; the script then exits with status 1 if a metric
+got slower (or larger) than the baseline by more than the threshold.
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_suite.py [--scale 1 10 100] [--save-baseline FILE | --baseline FILE]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from cyskeleton.common import *
+from cyskeleton import generate
+from cyskeleton import model
+from cyskeleton import preprocess
+from cyskeleton import sig_util
+from cyskeleton import type_util
+
+import synthetic
+
+
+# Metrics in report order, with their indentation (nested metrics are part of the enclosing one) and unit
+_METRICS = [
+	( "load", 0, "s" ),
+	( "preprocess", 0, "s" ),
+	( "signature parsing", 1, "s" ),
+	( "cpp_to_python_type", 2, "s" ),
+	( "generate", 0, "s" ),
+	( "total", 0, "s" ),
+	( "peak-rss", 0, "MB" ),
+]
+
+# Differences below these are noise, whatever the ratio
+_MIN_DIFF = { "s" : 0.005, "MB" : 2.0 }
+
+_BASELINE_VERSION = 1
+
+
+class _Timer :
+	""" Accumulates the time spent in a function, by replacing it with a wrapper """
+	def __init__( self, owner : Any, name : str ) -> None :
+		self.elapsed = 0.0
+		self.calls = 0
+		self._owner = owner
+		self._name = name
+		self._orig = getattr( owner, name )
+
+	def __enter__( self ) -> "_Timer" :
+		orig = self._orig
+		perf_counter = time.perf_counter
+		def timed( *args, **kwargs ) :
+			start = perf_counter()
+			try :
+				return orig( *args, **kwargs )
+			finally :
+				self.elapsed += perf_counter() - start
+				self.calls += 1
+		setattr( self._owner, self._name, timed )
+		return self
+
+	def __exit__( self, *excInfo ) -> None :
+		setattr( self._owner, self._name, self._orig )
+
+
+def _child( path : str, configPath : str ) -> None :
+	""" Runs the pipeline once and prints the metrics as JSON. """
+	with open( configPath, "r" ) as fp :
+		conf = json.load( fp )
+
+	start = time.perf_counter()
+	with open( path, "r" ) as fp :
+		module = model.from_json( json.load( fp ) )
+	loaded = time.perf_counter()
+	with _Timer( sig_util.SigParseCache, "parse" ) as sigTimer, \
+			_Timer( type_util.TypeContext, "cpp_to_python_type" ) as typeTimer, \
+			contextlib.redirect_stdout( io.StringIO() ) :
+		preprocess.Preprocess( module, conf )
+	preprocessed = time.perf_counter()
+	with contextlib.redirect_stdout( io.StringIO() ) : # Warnings about ignored members
+		generate.gen_module_to_string( module )
+	generated = time.perf_counter()
+
+	print( json.dumps( {
+		"load" : loaded - start,
+		"preprocess" : preprocessed - loaded,
+		"signature parsing" : sigTimer.elapsed,
+		"cpp_to_python_type" : typeTimer.elapsed,
+		"generate" : generated - preprocessed,
+		"total" : generated - start,
+		"peak-rss" : resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024, # ru_maxrss is in KB on Linux
+		"calls" : { "signature parsing" : sigTimer.calls, "cpp_to_python_type" : typeTimer.calls },
+	} ) )
+
+
+def _measure( path : str, configPath : str, repeat : int ) -> JsonObj :
+	""" Runs the pipeline repeat times, each in a fresh process, and returns the best value of each metric. """
+	best : JsonObj = {}
+	for _ in range( repeat ) :
+		output = subprocess.run( [sys.executable, __file__, "--child", path, configPath], check = True,
+				stdout = subprocess.PIPE, universal_newlines = True ).stdout
+		result = json.loads( output )
+		for metric, _, _ in _METRICS :
+			best[metric] = min( best.get( metric, float( "inf" ) ), result[metric] )
+		best["calls"] = result["calls"]
+	return best
+
+
+def _format( value : float, unit : str ) -> str :
+	return f"{value * 1000:9.1f}ms" if unit == "s" else f"{value:9.1f}MB"
+
+def _report( scale : int, result : JsonObj, baseline : Optional[JsonObj], threshold : float ) -> List[str] :
+	""" Prints the metrics of one scale, compared to the baseline if given. Returns the regressed metrics. """
+	regressions = []
+	calls = result["calls"]
+	print( f"scale {scale}: {calls['signature parsing']} signatures looked up,"
+			f" {calls['cpp_to_python_type']} types converted" )
+	for metric, depth, unit in _METRICS :
+		line = f"  {'  ' * depth}{metric:<{24 - 2 * depth}} {_format( result[metric], unit )}"
+		if baseline is not None and metric in baseline :
+			base = baseline[metric]
+			ratio = result[metric] / base if base > 0 else float( "inf" )
+			line += f" {_format( base, unit )} {ratio:6.2f}x"
+			if ratio > 1 + threshold and result[metric] - base > _MIN_DIFF[unit] :
+				line += "  REGRESSION"
+				regressions.append( f"scale {scale} {metric}" )
+		print( line )
+	return regressions
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to scale up." )
+	parser.add_argument( "--config", default = "config_default.json", help = "The configuration file to use." )
+	parser.add_argument( "--scale", type = int, nargs = "+", default = [1, 10, 100],
+			help = "Factors to scale up the skeleton by (1 is the skeleton itself)." )
+	parser.add_argument( "--repeat", type = int, default = 1,
+			help = "Number of runs per scale; the best value of each metric is reported." )
+	group = parser.add_mutually_exclusive_group()
+	group.add_argument( "--save-baseline", metavar = "FILE", help = "Store the results as a baseline." )
+	group.add_argument( "--baseline", metavar = "FILE", help = "Compare the results against a stored baseline." )
+	parser.add_argument( "--threshold", type = float, default = 0.1,
+			help = "Relative increase over the baseline that counts as a regression (default: %(default)s)." )
+	parser.add_argument( "--child", nargs = 2, metavar = ("PATH", "CONFIG"), help = argparse.SUPPRESS )
+	args = parser.parse_args()
+
+	if args.child is not None :
+		_child( *args.child )
+		return
+
+	baseline = None
+	if args.baseline is not None :
+		with open( args.baseline, "r" ) as fp :
+			baselineData = json.load( fp )
+		if baselineData.get( "version" ) != _BASELINE_VERSION :
+			sys.exit( f"Unsupported baseline version in {args.baseline}" )
+		baseline = baselineData["results"]
+
+	with open( args.input, "r" ) as fp :
+		data = json.load( fp )
+	results : Dict[str, JsonObj] = {}
+	regressions : List[str] = []
+	with tempfile.TemporaryDirectory() as tmpDir :
+		for scale in args.scale :
+			if scale == 1 :
+				path = args.input
+			else :
+				path = os.path.join( tmpDir, f"skeleton_{scale}.json" )
+				with open( path, "w" ) as fp :
+					json.dump( synthetic.scale_skeleton( data, scale ), fp )
+			result = results[str( scale )] = _measure( path, args.config, args.repeat )
+			base = baseline.get( str( scale ) ) if baseline is not None else None
+			regressions += _report( scale, result, base, args.threshold )
+
+	if args.save_baseline is not None :
+		with open( args.save_baseline, "w" ) as fp :
+			json.dump( { "version" : _BASELINE_VERSION, "input" : args.input, "config" : args.config,
+					"results" : results }, fp, indent = "\t" )
+		print( f"Baseline written to {args.save_baseline}" )
+	if regressions :
+		print( f"{len( regressions )} regressions: {', '.join( regressions )}" )
+		sys.exit( 1 )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for TypeContext.cpp_to_python_type.
+Records every type string converted while preprocessing a skeleton, then replays them with and without the cache.
+
+Run from the generate directory:
+	PYTHONPATH=. python3 bench/bench_type_conversion.py [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from cyskeleton.common import *
+from cyskeleton import model
+from cyskeleton import preprocess
+from cyskeleton import type_util
+
+
+def record_type_strings( data : JsonObj, conf : Optional[JsonObj] ) -> List[Tuple[str, bool]] :
+	""" Preprocesses the given skeleton and returns the arguments of all calls to cpp_to_python_type, in order. """
+	calls : List[Tuple[str, bool]] = []
+	origFunc = type_util.TypeContext.cpp_to_python_type
+
+	def recording( self : type_util.TypeContext, cppType : str, altType : bool = False ) -> Optional[str] :
+		calls.append( ( cppType, altType ) )
+		return origFunc( self, cppType, altType )
+
+	type_util.TypeContext.cpp_to_python_type = recording # type: ignore
+	try :
+		with contextlib.redirect_stdout( io.StringIO() ) :
+			preprocess.Preprocess( model.from_json( data ), conf )
+	finally :
+		type_util.TypeContext.cpp_to_python_type = origFunc # type: ignore
+	return calls
+
+
+def _make_tc( data : JsonObj, conf : Optional[JsonObj], cacheSize : int ) -> type_util.TypeContext :
+	tc = type_util.TypeContext( cacheSize = cacheSize )
+	tc.read_type_overrides( conf or {} )
+	for member in data["members"] :
+		if member["type"] in {"class", "type"} :
+			tc.add_custom_type( member["name"] )
+	return tc
+
+
+def _replay( tc : type_util.TypeContext, calls : List[Tuple[str, bool]], repeat : int ) -> Tuple[float, List[Optional[str]]] :
+	best = float( "inf" )
+	results : List[Optional[str]] = []
+	for _ in range( repeat ) :
+		start = time.perf_counter()
+		results = [tc.cpp_to_python_type( cppType, altType ) for cppType, altType in calls]
+		best = min( best, time.perf_counter() - start )
+	return best, results
+
+
+def main() -> None :
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "--input", default = "skeleton_bts.json", help = "The skeleton to preprocess." )
+	parser.add_argument( "--config", default = "config_default.json", help = "The configuration file to use." )
+	parser.add_argument( "--repeat", type = int, default = 5, help = "Number of replays; the best time is reported." )
+	args = parser.parse_args()
+
+	with open( args.input, "r" ) as fp :
+		data = json.load( fp )
+	with open( args.config, "r" ) as fp :
+		conf = json.load( fp )
+
+	calls = record_type_strings( data, conf )
+	print( f"{len( calls )} conversions, {len( set( calls ) )} distinct" )
+
+	uncachedTime, uncachedResults = _replay( _make_tc( data, conf, 0 ), calls, args.repeat )
+	cachedTc = _make_tc( data, conf, 4096 )
+	cachedTime, cachedResults = _replay( cachedTc, calls, args.repeat )
+	assert cachedResults == uncachedResults, "Cached and uncached conversion produced different results"
+
+	print( f"uncached: {uncachedTime * 1000:8.2f} ms" )
+	print( f"cached:   {cachedTime * 1000:8.2f} ms ({uncachedTime / cachedTime:.1f}x)" )
+	print( f"cache hits: {cachedTc.cacheHits}, misses: {cachedTc.cacheMisses}" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,26 @@
+"""
+Synthetic skeletons for benchmarks, made by scaling up a real skeleton.
+"""
+
+import copy
+
+from cyskeleton.common import *
+
+
+def scale_skeleton( data : JsonObj, factor : int ) -> JsonObj :
+	"""
+	Returns a copy of the given (unprocessed or preprocessed) module skeleton with every class and type repeated
+	`factor` times. Copies are renamed by appending a number, e.g. CyUnit, CyUnit2, CyUnit3, ...
+	"""
+	assert data["type"] == "module"
+	result = { key : value for key, value in data.items() if key != "members" }
+	members = []
+	for member in data.get( "members", () ) :
+		members.append( copy.deepcopy( member ) )
+		if member["type"] in ("class", "type") :
+			for idx in range( 2, factor + 1 ) :
+				memberCopy = copy.deepcopy( member )
+				memberCopy["name"] = f"{member['name']}{idx}"
+				members.append( memberCopy )
+	result["members"] = members
+	return result
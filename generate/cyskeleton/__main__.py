@@ -0,0 +1,31 @@
+"""
+Runs one of the command line tools, e.g. python3 -m cyskeleton watch --config config_default.json skeleton.json out.py
+"""
+
+import importlib
+import sys
+
+
+# Command -> module and name of its main function
+_COMMANDS = {
+	"preprocess" : ( "cyskeleton.preprocess", "main" ),
+	"generate" : ( "cyskeleton.generate", "_main" ),
+	"batch" : ( "cyskeleton.batch", "main" ),
+	"compact" : ( "cyskeleton.compact", "main" ),
+	"watch" : ( "cyskeleton.watch", "main" ),
+	"serve" : ( "cyskeleton.serve", "main" ),
+	"diff" : ( "cyskeleton.diff", "main" ),
+	"delta" : ( "cyskeleton.delta", "main" ),
+}
+
+
+def main() -> None :
+	if len( sys.argv ) < 2 or sys.argv[1] not in _COMMANDS :
+		sys.exit( f"usage: cyskeleton {{{','.join( _COMMANDS )}}} ..." )
+	command = sys.argv.pop( 1 )
+	sys.argv[0] = f"cyskeleton {command}"
+	moduleName, funcName = _COMMANDS[command]
+	getattr( importlib.import_module( moduleName ), funcName )()
+
+if __name__ == "__main__" :
+	main()
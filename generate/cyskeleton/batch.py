@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Preprocess and generate skeletons for several targets (e.g. mods) at once.
+
+A manifest is a JSON file of the form
+	{ "targets" : [ { "input" : "skeleton_bts.json", "config" : "config_default.json",
+			"output" : "out/bts/CvPythonExtensions.py" }, ... ] }
+where "config" is optional and relative paths are relative to the manifest. Inputs can be in any format (see
+compact.py and delta.py). Targets with the same input and config are preprocessed only once; distinct (input, config)
+pairs are processed in parallel. Like generate.py, outputs start with a fingerprint of the inputs and the code, and
+targets whose outputs are up to date are skipped.
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import delta
+from cyskeleton import generate
+from cyskeleton import output
+from cyskeleton import preprocess
+
+
+class Target( NamedTuple ) :
+	input : str
+	config : Optional[str]
+	output : str
+
+
+def read_manifest( path : str ) -> List[Target] :
+	with open( path, "r" ) as fp :
+		data = json.load( fp )
+	baseDir = os.path.dirname( os.path.abspath( path ) )
+	def resolve( p : Optional[str] ) -> Optional[str] :
+		return None if p is None else os.path.join( baseDir, p )
+	targets = []
+	for targetData in data["targets"] :
+		targets.append( Target( resolve( targetData["input"] ), resolve( targetData.get( "config" ) ),
+				resolve( targetData["output"] ) ) )
+	return targets
+
+
+class Timings( NamedTuple ) :
+	""" Per-phase timings in seconds """
+	load : float
+	preprocess : float
+	generate : float
+
+def _run_group( inputPath : str, configPath : Optional[str], outputPaths : List[str], verbosity : int,
+		force : bool = False ) -> Tuple[str, Optional[Timings]] :
+	"""
+	Preprocesses one input with one config and generates all outputs for it.
+	Returns the printed output and the timings, or None for the timings if all outputs were up to date.
+	"""
+	fingerprint = output.fingerprint( delta.input_paths( inputPath ) + [configPath],
+			output.source_fingerprint( "batch", "compact", "delta", "generate", "json_stream", "model", "output",
+				"preprocess", "sig_util", "type_util" ) )
+	if not force and all( output.read_header_fingerprint( outputPath ) == fingerprint for outputPath in outputPaths ) :
+		return "", None
+
+	out = io.StringIO()
+	with contextlib.redirect_stdout( out ) :
+		start = time.perf_counter()
+		with open( inputPath, "r" ) as fp :
+			module = compact.load_model( fp )
+		if configPath is not None :
+			with open( configPath, "r" ) as fp :
+				conf = json.load( fp )
+		else :
+			conf = None
+		loaded = time.perf_counter()
+		preprocess.Preprocess( module, conf, verbosity = verbosity )
+		preprocessed = time.perf_counter()
+		source = generate.gen_module_to_string( module )
+		for outputPath in outputPaths :
+			with output.OutputFile( outputPath, header = output.FINGERPRINT_HEADER_PREFIX + fingerprint ) as fp :
+				fp.write( source )
+		generated = time.perf_counter()
+	return out.getvalue(), Timings( loaded - start, preprocessed - loaded, generated - preprocessed )
+
+def run_batch( targets : Sequence[Target], jobs : int = 1, verbosity : int = 0, force : bool = False ) -> None :
+	"""
+	Builds all targets that are not up to date (or all of them if force is True) and prints per-target timings.
+	"""
+	# Group targets with the same input and config, keeping the order of first appearance
+	groups : Dict[Tuple[str, Optional[str]], List[str]] = {}
+	for target in targets :
+		groups.setdefault( ( target.input, target.config ), [] ).append( target.output )
+	tasks = [( inputPath, configPath, outputPaths, verbosity, force )
+			for ( inputPath, configPath ), outputPaths in groups.items()]
+
+	start = time.perf_counter()
+	if jobs > 1 and len( tasks ) > 1 :
+		with multiprocessing.Pool( min( jobs, len( tasks ) ) ) as pool :
+			results = pool.starmap( _run_group, tasks, chunksize = 1 )
+	else :
+		results = [_run_group( *task ) for task in tasks]
+	total = time.perf_counter() - start
+
+	for output, _ in results :
+		print( output, end = "" )
+	print( f"{'load':>8} {'preproc':>8} {'generate':>8}  target" )
+	for ( _, _, outputPaths, _, _ ), ( _, timings ) in zip( tasks, results ) :
+		for idx, outputPath in enumerate( outputPaths ) :
+			if timings is None :
+				print( f"{'':8} {'':8} {'':8}  {outputPath} (up to date)" )
+			elif idx == 0 :
+				print( f"{timings.load:8.2f} {timings.preprocess:8.2f} {timings.generate:8.2f}  {outputPath}" )
+			else :
+				print( f"{'':8} {'':8} {'':8}  {outputPath} (shared)" )
+	preprocessed = sum( 1 for _, timings in results if timings is not None )
+	print( f"{len( targets )} targets, {preprocessed} preprocessed, total {total:.2f} s" )
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument( "manifest", help = "The manifest file listing the targets." )
+	parser.add_argument( "-j", "--jobs", type = int, default = os.cpu_count() or 1,
+			help = "Number of targets to build in parallel (default: number of CPUs)." )
+	parser.add_argument( "-v", "--verbosity", type = int, default = 0, choices = (0,1,2,3),
+			help = "How much information to print (0: nothing, 3: everything; default:0)." )
+	parser.add_argument( "--force", action = "store_true",
+			help = "Build all targets, even if their inputs and the code did not change since the last run." )
+	args = parser.parse_args()
+
+	run_batch( read_manifest( args.manifest ), jobs = args.jobs, verbosity = args.verbosity, force = args.force )
+
+if __name__ == "__main__" :
+	main()
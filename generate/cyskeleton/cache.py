@@ -0,0 +1,96 @@
+"""
+A content-addressed on-disk cache for preprocessed module members.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from cyskeleton.common import *
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # In bytes
+
+# Names of the subdirectories and entries the cache writes (see PreprocessCache._path)
+_RE_SUBDIR = re.compile( "[0-9a-f]{2}" )
+_RE_ENTRY = re.compile( "[0-9a-f]{64}\\.json" )
+
+
+class PreprocessCache :
+	"""
+	Stores one JSON file per entry, named by the hash of the input member and a context fingerprint
+	(configuration, known types, ...). When the total size exceeds maxSize, the least recently used entries are
+	removed.
+	"""
+	def __init__( self, directory : str, maxSize : int = DEFAULT_MAX_SIZE ) -> None :
+		self._directory = directory
+		self._maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+
+	@staticmethod
+	def key( context : str, member : JsonObj ) -> str :
+		h = hashlib.sha256( context.encode( "utf-8" ) )
+		h.update( json.dumps( member, separators = (",", ":") ).encode( "utf-8" ) )
+		return h.hexdigest()
+
+	def _path( self, key : str ) -> str :
+		return os.path.join( self._directory, key[:2], key + ".json" )
+
+	def get( self, key : str ) -> Optional[JsonObj] :
+		path = self._path( key )
+		try :
+			with open( path, "r" ) as fp :
+				entry = json.load( fp )
+			os.utime( path ) # Mark as recently used
+		except ( OSError, ValueError ) :
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry
+
+	def put( self, key : str, entry : JsonObj ) -> None :
+		path = self._path( key )
+		os.makedirs( os.path.dirname( path ), exist_ok = True )
+		# Write to a temporary file first, so readers never see partial entries
+		fd, tmpPath = tempfile.mkstemp( dir = os.path.dirname( path ), suffix = ".tmp" )
+		with os.fdopen( fd, "w" ) as fp :
+			fp.write( json.dumps( entry ) ) # Unlike json.dump, this uses the C encoder
+		os.replace( tmpPath, path )
+
+	def evict( self ) -> None :
+		"""
+		Removes least recently used entries until the cache is no larger than maxSize. Only entries written by the
+		cache count; other files in the directory are left alone.
+		"""
+		entries = []
+		try :
+			subdirs = [name for name in os.listdir( self._directory ) if _RE_SUBDIR.fullmatch( name )]
+		except OSError :
+			return
+		for subdir in subdirs :
+			dirPath = os.path.join( self._directory, subdir )
+			try :
+				fileNames = os.listdir( dirPath )
+			except OSError :
+				continue
+			for fileName in fileNames :
+				if not _RE_ENTRY.fullmatch( fileName ) or not fileName.startswith( subdir ) :
+					continue
+				path = os.path.join( dirPath, fileName )
+				try :
+					st = os.stat( path )
+				except OSError :
+					continue
+				entries.append( ( st.st_mtime, st.st_size, path ) )
+		totalSize = sum( size for _, size, _ in entries )
+		for _, size, path in sorted( entries ) :
+			if totalSize <= self._maxSize :
+				break
+			try :
+				os.remove( path )
+			except OSError :
+				pass
+			totalSize -= size
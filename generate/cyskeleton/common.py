@@ -1,4 +1,4 @@
 from typing import *
-from typing import TextIO # TODO: why is this needed?
+from typing import BinaryIO, TextIO # Not exported by from typing import * before python 3.10
 
 JsonObj = Dict[str, Any]
\ No newline at end of file
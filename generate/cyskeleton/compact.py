@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+A compact skeleton format with interned strings and a flat node table, and a loader for it.
+
+A compact skeleton is a JSON object
+	{ "format" : "cyskeleton-compact", "version" : 1, "strings" : [...], "shapes" : [...], "nodes" : [...],
+		"extras" : [...] }
+where
+* "strings" holds every distinct name, type and docstring once.
+* "shapes" holds the distinct key lists of the nodes, in their original order.
+* "nodes" is a flat list of integers, _STRIDE per node: the shape, the string indices of the name, type and doc
+	(-1 if absent), the index of the first member and the number of members (-1, 0 without members) and the index
+	into "extras" (-1 if none). Node 0 is the module. The members of a node are stored consecutively.
+* "extras" holds, for each node with other keys than name, type, doc and members (e.g. "value"), the values of
+	these keys in the order of its shape.
+Converting a skeleton to the compact format and back yields the same skeleton, including key order.
+
+Loading reads the whole file, like json.load, but converts the nodes (to the usual dicts, or to the node model with
+load_model) only when they are accessed. Preprocessing and generation convert one module member at a time, so the
+whole skeleton is never held in both representations, and the names and types of the members are read from the tables
+without converting the members at all.
+"""
+
+import json
+
+from cyskeleton.common import *
+from cyskeleton import model
+
+
+FORMAT_NAME = "cyskeleton-compact"
+FORMAT_VERSION = 1
+
+# Fields of a node
+_SHAPE, _NAME, _TYPE, _DOC, _FIRST, _COUNT, _EXTRA = range( 7 )
+_STRIDE = 7
+
+_STRING_FIELDS = { "name" : _NAME, "type" : _TYPE, "doc" : _DOC }
+
+
+def is_compact( data : JsonObj ) -> bool :
+	return data.get( "format" ) == FORMAT_NAME
+
+
+def to_compact( skeleton : JsonObj ) -> JsonObj :
+	""" Converts a skeleton to the compact format. """
+	strings : List[str] = []
+	stringIndices : Dict[str, int] = {}
+	shapes : List[List[str]] = []
+	shapeIndices : Dict[Tuple[str, ...], int] = {}
+	nodes : List[int] = []
+	extras : List[List[Any]] = []
+
+	def intern( s : str ) -> int :
+		idx = stringIndices.get( s )
+		if idx is None :
+			idx = stringIndices[s] = len( strings )
+			strings.append( s )
+		return idx
+
+	# Breadth-first, so the members of each node are consecutive
+	queue = [skeleton]
+	nodes.extend( [0] * _STRIDE )
+	for idx, node in enumerate( queue ) : # queue grows while iterating
+		base = idx * _STRIDE
+		shape = tuple( node )
+		shapeIdx = shapeIndices.get( shape )
+		if shapeIdx is None :
+			shapeIdx = shapeIndices[shape] = len( shapes )
+			shapes.append( list( shape ) )
+		record = [shapeIdx, -1, -1, -1, -1, 0, -1]
+		extraValues = []
+		for key, value in node.items() :
+			field = _STRING_FIELDS.get( key )
+			if field is not None :
+				if not isinstance( value, str ) :
+					raise ValueError( f"Value of '{key}' is not a string: {value!r}" )
+				record[field] = intern( value )
+			elif key == "members" :
+				if not isinstance( value, list ) :
+					raise ValueError( f"Value of 'members' is not a list: {value!r}" )
+				record[_FIRST] = len( queue )
+				record[_COUNT] = len( value )
+				queue.extend( value )
+				nodes.extend( [0] * ( _STRIDE * len( value ) ) )
+			else :
+				extraValues.append( value )
+		if extraValues :
+			record[_EXTRA] = len( extras )
+			extras.append( extraValues )
+		nodes[base:base+_STRIDE] = record
+
+	return { "format" : FORMAT_NAME, "version" : FORMAT_VERSION, "strings" : strings, "shapes" : shapes,
+			"nodes" : nodes, "extras" : extras }
+
+
+class CompactSkeleton :
+	"""
+	Read access to a skeleton in the compact format. Nodes are converted to the usual dicts only when accessed.
+	"""
+	def __init__( self, data : JsonObj ) -> None :
+		if not is_compact( data ) :
+			raise ValueError( "Not a compact skeleton" )
+		if data["version"] != FORMAT_VERSION :
+			raise ValueError( f"Unsupported compact skeleton version {data['version']}" )
+		self._strings : List[str] = data["strings"]
+		self._nodes : List[int] = data["nodes"]
+		self._extras : List[List[Any]] = data["extras"]
+		# For each shape, the keys with the field they are stored in (None for extras)
+		self._shapes : List[List[Tuple[str, Optional[int]]]] = []
+		for shape in data["shapes"] :
+			fields = []
+			for key in shape :
+				if key in _STRING_FIELDS :
+					fields.append( ( key, _STRING_FIELDS[key] ) )
+				elif key == "members" :
+					fields.append( ( key, _FIRST ) )
+				else :
+					fields.append( ( key, None ) )
+			self._shapes.append( fields )
+
+	def __len__( self ) -> int :
+		""" The number of nodes """
+		return len( self._nodes ) // _STRIDE
+
+	def _string( self, idx : int, field : int ) -> Optional[str] :
+		strIdx = self._nodes[idx * _STRIDE + field]
+		return self._strings[strIdx] if strIdx >= 0 else None
+
+	def name( self, idx : int ) -> Optional[str] :
+		return self._string( idx, _NAME )
+
+	def type( self, idx : int ) -> Optional[str] :
+		return self._string( idx, _TYPE )
+
+	def doc( self, idx : int ) -> Optional[str] :
+		return self._string( idx, _DOC )
+
+	def member_indices( self, idx : int ) -> range :
+		first = self._nodes[idx * _STRIDE + _FIRST]
+		return range( first, first + self._nodes[idx * _STRIDE + _COUNT] )
+
+	def node( self, idx : int, lazyMembers : bool = False ) -> JsonObj :
+		"""
+		Returns the node with the given index as a dict. Its members are a LazyMembers sequence if lazyMembers is
+		True, and fully converted otherwise.
+		"""
+		base = idx * _STRIDE
+		nodes = self._nodes
+		strings = self._strings
+		extraValues = iter( self._extras[nodes[base+_EXTRA]] ) if nodes[base+_EXTRA] >= 0 else None
+		result = {}
+		for key, field in self._shapes[nodes[base+_SHAPE]] :
+			if field is None :
+				result[key] = next( extraValues )
+			elif field == _FIRST :
+				members = LazyMembers( self, self.member_indices( idx ) )
+				result[key] = members if lazyMembers else list( members )
+			else :
+				result[key] = strings[nodes[base+field]]
+		return result
+
+	def root( self ) -> JsonObj :
+		""" Returns the module, with its members converted only when accessed. """
+		return self.node( 0, lazyMembers = True )
+
+	def model_node( self, idx : int ) -> model.Node :
+		""" Converts the node with the given index, including its members, to the node model. """
+		fields = self.node( idx, lazyMembers = True )
+		members = fields.get( "members" )
+		if members is None :
+			return model.from_json( fields )
+		fields["members"] = [] # Keeps the key order; the members are converted below
+		node = model.from_json( fields )
+		if node.extra is not None and "members" in node.extra : # A node type without members in the model
+			node.extra["members"] = list( members )
+		else :
+			node.members = [self.model_node( memberIdx ) for memberIdx in self.member_indices( idx )]
+		return node
+
+	def model_root( self ) -> model.Module :
+		""" Returns the module in the node model, with its members converted only when accessed (see LazyNodes). """
+		fields = self.node( 0, lazyMembers = True )
+		hasMembers = "members" in fields
+		if hasMembers :
+			fields["members"] = []
+		module = model.from_json( fields )
+		if hasMembers :
+			module.members = LazyNodes( self, self.member_indices( 0 ) )
+		return module
+
+	def to_json( self ) -> JsonObj :
+		""" Converts the whole skeleton back to the usual format. """
+		return self.node( 0 )
+
+
+class LazyMembers( Sequence[JsonObj] ) :
+	"""
+	The members of a node in a CompactSkeleton. Each access converts the member (including all its members) anew.
+	"""
+	def __init__( self, skeleton : CompactSkeleton, indices : range ) -> None :
+		self._skeleton = skeleton
+		self._indices = indices
+
+	def __len__( self ) -> int :
+		return len( self._indices )
+
+	def _convert( self, idx : int ) -> Any :
+		return self._skeleton.node( idx )
+
+	def __getitem__( self, i ) :
+		if isinstance( i, slice ) :
+			return type( self )( self._skeleton, self._indices[i] )
+		return self._convert( self._indices[i] )
+
+	def __iter__( self ) -> Iterator[Any] :
+		convert = self._convert
+		for idx in self._indices :
+			yield convert( idx )
+
+	def types_and_names( self ) -> List[JsonObj] :
+		""" Returns the "type" and "name" of each member, without converting the members. """
+		skeleton = self._skeleton
+		return [{ "type" : skeleton.type( idx ), "name" : skeleton.name( idx ) } for idx in self._indices]
+
+
+class LazyNodes( LazyMembers ) :
+	"""
+	The members of a node in a CompactSkeleton, in the node model. Each access converts the member anew, so iterating
+	converts one member at a time, and members that are no longer referenced can be freed.
+	"""
+	def _convert( self, idx : int ) -> model.Node :
+		return self._skeleton.model_node( idx )
+
+
+def load( fp : TextIO ) -> JsonObj :
+	"""
+	Loads a skeleton in any format. The whole file is read; for compact skeletons, the members of the module are
+	LazyMembers, which are converted to dicts when accessed.
+	Delta skeletons (see delta.py) are applied to their base, which is loaded from the path relative to fp.name.
+	"""
+	data = json.load( fp )
+	if is_compact( data ) :
+		return CompactSkeleton( data ).root()
+	return _apply_if_delta( data, fp.name )
+
+def load_model( fp : TextIO ) -> model.Module :
+	"""
+	Loads a skeleton in any format (see load) in the node model. For compact skeletons, the members of the module are
+	LazyNodes, which are converted when accessed.
+	"""
+	data = json.load( fp )
+	if is_compact( data ) :
+		return CompactSkeleton( data ).model_root()
+	return model.from_json( _apply_if_delta( data, fp.name ) )
+
+def _apply_if_delta( data : JsonObj, path : str ) -> JsonObj :
+	from cyskeleton import delta # delta imports this module
+	if delta.is_delta( data ) :
+		return delta.apply_delta( delta.load_base( data, path ), data )
+	return data
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser( description = "Converts skeletons to and from the compact format." )
+	parser.add_argument( "direction", choices = ("to-compact", "from-compact") )
+	parser.add_argument( "input_json", help = "The input skeleton." )
+	parser.add_argument( "output_json", help = "The output file." )
+	args = parser.parse_args()
+
+	with open( args.input_json, "r" ) as fp :
+		data = json.load( fp )
+	if args.direction == "to-compact" :
+		result = to_compact( data )
+		separators = (",", ":")
+	else :
+		result = CompactSkeleton( data ).to_json()
+		separators = (", ", ":") # Like the extraction mod
+	with open( args.output_json, "w" ) as fp :
+		fp.write( json.dumps( result, separators = separators ) )
+		fp.write( "\n" )
+
+if __name__ == "__main__" :
+	main()
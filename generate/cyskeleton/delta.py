@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Delta skeletons: a skeleton stored as the changes to a base skeleton (e.g. a mod's skeleton relative to BtS).
+
+A delta skeleton is a JSON object
+	{ "format" : "cyskeleton-delta", "version" : 1, "base" : { "path" : ..., "hash" : ... }, "module" : {...},
+		"members" : [...] }
+where
+* "base" gives the path of the base skeleton, relative to the delta file, and the hash of the file (see
+	output.hash_file), so a delta is never applied to another base than it was made for. The base may be in any
+	format, including another delta.
+* "module" holds the keys of the module except "members".
+* "members" lists the members of the module in order: the name of a member of the base that is unchanged, or the
+	whole member if it is new or changed. Members of the base that are not listed were removed.
+compact.load applies deltas to their bases transparently, so preprocessing and generation accept delta skeletons like
+any other. The result is identical to the skeleton the delta was made from.
+
+Preprocessing a delta skeleton can reuse the unchanged members from the preprocessed base, and then writes the result
+as a delta to the preprocessed base (see preprocess.py).
+"""
+
+import json
+import os
+
+from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import json_stream
+from cyskeleton import output
+
+
+FORMAT_NAME = "cyskeleton-delta"
+FORMAT_VERSION = 1
+
+
+def is_delta( data : JsonObj ) -> bool :
+	return data.get( "format" ) == FORMAT_NAME
+
+
+def new_delta( basePath : str, baseHash : str, module : JsonObj, members : List[Union[str, JsonObj]] ) -> JsonObj :
+	"""
+	Returns a delta skeleton with the given module keys and members (see above). basePath must be relative to the
+	directory the delta will be stored in.
+	"""
+	return {
+		"format" : FORMAT_NAME,
+		"version" : FORMAT_VERSION,
+		"base" : { "path" : basePath.replace( os.sep, "/" ), "hash" : baseHash },
+		"module" : { key : value for key, value in module.items() if key != "members" },
+		"members" : members,
+	}
+
+
+def make_delta( base : JsonObj, skeleton : JsonObj, basePath : str, baseHash : str ) -> JsonObj :
+	""" Returns the delta from base (stored at basePath, with the given file hash) to skeleton. """
+	from cyskeleton import diff # Only needed here
+	baseTree = diff.hash_tree( base )
+	tree = diff.hash_tree( skeleton )
+	members : List[Union[str, JsonObj]] = []
+	for key, memberData in zip( tree.members, skeleton.get( "members" ) or () ) :
+		baseMember = baseTree.members.get( key )
+		# Members with the same name (key "name#2" etc.) are stored whole, as they can't be referred to by name
+		if baseMember is not None and baseMember.hash == tree.members[key].hash and key == memberData["name"] :
+			members.append( key )
+		else :
+			members.append( memberData )
+	return new_delta( basePath, baseHash, skeleton, members )
+
+
+def base_path( delta : JsonObj, deltaPath : str ) -> str :
+	return os.path.join( os.path.dirname( deltaPath ), delta["base"]["path"] )
+
+def load_base( delta : JsonObj, deltaPath : str ) -> JsonObj :
+	""" Loads the base of the delta stored at deltaPath, after checking that it is the right one. """
+	if delta["version"] != FORMAT_VERSION :
+		raise ValueError( f"Unsupported delta skeleton version {delta['version']}" )
+	path = base_path( delta, deltaPath )
+	if output.hash_file( path ) != delta["base"]["hash"] :
+		raise ValueError( f"The base skeleton {path} is missing or not the one that {deltaPath} was made for" )
+	with open( path, "r" ) as fp :
+		return compact.load( fp )
+
+def apply_delta( base : JsonObj, delta : JsonObj ) -> JsonObj :
+	""" Returns the skeleton the delta was made from. Unchanged members are shared with base. """
+	baseMembers : Dict[str, JsonObj] = {}
+	for member in base.get( "members" ) or () :
+		baseMembers.setdefault( member["name"], member )
+	result = dict( delta["module"] )
+	result["members"] = [baseMembers[member] if isinstance( member, str ) else member for member in delta["members"]]
+	return result
+
+
+def inherited_names( delta : JsonObj ) -> Set[str] :
+	"""
+	Returns the names of the members that the delta takes unchanged from its base, except names that occur more than
+	once in the delta.
+	"""
+	counts : Dict[str, int] = {}
+	for member in delta["members"] :
+		name = member if isinstance( member, str ) else member["name"]
+		counts[name] = counts.get( name, 0 ) + 1
+	return { member for member in delta["members"] if isinstance( member, str ) and counts[member] == 1 }
+
+
+def _read_base( path : str ) -> Optional[JsonObj] :
+	""" Returns the "base" of the delta skeleton at path, or None if it is no delta. Only reads the start of the file. """
+	with open( path, "r" ) as fp :
+		for key, value in json_stream.JsonStreamReader( fp, "members" ).items() :
+			if key == "base" :
+				return value
+			if key == "members" or ( key == "format" and value != FORMAT_NAME ) :
+				return None
+	return None
+
+def input_paths( path : str ) -> List[str] :
+	"""
+	Returns the paths of all files the skeleton at path consists of: the file itself and, for a delta, its base
+	(recursively).
+	"""
+	paths = [path]
+	base = _read_base( path )
+	while base is not None :
+		path = os.path.join( os.path.dirname( path ), base["path"] )
+		paths.append( path )
+		base = _read_base( path )
+	return paths
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser( description = "Creates and applies delta skeletons." )
+	subparsers = parser.add_subparsers( dest = "command", required = True )
+	makeParser = subparsers.add_parser( "make", help = "Stores a skeleton as a delta to a base skeleton." )
+	makeParser.add_argument( "base_json", help = "The base skeleton, e.g. skeleton_bts.json." )
+	makeParser.add_argument( "input_json", help = "The skeleton to store as a delta." )
+	makeParser.add_argument( "output_json", help = "The delta skeleton to write." )
+	applyParser = subparsers.add_parser( "apply", help = "Converts a delta skeleton back to a full skeleton." )
+	applyParser.add_argument( "input_json", help = "The delta skeleton." )
+	applyParser.add_argument( "output_json", help = "The full skeleton to write." )
+	args = parser.parse_args()
+
+	if args.command == "make" :
+		with open( args.base_json, "r" ) as fp :
+			base = compact.load( fp )
+		with open( args.input_json, "r" ) as fp :
+			skeleton = compact.load( fp )
+		basePath = os.path.relpath( args.base_json, os.path.dirname( os.path.abspath( args.output_json ) ) )
+		result = make_delta( base, skeleton, basePath, output.hash_file( args.base_json ) )
+		separators = (",", ":")
+		stored = sum( 1 for member in result["members"] if not isinstance( member, str ) )
+		print( f"{stored} of {len( result['members'] )} members stored in the delta" )
+	else :
+		with open( args.input_json, "r" ) as fp :
+			result = compact.load( fp )
+		separators = (", ", ":") # Like the extraction mod
+	with open( args.output_json, "w" ) as fp :
+		fp.write( json.dumps( result, separators = separators ) )
+		fp.write( "\n" )
+
+if __name__ == "__main__" :
+	main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Structural diff of two skeletons (e.g. of BtS and a mod, or of two extractions of a mod).
+
+Each node gets a hash of its own keys and the hashes of its members (a Merkle tree), so identical classes are skipped
+by comparing a single hash, and the whole diff takes time linear in the size of the skeletons. Members are matched by
+name. The result is a list of changes, each with the path of the node (e.g. "CvPythonExtensions.CyPlayer.getUnit"):
+* "added" / "removed": A node that exists only in the new / old skeleton (its members are not listed separately).
+* "changed": A node whose own keys (e.g. "doc", "signature", "value") differ; "fields" maps each such key to its
+  "old" and "new" value (None if absent).
+* "reordered": A node whose members are the same, but in a different order.
+"""
+
+import hashlib
+import json
+import sys
+
+from cyskeleton.common import *
+from cyskeleton import compact
+
+
+# Reused for all nodes; json.dumps would create an encoder per call
+_encode = json.JSONEncoder( sort_keys = True, check_circular = False ).encode
+
+
+class HashedNode :
+	""" A node of a skeleton with the hash of its subtree """
+	__slots__ = ( "type", "fields", "members", "hash" )
+
+	def __init__( self, type : Optional[str], fields : JsonObj, members : Dict[str, "HashedNode"], hash : bytes ) :
+		self.type = type
+		self.fields = fields # All keys but "members"
+		self.members = members # By name, in the original order
+		self.hash = hash
+
+	def count( self ) -> int :
+		""" The number of nodes in the subtree """
+		return 1 + sum( member.count() for member in self.members.values() )
+
+
+def hash_tree( data : JsonObj ) -> HashedNode :
+	""" Returns the hashed tree of a skeleton node (e.g. the module). """
+	fields = { key : value for key, value in data.items() if key != "members" }
+	h = hashlib.blake2b( _encode( fields ).encode( "utf-8" ), digest_size = 16 )
+	members : Dict[str, HashedNode] = {}
+	for memberData in data.get( "members" ) or () :
+		member = hash_tree( memberData )
+		name = memberData["name"]
+		key = name
+		suffix = 1
+		while key in members : # Members with the same name are matched in order
+			suffix += 1
+			key = f"{name}#{suffix}"
+		members[key] = member
+		h.update( key.encode( "utf-8" ) )
+		h.update( member.hash )
+	return HashedNode( data.get( "type" ), fields, members, h.digest() )
+
+
+def diff_trees( old : HashedNode, new : HashedNode, path : str ) -> List[JsonObj] :
+	""" Returns the changes from old to new, which are both at path. """
+	changes : List[JsonObj] = []
+	_diff( old, new, path, changes )
+	return changes
+
+def _diff( old : HashedNode, new : HashedNode, path : str, changes : List[JsonObj] ) -> None :
+	if old.hash == new.hash :
+		return
+	if old.fields != new.fields :
+		fields = {}
+		for key in list( old.fields ) + [key for key in new.fields if key not in old.fields] :
+			oldValue = old.fields.get( key )
+			newValue = new.fields.get( key )
+			if oldValue != newValue :
+				fields[key] = { "old" : oldValue, "new" : newValue }
+		changes.append( { "path" : path, "change" : "changed", "type" : new.type, "fields" : fields } )
+	oldMembers = old.members
+	newMembers = new.members
+	for key, oldMember in oldMembers.items() :
+		if key not in newMembers :
+			changes.append( { "path" : f"{path}.{key}", "change" : "removed", "type" : oldMember.type,
+					"members" : oldMember.count() - 1 } )
+	for key, newMember in newMembers.items() :
+		oldMember = oldMembers.get( key )
+		if oldMember is None :
+			changes.append( { "path" : f"{path}.{key}", "change" : "added", "type" : newMember.type,
+					"members" : newMember.count() - 1 } )
+		else :
+			_diff( oldMember, newMember, f"{path}.{key}", changes )
+	if oldMembers.keys() == newMembers.keys() and list( oldMembers ) != list( newMembers ) :
+		changes.append( { "path" : path, "change" : "reordered", "type" : new.type } )
+
+
+_CHANGE_MARKS = { "added" : "+", "removed" : "-", "changed" : "~", "reordered" : "~" }
+
+def format_text( changes : List[JsonObj] ) -> str :
+	lines = []
+	for change in changes :
+		line = f"{_CHANGE_MARKS[change['change']]} {change['path']} ({change['type']}"
+		if change.get( "members" ) :
+			line += f", {change['members']} members"
+		line += ")"
+		if change["change"] == "reordered" :
+			line += " members reordered"
+		lines.append( line )
+		for key, values in change.get( "fields", {} ).items() :
+			lines.append( f"\t{key}: {json.dumps( values['old'] )} -> {json.dumps( values['new'] )}" )
+	return "".join( line + "\n" for line in lines )
+
+
+def summarize( changes : List[JsonObj] ) -> Dict[str, int] :
+	summary = { change : 0 for change in _CHANGE_MARKS }
+	for change in changes :
+		summary[change["change"]] += 1
+	return summary
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser( description = "Lists the members that were added, removed or changed between "
+			"two skeletons. Exits with status 1 if there are differences." )
+	parser.add_argument( "old_json", help = "The old skeleton (in the usual or the compact format)." )
+	parser.add_argument( "new_json", help = "The new skeleton." )
+	parser.add_argument( "--format", choices = ("text", "json"), default = "text",
+			help = "The format of the report (default: %(default)s)." )
+	parser.add_argument( "-o", "--output", help = "Write the report to this file instead of stdout." )
+	args = parser.parse_args()
+
+	trees = []
+	for path in ( args.old_json, args.new_json ) :
+		with open( path, "r" ) as fp :
+			trees.append( hash_tree( compact.load( fp ) ) )
+	old, new = trees
+	changes = diff_trees( old, new, new.fields.get( "name", "" ) )
+
+	if args.format == "json" :
+		report = json.dumps( { "old" : args.old_json, "new" : args.new_json, "summary" : summarize( changes ),
+				"changes" : changes }, indent = "\t" ) + "\n"
+	else :
+		report = format_text( changes )
+		summary = summarize( changes )
+		report += ", ".join( f"{count} {change}" for change, count in summary.items() ) + "\n"
+	if args.output is not None :
+		with open( args.output, "w" ) as fp :
+			fp.write( report )
+	else :
+		sys.stdout.write( report )
+	sys.exit( 1 if changes else 0 )
+
+if __name__ == "__main__" :
+	main()
@@ -3,7 +3,16 @@
 Generate python modules from (preprocessed) skeleton.
 """
 
+import os
+import re
+import sys
+
 from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import delta
+from cyskeleton import model
+from cyskeleton import output
+from cyskeleton import profiling
 
 
 _IGNORED_NAMES = ("__init__",)
@@ -39,36 +48,60 @@ _TPL_PROPERTY = '''\
 {indent}\tpass
 '''
 
-def _gen( skeleton : JsonObj, out : TextIO, path : str, indent : str = "" ) -> None :
-	assert skeleton["type"] != "module"
-	assert "name" in skeleton
+_TPL_SHARD_HEADER = '"""\n{name}\n"""\n'
+_TPL_IMPORT = "from {module} import {names}\n"
+
+# Bound format methods, so templates don't need to be looked up for every member
+_FMT_MODULE_HEADER = _TPL_MODULE_HEADER.format
+_FMT_TYPE_HEADER = _TPL_TYPE_HEADER.format
+_FMT_CLASS_HEADER = _TPL_CLASS_HEADER.format
+_FMT_FUNCTION_HEADER = _TPL_FUNCTION_HEADER.format
+_FMT_FUNCTION_SIG = _TPL_FUNCTION_SIG.format
+_FMT_DOC = _TPL_DOC.format
+_FMT_PASS = _TPL_PASS.format
+_FMT_MEMBER = _TPL_MEMBER.format
+_FMT_PROPERTY = _TPL_PROPERTY.format
+_FMT_SHARD_HEADER = _TPL_SHARD_HEADER.format
+_FMT_IMPORT = _TPL_IMPORT.format
+
 
-	name = skeleton["name"]
-	tp = skeleton["type"]
+def _gen( skeleton : model.Node, write : Callable[[str], Any], parents : Tuple[str, ...], indent : str = "" ) -> None :
+	"""
+	Writes the given member as fragments, using write (usually list.append).
+	parents are the names of the enclosing module and classes; they are only joined into a path for warnings.
+	"""
+	assert skeleton.type != "module"
+
+	name = skeleton.name
+	tp = skeleton.type
 	
 	if tp in ("type", "class") :
 		if tp == "type" :
-			out.write( _TPL_TYPE_HEADER.format( indent = indent, name = name ) )
+			write( _FMT_TYPE_HEADER( indent = indent, name = name ) )
 		elif tp == "class" :
-			out.write( _TPL_CLASS_HEADER.format( indent = indent, name = name ) )
+			write( _FMT_CLASS_HEADER( indent = indent, name = name ) )
 		needPass = True # Whether we need to write 'pass' at the end to avoid an indention error
-		if "doc" in skeleton :
-			out.write( _TPL_DOC.format( indent = indent, doc = skeleton["doc"] ) )
+		if skeleton.doc is not None :
+			write( _FMT_DOC( indent = indent, doc = skeleton.doc ) )
 			needPass = False
-		for member in skeleton.get( "members", () ) :
+		members = skeleton.members
+		if members :
 			needPass = False
-			_gen( member, out, path = f"{path}.{skeleton['name']}", indent = indent + "\t" )
+			memberParents = parents + ( name, )
+			memberIndent = indent + "\t"
+			for member in members :
+				_gen( member, write, memberParents, memberIndent )
 		if needPass :
-			out.write( _TPL_PASS.format( indent = indent ) )
+			write( _FMT_PASS( indent = indent ) )
 	elif tp in ( "function", "instancemethod" ) :
-		if "signature" not in skeleton :
+		sig = skeleton.signature
+		if sig is None :
 			argNames = ["*args", "**kwargs"]
 			sigStr = None
 		else :
-			sig = skeleton["signature"]
-			argNames = [arg["name"] for arg in sig.get( "args" )]
-			argTypes = [arg.get( "type", "Any" ) for arg in sig.get( "args" )] # TODO: alt-types?
-			retType = sig.get( "return-type", "Any" )
+			argNames = [arg.name for arg in sig.args]
+			argTypes = [arg.type if arg.type is not None else "Any" for arg in sig.args] # TODO: alt-types?
+			retType = sig.returnType if sig.returnType is not None else "Any"
 			sigStr = f"({', '.join( argTypes )}) -> {retType}"
 
 		if tp == "instancemethod" :
@@ -76,49 +109,245 @@ def _gen( skeleton : JsonObj, out : TextIO, path : str, indent : str = "" ) -> N
 
 		argStr = ", ".join( argNames )
 
-		out.write( _TPL_FUNCTION_HEADER.format( indent = indent, name = name, args = argStr ) )
+		write( _FMT_FUNCTION_HEADER( indent = indent, name = name, args = argStr ) )
 
 		if sigStr :
-			out.write( _TPL_FUNCTION_SIG.format( indent = indent, sig = sigStr ) )
+			write( _FMT_FUNCTION_SIG( indent = indent, sig = sigStr ) )
 
-		if "doc" in skeleton and skeleton["doc"] :
-			out.write( _TPL_DOC.format( indent = indent, doc = skeleton["doc"] ) )
+		if skeleton.doc :
+			write( _FMT_DOC( indent = indent, doc = skeleton.doc ) )
 		else :
-			out.write( _TPL_PASS.format( indent = indent ) )
+			write( _FMT_PASS( indent = indent ) )
 
-	elif "value" in skeleton :
-		out.write( _TPL_MEMBER.format( indent = indent, name = name, value = skeleton["value"], type = tp ) )
+	elif skeleton.extra is not None and "value" in skeleton.extra :
+		write( _FMT_MEMBER( indent = indent, name = name, value = skeleton.extra["value"], type = tp ) )
 	elif tp == "property" :
-		out.write( _TPL_PROPERTY.format( indent = indent, name = name ) )
+		write( _FMT_PROPERTY( indent = indent, name = name ) )
 		# TODO: Only add setter if fset method of property is present (has to be done in extract)
 	elif name not in _IGNORED_NAMES and tp not in _IGNORED_TYPES :
-		print( f"WARNING: Ignored {path}.{name} of type {tp}" )
+		print( f"WARNING: Ignored {'.'.join( parents )}.{name} of type {tp}" )
+
+
+_FLUSH_FRAGMENTS = 1 << 14 # Number of buffered fragments after which they are written to the output file
 
+def _gen_module( skeleton : model.Module, fragments : List[str], out : Optional[TextIO] ) -> None :
+	"""
+	Appends the generated module to fragments. If out is given, the fragments are joined and written to it in large
+	chunks after each top-level member.
+	"""
+	assert skeleton.type == "module"
+	write = fragments.append
+	write( _FMT_MODULE_HEADER( name = skeleton.name, doc = skeleton.doc if skeleton.doc is not None else "" ) )
+	parents = ( skeleton.name, )
+	for member in skeleton.members or () :
+		write( "\n" )
+		_gen( member, write, parents )
+		if out is not None and len( fragments ) >= _FLUSH_FRAGMENTS :
+			out.write( "".join( fragments ) )
+			fragments.clear()
+	if out is not None :
+		out.write( "".join( fragments ) )
+		fragments.clear()
 
+def gen_module_header( skeleton : model.Module ) -> str :
+	""" Returns the start of the generated module, before its members. """
+	return _FMT_MODULE_HEADER( name = skeleton.name, doc = skeleton.doc if skeleton.doc is not None else "" )
 
-def gen_module( skeleton : JsonObj, out : TextIO ) -> None :
-	assert skeleton["type"] == "module"
-	out.write( _TPL_MODULE_HEADER.format( name = skeleton["name"], doc = skeleton.get( "doc", "" ) ) )
-	for member in skeleton.get( "members", () ) :
-		out.write( "\n" )
-		_gen( member, out, path = skeleton["name"] )
+def gen_member_to_string( member : model.Node, moduleName : str ) -> str :
+	"""
+	Returns the code generated for a member of the module with the given name. The module consists of the header and
+	the code of each member, preceded by a newline.
+	"""
+	fragments : List[str] = []
+	_gen( member, fragments.append, ( moduleName, ) )
+	return "".join( fragments )
+
+def gen_module( skeleton : model.Module, out : TextIO ) -> None :
+	_gen_module( skeleton, [], out )
+
+def gen_module_to_string( skeleton : model.Module ) -> str :
+	"""
+	Returns the generated module as a string.
+	"""
+	fragments : List[str] = []
+	_gen_module( skeleton, fragments, None )
+	return "".join( fragments )
+
+
+_ENUM_SHARD = "_enums" # All enums go into one shard; they are small and rarely change
+_RE_IDENTIFIER = re.compile( r"\w+" )
+
+def _referenced_names( skeleton : model.Node, names : Container[str], refs : Set[str] ) -> None :
+	""" Adds the names in names that are used in type comments of the given member to refs. """
+	types = []
+	if isinstance( skeleton, model.FunctionNode ) :
+		if skeleton.signature is not None :
+			types = [arg.type for arg in skeleton.signature.args]
+			types.append( skeleton.signature.returnType )
+	elif skeleton.extra is not None and "value" in skeleton.extra :
+		types = [skeleton.type]
+	for tp in types :
+		if tp is not None :
+			refs.update( name for name in _RE_IDENTIFIER.findall( tp ) if name in names )
+	for member in getattr( skeleton, "members", None ) or () :
+		_referenced_names( member, names, refs )
+
+def gen_package_to_strings( skeleton : model.Module ) -> Dict[str, str] :
+	"""
+	Returns the modules of a package that splits the generated module into shards, by file name: one module per class,
+	one for all enums and an __init__.py with the functions and values, which re-exports the classes and enums.
+	Shards import the names they refer to at their end, so they can refer to each other without import cycles.
+	"""
+	assert skeleton.type == "module"
+	package = skeleton.name
+	parents = ( package, )
+	members = skeleton.members or ()
+	shardOf : Dict[str, str] = {}
+	for member in members :
+		if member.type == "class" :
+			shardOf[member.name] = member.name
+		elif member.type == "type" :
+			shardOf[member.name] = _ENUM_SHARD
+	shardMembers : Dict[str, List[model.Node]] = {}
+	initMembers : List[model.Node] = []
+	for member in members :
+		if member.type in ( "class", "type" ) :
+			shardMembers.setdefault( shardOf[member.name], [] ).append( member )
+		else :
+			initMembers.append( member )
+
+	result : Dict[str, str] = {}
+	for shard, shardNodes in shardMembers.items() :
+		fragments = [_FMT_SHARD_HEADER( name = f"{package}.{shard}" )]
+		write = fragments.append
+		refs : Set[str] = set()
+		for member in shardNodes :
+			write( "\n" )
+			_gen( member, write, parents )
+			_referenced_names( member, shardOf, refs )
+		imports : Dict[str, List[str]] = {}
+		for name in sorted( refs ) :
+			if shardOf[name] != shard :
+				imports.setdefault( shardOf[name], [] ).append( name )
+		if imports :
+			write( "\n" )
+			for refShard in sorted( imports ) :
+				write( _FMT_IMPORT( module = f"{package}.{refShard}", names = ", ".join( imports[refShard] ) ) )
+		result[shard + ".py"] = "".join( fragments )
+
+	fragments = [_FMT_MODULE_HEADER( name = package, doc = skeleton.doc if skeleton.doc is not None else "" ), "\n"]
+	write = fragments.append
+	for shard, shardNodes in shardMembers.items() :
+		write( _FMT_IMPORT( module = f"{package}.{shard}", names = ", ".join( member.name for member in shardNodes ) ) )
+	for member in initMembers :
+		write( "\n" )
+		_gen( member, write, parents )
+	result["__init__.py"] = "".join( fragments )
+	return result
+
+def _read_if_exists( path : str ) -> Optional[str] :
+	try :
+		with open( path, "r" ) as fp :
+			return fp.read()
+	except FileNotFoundError :
+		return None
+
+_PACKAGE_MANIFEST = ".cyskeleton-shards" # The file names of the shards written last, one per line
+
+def write_package( skeleton : model.Module, outDir : str ) -> Tuple[int, int, int] :
+	"""
+	Writes the module as a package (see gen_package_to_strings) into outDir. Shards whose content is unchanged are
+	not rewritten, and shards of classes that no longer exist are removed. Only files listed in the manifest of the
+	previous run are removed, so other files in outDir are left alone.
+	Returns the number of written, unchanged and removed shards.
+	"""
+	shards = gen_package_to_strings( skeleton )
+	os.makedirs( outDir, exist_ok = True )
+	written = unchanged = removed = 0
+	for fileName, source in shards.items() :
+		path = os.path.join( outDir, fileName )
+		if _read_if_exists( path ) == source :
+			unchanged += 1
+			continue
+		with open( path, "w" ) as fp :
+			fp.write( source )
+		written += 1
+	manifestPath = os.path.join( outDir, _PACKAGE_MANIFEST )
+	oldManifest = _read_if_exists( manifestPath )
+	for fileName in ( oldManifest or "" ).splitlines() :
+		path = os.path.join( outDir, fileName )
+		if fileName not in shards and os.path.basename( fileName ) == fileName and os.path.exists( path ) :
+			os.remove( path )
+			removed += 1
+	manifest = "".join( fileName + "\n" for fileName in sorted( shards ) )
+	if manifest != oldManifest :
+		with open( manifestPath, "w" ) as fp :
+			fp.write( manifest )
+	return written, unchanged, removed
 
 
 def _main() -> None :
 	import argparse
-	import json
-	import os
 
 	parser = argparse.ArgumentParser()
 	parser.add_argument( "input_json", help = "The preprocessed skeleton." )
-	parser.add_argument( "output_py", help = "The path to the output file, usually named 'CvPythonExtensions.py'." )
-
+	parser.add_argument( "output_py", help = "The path to the output file, usually named 'CvPythonExtensions.py'. "
+			"With --package, the package directory, usually named 'CvPythonExtensions'." )
+	parser.add_argument( "--package", action = "store_true",
+			help = "Write a package with one module per class instead of a single module." )
+	parser.add_argument( "--index", metavar = "PATH",
+			help = "Also write an SQLite database of the classes, methods and enums to PATH (see symbol_index.py)." )
+	parser.add_argument( "--force", action = "store_true",
+			help = "Generate even if the input and code did not change since the last run." )
+	parser.add_argument( "--profile", action = "store_true",
+			help = "Print how long each phase took and the most expensive classes and functions." )
+	parser.add_argument( "--profile-top", type = int, default = 10, metavar = "N",
+			help = "Number of most expensive classes and functions to print with --profile (default: %(default)s)." )
+	parser.add_argument( "--profile-dump", metavar = "PATH", help = "Write cProfile statistics to PATH (see pstats)." )
 	args = parser.parse_args()
-	with open( args.input_json, "r" ) as fp :
-		skeleton = json.load( fp )
-	os.makedirs( os.path.dirname( args.output_py ), exist_ok = True )
-	with open( args.output_py, "w" ) as fp :
-		gen_module( skeleton, fp )
+
+	if args.profile or args.profile_dump is not None :
+		with profiling.Profiler( args.profile, args.profile_top, args.profile_dump ) as profiler :
+			# Only top-level members; _gen calls itself (through this wrapper) for their members
+			profiler.time_function( sys.modules[__name__], "_gen", itemKind = "module members",
+					itemName = lambda skeleton, write, parents, indent = "" : skeleton.name if not indent else None )
+			_run( args, profiler )
+	else :
+		_run( args, None )
+
+def _run( args : Any, profiler : Optional[profiling.Profiler] ) -> None :
+	with profiling.phase( profiler, "fingerprint" ) :
+		fingerprint = output.fingerprint( delta.input_paths( args.input_json ),
+				output.source_fingerprint( "compact", "delta", "model", "output", "symbol_index", "generate" ),
+				str( args.package ) )
+		if args.package :
+			upToDate = output.read_sidecar_fingerprint( args.output_py ) == fingerprint
+		else :
+			upToDate = output.read_header_fingerprint( args.output_py ) == fingerprint
+		if args.index is not None :
+			from cyskeleton import symbol_index # Imports sqlite3, so only with --index
+			upToDate = upToDate and symbol_index.read_fingerprint( args.index ) == fingerprint
+	if upToDate and not args.force :
+		return
+
+	with profiling.phase( profiler, "load and convert" ) :
+		with open( args.input_json, "r" ) as fp :
+			skeleton = compact.load_model( fp )
+		if ( args.index is not None or args.package ) and skeleton.members is not None :
+			skeleton.members = list( skeleton.members ) # Walked more than once; don't convert them each time
+	if args.index is not None :
+		with profiling.phase( profiler, "index" ) :
+			written, unchanged, removed = symbol_index.write_index( skeleton, args.index, fingerprint )
+		print( f"Index {args.index}: {written} classes written, {unchanged} unchanged, {removed} removed" )
+	if args.package :
+		with profiling.phase( profiler, "generate and write" ) :
+			written, unchanged, removed = write_package( skeleton, args.output_py )
+			output.write_sidecar_fingerprint( args.output_py, fingerprint )
+		print( f"Package {args.output_py}: {written} modules written, {unchanged} unchanged, {removed} removed" )
+		return
+	with profiling.phase( profiler, "generate and write" ) :
+		with output.OutputFile( args.output_py, header = output.FINGERPRINT_HEADER_PREFIX + fingerprint ) as fp :
+			gen_module( skeleton, fp )
 
 if __name__ == "__main__" :
 	_main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Reading and writing the top-level object of a large JSON file without holding all of it in memory.
+The elements of one list-valued key (e.g. the "members" of a module) are read and written one at a time.
+"""
+
+import json
+
+from cyskeleton.common import *
+
+
+_WHITESPACE = " \t\n\r"
+
+
+class JsonStreamReader :
+	"""
+	Reads the items of a JSON object from a file. The value of `streamKey` must be a list; its elements are
+	decoded one at a time.
+	"""
+	def __init__( self, fp : TextIO, streamKey : str, chunkSize : int = 1 << 16 ) -> None :
+		self._fp = fp
+		self._streamKey = streamKey
+		self._chunkSize = chunkSize
+		self._buf = ""
+		self._pos = 0
+		self._eof = False
+		self._decoder = json.JSONDecoder()
+
+	def _read_more( self ) -> bool :
+		""" Reads more data into the buffer. Returns False at the end of the file. """
+		if self._eof :
+			return False
+		# Read at least as much as we already have, so re-decoding a large value takes amortized linear time
+		chunk = self._fp.read( max( self._chunkSize, len( self._buf ) - self._pos ) )
+		if chunk == "" :
+			self._eof = True
+			return False
+		self._buf = self._buf[self._pos:] + chunk
+		self._pos = 0
+		return True
+
+	def _peek( self ) -> str :
+		""" Skips whitespace and returns the next character ("" at the end of the file). """
+		while True :
+			while self._pos < len( self._buf ) and self._buf[self._pos] in _WHITESPACE :
+				self._pos += 1
+			if self._pos < len( self._buf ) :
+				return self._buf[self._pos]
+			if not self._read_more() :
+				return ""
+
+	def _expect( self, chars : str ) -> str :
+		c = self._peek()
+		if c == "" or c not in chars :
+			raise ValueError( f"Invalid JSON: expected one of '{chars}', got '{c}'" )
+		self._pos += 1
+		return c
+
+	def _decode_value( self ) -> Any :
+		self._peek()
+		while True :
+			try :
+				value, end = self._decoder.raw_decode( self._buf, self._pos )
+			except json.JSONDecodeError :
+				if self._read_more() :
+					continue
+				raise
+			if end == len( self._buf ) and self._read_more() :
+				continue # A number might continue in the next chunk
+			self._pos = end
+			return value
+
+	def _iter_list( self ) -> Iterator[Any] :
+		self._expect( "[" )
+		if self._peek() == "]" :
+			self._pos += 1
+			return
+		while True :
+			yield self._decode_value()
+			if self._expect( ",]" ) == "]" :
+				return
+
+	def items( self ) -> Iterator[Tuple[str, Any]] :
+		"""
+		Yields the (key, value) pairs of the object in file order. The value for `streamKey` is an iterator over the
+		elements of the list, which must be exhausted before advancing to the next item.
+		"""
+		self._expect( "{" )
+		if self._peek() == "}" :
+			return
+		while True :
+			key = self._decode_value()
+			self._expect( ":" )
+			if key == self._streamKey :
+				yield key, self._iter_list()
+			else :
+				yield key, self._decode_value()
+			if self._expect( ",}" ) == "}" :
+				return
+
+
+class JsonStreamWriter :
+	"""
+	Writes a JSON object item by item. The output is identical to json.dump( obj, fp, indent = "\\t" ).
+	"""
+	def __init__( self, fp : TextIO ) -> None :
+		self._fp = fp
+		self._firstItem = True
+		self._firstElement = True
+
+	@staticmethod
+	def _dumps( value : Any, indent : str ) -> str :
+		# Strings in JSON never contain raw newlines, so we can simply indent all lines
+		return json.dumps( value, indent = "\t" ).replace( "\n", "\n" + indent )
+
+	def begin( self ) -> None :
+		self._fp.write( "{" )
+
+	def _write_key( self, key : str ) -> None :
+		self._fp.write( "\n\t" if self._firstItem else ",\n\t" )
+		self._firstItem = False
+		self._fp.write( json.dumps( key ) + ": " )
+
+	def write_item( self, key : str, value : Any ) -> None :
+		self._write_key( key )
+		self._fp.write( self._dumps( value, "\t" ) )
+
+	def begin_list( self, key : str ) -> None :
+		self._write_key( key )
+		self._fp.write( "[" )
+		self._firstElement = True
+
+	@staticmethod
+	def dumps_element( value : Any ) -> str :
+		""" Returns the text that write_element writes for value, e.g. to write it later with write_element_text. """
+		return JsonStreamWriter._dumps( value, "\t\t" )
+
+	def write_element( self, value : Any ) -> None :
+		self.write_element_text( self.dumps_element( value ) )
+
+	def write_element_text( self, text : str ) -> None :
+		self._fp.write( "\n\t\t" if self._firstElement else ",\n\t\t" )
+		self._firstElement = False
+		self._fp.write( text )
+
+	def end_list( self ) -> None :
+		if not self._firstElement :
+			self._fp.write( "\n\t" )
+		self._fp.write( "]" )
+
+	def end( self ) -> None :
+		if not self._firstItem :
+			self._fp.write( "\n" )
+		self._fp.write( "}" )
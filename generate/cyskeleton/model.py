@@ -0,0 +1,187 @@
+"""
+Typed in-memory model of a skeleton. Skeletons are converted from and to JSON only when read or written.
+
+Names and types are interned, and the key order of each node is kept (as a shared tuple), so converting a skeleton
+from JSON and back yields the same JSON.
+"""
+
+import sys
+
+from cyskeleton.common import *
+
+
+_intern = sys.intern
+
+_MISSING = object()
+
+
+class Arg :
+	__slots__ = ( "name", "type", "altType" )
+
+	def __init__( self, name : str, type : Optional[str] = None, altType : Optional[str] = None ) -> None :
+		self.name = _intern( name )
+		self.type = _intern( type ) if type is not None else None # None if only the name is known
+		self.altType = _intern( altType ) if altType is not None else None
+
+	@staticmethod
+	def from_json( data : JsonObj ) -> "Arg" :
+		return Arg( data["name"], data.get( "type" ), data.get( "alt-type" ) )
+
+	def to_json( self ) -> JsonObj :
+		if self.type is None :
+			return { "name" : self.name }
+		return { "name" : self.name, "type" : self.type, "alt-type" : self.altType }
+
+
+class Signature :
+	""" Signatures may be shared between functions (see sig_util.SigParseCache), in which case args is a tuple. """
+	__slots__ = ( "returnType", "returnTypeAlt", "args" )
+
+	def __init__( self, returnType : Optional[str] = None, returnTypeAlt : Optional[str] = None,
+			args : Optional[Sequence[Arg]] = None ) -> None :
+		self.returnType = _intern( returnType ) if returnType is not None else None
+		self.returnTypeAlt = _intern( returnTypeAlt ) if returnTypeAlt is not None else None
+		self.args = args if args is not None else []
+
+	@staticmethod
+	def from_json( data : JsonObj ) -> "Signature" :
+		return Signature( data.get( "return-type" ), data.get( "return-type-alt" ),
+				[Arg( argData["name"], argData.get( "type" ), argData.get( "alt-type" ) ) for argData in data["args"]] )
+
+	def to_json( self ) -> JsonObj :
+		result : JsonObj = {}
+		if self.returnType is not None :
+			result["return-type"] = self.returnType
+		if self.returnTypeAlt is not None :
+			result["return-type-alt"] = self.returnTypeAlt
+		result["args"] = [arg.to_json() for arg in self.args]
+		return result
+
+
+class Node :
+	"""
+	A member of a module or class. Values of keys without an attribute (e.g. "value") are kept in extra.
+	"""
+	__slots__ = ( "name", "type", "doc", "extra", "_keys" )
+	_ATTRIBUTE_KEYS : Tuple[str, ...] = ( "name", "type", "doc" ) # Keys with an attribute of the same name
+
+	def __init__( self, name : str, type : str, doc : Optional[str] = None, extra : Optional[JsonObj] = None,
+			keys : Tuple[str, ...] = () ) -> None :
+		self.name = _intern( name )
+		self.type = _intern( type )
+		self.doc = doc
+		self.extra = extra
+		self._keys = keys # Original key order
+
+	@classmethod
+	def _from_json( cls, data : JsonObj, extra : Optional[JsonObj], keys : Tuple[str, ...] ) -> "Node" :
+		return cls( data["name"], data["type"], data.get( "doc" ), extra, keys )
+
+	def _json_value( self, key : str ) -> Any :
+		""" Returns the value of the attribute for the given key as JSON (None if absent). """
+		return getattr( self, key )
+
+	def to_json( self ) -> JsonObj :
+		result : JsonObj = {}
+		extra = self.extra
+		for key in self._keys :
+			if extra is not None and key in extra :
+				result[key] = extra[key]
+			else :
+				value = self._json_value( key )
+				if value is not None :
+					result[key] = value
+		# Attributes that were set later, e.g. "signature"
+		for key in self._ATTRIBUTE_KEYS :
+			if key not in result :
+				value = self._json_value( key )
+				if value is not None :
+					result[key] = value
+		return result
+
+
+class FunctionNode( Node ) :
+	""" A function or method """
+	__slots__ = ( "signature", )
+	_ATTRIBUTE_KEYS = Node._ATTRIBUTE_KEYS + ( "signature", )
+
+	def __init__( self, name : str, type : str, doc : Optional[str] = None, extra : Optional[JsonObj] = None,
+			keys : Tuple[str, ...] = (), signature : Optional[Signature] = None ) -> None :
+		# Not calling Node.__init__ makes converting large skeletons noticeably faster
+		self.name = _intern( name )
+		self.type = _intern( type )
+		self.doc = doc
+		self.extra = extra
+		self._keys = keys
+		self.signature = signature
+
+	@classmethod
+	def _from_json( cls, data : JsonObj, extra : Optional[JsonObj], keys : Tuple[str, ...] ) -> "Node" :
+		sigData = data.get( "signature" )
+		return cls( data["name"], data["type"], data.get( "doc" ), extra, keys,
+				Signature.from_json( sigData ) if sigData is not None else None )
+
+	def _json_value( self, key : str ) -> Any :
+		if key == "signature" :
+			return self.signature.to_json() if self.signature is not None else None
+		return getattr( self, key )
+
+
+class _ContainerNode( Node ) :
+	""" A node with members """
+	__slots__ = ( "members", )
+	_ATTRIBUTE_KEYS = Node._ATTRIBUTE_KEYS + ( "members", )
+
+	def __init__( self, name : str, type : str, doc : Optional[str] = None, extra : Optional[JsonObj] = None,
+			keys : Tuple[str, ...] = (), members : Optional[List[Node]] = None ) -> None :
+		self.name = _intern( name )
+		self.type = _intern( type )
+		self.doc = doc
+		self.extra = extra
+		self._keys = keys
+		self.members = members # None if the node has no "members" key
+
+	@classmethod
+	def _from_json( cls, data : JsonObj, extra : Optional[JsonObj], keys : Tuple[str, ...] ) -> "Node" :
+		membersData = data.get( "members" )
+		return cls( data["name"], data["type"], data.get( "doc" ), extra, keys,
+				[from_json( memberData ) for memberData in membersData] if membersData is not None else None )
+
+	def _json_value( self, key : str ) -> Any :
+		if key == "members" :
+			return [member.to_json() for member in self.members] if self.members is not None else None
+		return getattr( self, key )
+
+
+class Module( _ContainerNode ) :
+	__slots__ = ()
+
+class ClassNode( _ContainerNode ) :
+	""" A Boost.Python class """
+	__slots__ = ()
+
+class EnumNode( _ContainerNode ) :
+	""" A Boost.Python enum, whose members are the enum values """
+	__slots__ = ()
+
+
+_NODE_CLASSES : Dict[str, Type[Node]] = {
+	"module" : Module,
+	"class" : ClassNode,
+	"type" : EnumNode,
+	"function" : FunctionNode,
+	"instancemethod" : FunctionNode,
+}
+
+# For each node class and key order, the shared key order tuple and the keys without attributes
+_shapes : Dict[Tuple[Type[Node], Tuple[str, ...]], Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+def from_json( data : JsonObj ) -> Node :
+	""" Converts a node of a skeleton, including its members. """
+	cls = _NODE_CLASSES.get( data["type"], Node )
+	keys = tuple( data )
+	shape = _shapes.get( ( cls, keys ) )
+	if shape is None :
+		shape = _shapes[cls, keys] = ( keys, tuple( key for key in keys if key not in cls._ATTRIBUTE_KEYS ) )
+	keys, extraKeys = shape
+	return cls._from_json( data, { key : data[key] for key in extraKeys } if extraKeys else None, keys )
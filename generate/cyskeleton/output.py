@@ -0,0 +1,173 @@
+"""
+Writing output files only if their content changed, and fingerprints of the inputs, to skip work entirely if the
+inputs did not change.
+"""
+
+import hashlib
+import io
+import os
+
+from cyskeleton.common import *
+
+
+_CHUNK_SIZE = 1 << 20
+
+FINGERPRINT_HEADER_PREFIX = "# cyskeleton-fingerprint: "
+
+
+def fingerprint( paths : Iterable[Optional[str]], *parts : str ) -> str :
+	"""
+	Returns a hash of the contents of the given files (None for absent optional inputs) and of parts, which should
+	describe everything else that affects the output (e.g. the source code, see source_fingerprint).
+	"""
+	h = hashlib.sha256()
+	for path in paths :
+		if path is None :
+			h.update( b"-" )
+		else :
+			h.update( b"+" )
+			with open( path, "rb" ) as fp :
+				for chunk in iter( lambda : fp.read( _CHUNK_SIZE ), b"" ) :
+					h.update( chunk )
+		h.update( b"\0" )
+	for part in parts :
+		h.update( part.encode( "utf-8" ) )
+		h.update( b"\0" )
+	return h.hexdigest()
+
+
+def source_fingerprint( *moduleNames : str ) -> str :
+	"""
+	Returns a hash of the source code of the given modules of this package (e.g. "model"), to invalidate cached
+	results when the code changes. The modules are not imported.
+	"""
+	h = hashlib.sha256()
+	for moduleName in moduleNames :
+		with open( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), moduleName + ".py" ), "rb" ) as fp :
+			h.update( fp.read() )
+	return h.hexdigest()
+
+
+def hash_file( path : str, skipHeader : bool = False ) -> Optional[str] :
+	"""
+	Returns the hash of the contents of the given file, or None if it does not exist. If skipHeader is True, a first
+	line with a fingerprint header is not included.
+	"""
+	h = hashlib.sha256()
+	try :
+		with open( path, "rb" ) as fp :
+			if skipHeader :
+				line = fp.readline()
+				if not line.startswith( FINGERPRINT_HEADER_PREFIX.encode( "ascii" ) ) :
+					h.update( line )
+			for chunk in iter( lambda : fp.read( _CHUNK_SIZE ), b"" ) :
+				h.update( chunk )
+	except FileNotFoundError :
+		return None
+	return h.hexdigest()
+
+
+def _read_first_line( path : str ) -> Optional[str] :
+	try :
+		with open( path, "r" ) as fp :
+			return fp.readline()
+	except ( OSError, ValueError ) :
+		return None
+
+def read_header_fingerprint( path : str ) -> Optional[str] :
+	""" Returns the fingerprint in the header of the given file, or None if it has none or does not exist. """
+	line = _read_first_line( path )
+	if line is None or not line.startswith( FINGERPRINT_HEADER_PREFIX ) :
+		return None
+	return line[len( FINGERPRINT_HEADER_PREFIX ):].strip()
+
+
+def sidecar_path( path : str ) -> str :
+	""" The path of the file that holds the fingerprint for an output without a header (e.g. JSON) """
+	return path + ".fingerprint"
+
+def read_sidecar_fingerprint( path : str ) -> Optional[str] :
+	""" Returns the fingerprint stored for the given output, or None if there is none or the output does not exist. """
+	if not os.path.exists( path ) :
+		return None
+	try :
+		with open( sidecar_path( path ), "r" ) as fp :
+			return fp.read().strip()
+	except OSError :
+		return None
+
+def write_sidecar_fingerprint( path : str, fingerprint : str ) -> None :
+	with open( sidecar_path( path ), "w" ) as fp :
+		fp.write( fingerprint + "\n" )
+
+
+class _HashingWriter( io.RawIOBase ) :
+	""" Writes bytes to a binary file, hashing them if hashing is True """
+	def __init__( self, fp : BinaryIO ) -> None :
+		super().__init__()
+		self._fp = fp
+		self.hash = hashlib.sha256()
+		self.hashing = False
+
+	def writable( self ) -> bool :
+		return True
+
+	def write( self, b ) -> int :
+		if self.hashing :
+			self.hash.update( b )
+		return self._fp.write( b )
+
+	def close( self ) -> None :
+		if not self.closed :
+			self._fp.close()
+		super().close()
+
+
+class OutputFile :
+	"""
+	A context manager for writing a text file only if its content changes. The content is written to a temporary
+	file and hashed while it is written; on exit, the temporary file replaces the output only if the hash differs from
+	the existing output's. An optional header line (e.g. a fingerprint header) is written first and not hashed; if
+	only the header differs, the output is replaced as well, but that doesn't count as a change.
+	Afterwards, changed tells whether the content (without the header) changed.
+	"""
+	def __init__( self, path : str, header : Optional[str] = None ) -> None :
+		self.path = path
+		self.changed : Optional[bool] = None
+		self._header = header
+		self._tmpPath = ""
+		self._raw : Optional[_HashingWriter] = None
+		self._fp : Optional[TextIO] = None
+
+	def __enter__( self ) -> TextIO :
+		import tempfile # Not needed if the output is up to date
+		directory = os.path.dirname( os.path.abspath( self.path ) )
+		os.makedirs( directory, exist_ok = True )
+		fd, self._tmpPath = tempfile.mkstemp( dir = directory, suffix = ".tmp" )
+		self._raw = _HashingWriter( os.fdopen( fd, "wb" ) )
+		# Same encoding and newline translation as open( path, "w" )
+		self._fp = io.TextIOWrapper( io.BufferedWriter( self._raw ) )
+		if self._header is not None :
+			self._fp.write( self._header + "\n" )
+			self._fp.flush()
+		self._raw.hashing = True
+		return self._fp
+
+	def __exit__( self, excType, excValue, traceback ) -> bool :
+		self._fp.close()
+		if excType is not None :
+			os.remove( self._tmpPath )
+			return False
+		self.changed = hash_file( self.path, skipHeader = self._header is not None ) != self._raw.hash.hexdigest()
+		if self.changed or ( self._header is not None and _read_first_line( self.path ) != self._header + "\n" ) :
+			if os.path.exists( self.path ) :
+				import shutil
+				shutil.copymode( self.path, self._tmpPath )
+			else :
+				umask = os.umask( 0 )
+				os.umask( umask )
+				os.chmod( self._tmpPath, 0o666 & ~umask )
+			os.replace( self._tmpPath, self.path )
+		else :
+			os.remove( self._tmpPath )
+		return False
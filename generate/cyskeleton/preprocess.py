@@ -5,13 +5,28 @@ Module to preprocess the skeleton JSON.
 * Parses docstrings for types
 """
 
+import collections
+import contextlib
+import copy
 from dataclasses import dataclass
+import io
 import json
+import os
 import re
+import sys
 
 from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import delta
+from cyskeleton import json_stream
+from cyskeleton import model
+from cyskeleton import output
+from cyskeleton import profiling
 from cyskeleton import sig_util
 from cyskeleton import type_util
+if TYPE_CHECKING : # Imported where they are used
+	import multiprocessing.pool
+	from cyskeleton import cache
 
 
 @dataclass( frozen = True )
@@ -51,102 +66,491 @@ class SigOverride :
 		return SigOverride( path, newSig )
 
 
-class Preprocess :
+_RE_META_CHARS = frozenset( ".^$*+?{}[]|()\\" )
+_RE_QUANTIFIERS = frozenset( "*+?{" )
+
+def _pattern_literal_prefix( pattern : str ) -> str :
 	"""
-	Preprocesses a module
+	Returns a literal string that every string fully matched by the given pattern must start with.
+	This is conservative, i.e., it might be shorter than necessary (possibly empty).
+	"""
+	if "|" in pattern :
+		return "" # Alternatives might start differently
+	prefix = []
+	idx = 0
+	while idx < len( pattern ) :
+		c = pattern[idx]
+		if c == "\\" :
+			if idx + 1 >= len( pattern ) or pattern[idx+1].isalnum() :
+				break # Character class or backreference
+			c = pattern[idx+1]
+			idx += 2
+		elif c in _RE_META_CHARS :
+			break
+		else :
+			idx += 1
+		if idx < len( pattern ) and pattern[idx] in _RE_QUANTIFIERS :
+			break # This character is optional or repeated
+		prefix.append( c )
+	return "".join( prefix )
+
+
+class _SigOverrideIndex :
+	"""
+	Finds the signature overrides that apply to a path, in configuration order.
+	Exact paths are looked up in a dict. Patterns are bucketed by the dotted path (e.g. "Module.Class.") their
+	literal prefix starts with, so only patterns that can possibly match a path are tried.
 	"""
-	def __init__( self, data : JsonObj, conf : Optional[JsonObj], verbosity : int = 0 ) -> None :
-		assert data["type"] == "module"
-		self._module_name = data["name"]
+	def __init__( self, sigOverrides : Sequence[SigOverride] ) -> None :
+		self._sigOverrides = sigOverrides
+		self._byPath : Dict[str, List[int]] = {}
+		self._byPrefix : Dict[str, List[int]] = {}
+		for idx, sigOverride in enumerate( sigOverrides ) :
+			if isinstance( sigOverride.path, str ) :
+				self._byPath.setdefault( sigOverride.path, [] ).append( idx )
+			else :
+				prefix = _pattern_literal_prefix( sigOverride.path.pattern )
+				prefix = prefix[:prefix.rfind( "." ) + 1] # Cut after last dot, possibly to ""
+				self._byPrefix.setdefault( prefix, [] ).append( idx )
+
+	def _candidates( self, path : str ) -> List[int] :
+		candidates = list( self._byPath.get( path, () ) )
+		candidates.extend( self._byPrefix.get( "", () ) )
+		idx = path.find( "." )
+		while idx != -1 :
+			candidates.extend( self._byPrefix.get( path[:idx+1], () ) )
+			idx = path.find( ".", idx + 1 )
+		candidates.sort()
+		return candidates
+
+	def matches( self, path : str ) -> Iterator[Tuple[SigOverride, str]] :
+		"""
+		Yields each override that applies to the given path, together with the new signature, in configuration order.
+		"""
+		for idx in self._candidates( path ) :
+			sigOverride = self._sigOverrides[idx]
+			newSig = sigOverride.try_make_new_sig( path )
+			if newSig is not None :
+				yield sigOverride, newSig
+
+
+class ModulePreprocessor :
+	"""
+	Preprocesses the members of a module one at a time.
+	All custom types must be added before the first member is preprocessed.
+	"""
+	def __init__( self, moduleName : str, conf : Optional[JsonObj], verbosity : int = 0 ) -> None :
+		self._module_name = moduleName
 		self._verbosity = verbosity
 		
 		# Parse configuration
 		if conf is None :
 			conf = {}
-		self._sigOverrides = [SigOverride.parse( sigOvConf ) for sigOvConf in conf.get( "sig-overrides", () )]
-		self._usedSigOverrides = set()
+		self._conf = conf
+		self.set_sig_overrides( conf.get( "sig-overrides", [] ) )
 		
 		# Prepare type context
 		self._tc = type_util.TypeContext()
 		self._tc.read_type_overrides( conf )
-		
-		# Collect types
-		for member in data.get( "members", () ) :
+		self._sigParseCache = sig_util.SigParseCache( self._tc, verbosity )
+
+	@property
+	def module_name( self ) -> str :
+		return self._module_name
+
+	@property
+	def verbosity( self ) -> int :
+		return self._verbosity
+
+	@property
+	def config( self ) -> JsonObj :
+		""" The configuration, with the current signature overrides """
+		return self._conf
+
+	@property
+	def type_context( self ) -> type_util.TypeContext :
+		return self._tc
+
+	def cache_stats( self ) -> Dict[str, Tuple[int, int]] :
+		""" Returns the hits and misses of the signature parsing and type conversion caches, by cache. """
+		return {
+			"signature parsing" : ( self._sigParseCache.hits, self._sigParseCache.parses ),
+			"type conversion" : ( self._tc.cacheHits, self._tc.cacheMisses ),
+		}
+
+	def set_sig_overrides( self, sigOverridesConf : List[JsonObj] ) -> None :
+		"""
+		Replaces the signature overrides (the "sig-overrides" of the configuration), keeping everything else.
+		Members preprocessed before are not updated; see sig_overrides_for to find those affected.
+		"""
+		self._conf = dict( self._conf, **{ "sig-overrides" : sigOverridesConf } )
+		self._sigOverrides = [SigOverride.parse( sigOvConf ) for sigOvConf in sigOverridesConf]
+		self._sigOverrideIndex = _SigOverrideIndex( self._sigOverrides )
+		self._usedSigOverrides = set()
+
+	def sig_overrides_for( self, path : str ) -> List[Tuple[SigOverride, str]] :
+		""" Returns the signature overrides that apply to the function at path, with the new signatures, in order. """
+		return list( self._sigOverrideIndex.matches( path ) )
+
+	def add_custom_types( self, members : Iterable[JsonObj] ) -> None :
+		"""
+		Collects the types defined by the given module members. Only the "type" and "name" keys are used.
+		"""
+		for member in members :
 			if member["type"] in {"class", "type"} :
 				self._tc.add_custom_type( member["name"] )
+		self._sigParseCache = sig_util.SigParseCache( self._tc, self._verbosity ) # Results depend on the custom types
 		if self._verbosity >= 2 :
 			print( "Known types: " + ", ".join( sorted( self._tc.custom_types() ) ) )
 
-		for member in data["members"] :
-			if member["type"] == "class" :
-				self._preprocess_class( member, data["name"] )
-			elif member["type"] == "type" :
-				self._preprocess_type( member, data["name"] )
-			elif member["type"] == "function" :
-				self._preprocess_function( member, data["name"] )
-			elif member["type"] in ("bool", "int", "float", "str", "unicode" ) :
-				pass # Nothing to do
-			else :
-				if self._verbosity >= 1 :
-					print( f"Ignoring member {data['name']}.{member['name']} of unknown type '{member['type']}'" )
-		
+	def preprocess_member( self, member : model.Node ) -> None :
+		"""
+		Preprocesses a single member of the module, in place.
+		"""
+		if member.type == "class" :
+			self._preprocess_class( member, self._module_name )
+		elif member.type == "type" :
+			self._preprocess_type( member, self._module_name )
+		elif member.type == "function" :
+			self._preprocess_function( member, self._module_name )
+		elif member.type in ("bool", "int", "float", "str", "unicode" ) :
+			pass # Nothing to do
+		else :
+			if self._verbosity >= 1 :
+				print( f"Ignoring member {self._module_name}.{member.name} of unknown type '{member.type}'" )
+
+	def pop_used_sig_overrides( self ) -> Set[SigOverride] :
+		"""
+		Returns the signature overrides used since the last call, and forgets about them.
+		"""
+		used = self._usedSigOverrides
+		self._usedSigOverrides = set()
+		return used
+
+	def add_used_sig_overrides( self, used : Iterable[SigOverride] ) -> None :
+		"""
+		Marks signature overrides as used, e.g., by another ModulePreprocessor with the same configuration.
+		"""
+		self._usedSigOverrides.update( used )
+
+	def sig_override_indices( self, sigOverrides : Set[SigOverride] ) -> List[int] :
+		return [idx for idx, sigOv in enumerate( self._sigOverrides ) if sigOv in sigOverrides]
+
+	def sig_overrides_at( self, indices : Iterable[int] ) -> Set[SigOverride] :
+		return { self._sigOverrides[idx] for idx in indices }
+
+	def fingerprint( self ) -> str :
+		"""
+		Returns a string that identifies everything besides the member itself that preprocess_member depends on:
+		the module, the configuration, the known types, the verbosity and the preprocessing code.
+		"""
+		return json.dumps( {
+			"module" : self._module_name,
+			"sig-overrides" : self._conf.get( "sig-overrides", [] ),
+			"type-overrides" : self._conf.get( "type-overrides", [] ),
+			"types" : sorted( self._tc.custom_types() ),
+			"verbosity" : self._verbosity,
+			"code" : output.source_fingerprint( "model", "sig_util", "type_util", "preprocess" )
+		}, sort_keys = True )
+
+	def member_sig_overrides( self, member : model.Node ) -> List[Tuple[SigOverride, str]] :
+		""" Returns the signature overrides that apply to the given module member or its methods, with the new signatures. """
+		if member.type == "function" :
+			paths = [f"{self._module_name}.{member.name}"]
+		elif member.type == "class" :
+			paths = [f"{self._module_name}.{member.name}.{classMember.name}" for classMember in member.members
+					if classMember.type == "instancemethod"]
+		else :
+			return []
+		return [match for path in paths for match in self._sigOverrideIndex.matches( path )]
+
+	def warn_unused_sig_overrides( self ) -> None :
 		for sigOv in self._sigOverrides :
 			if sigOv not in self._usedSigOverrides :
 				print( f"WARNING: signature override {sigOv} unused!" )
 	
-	def _preprocess_class( self, data : JsonObj, parentPath : str ) -> None :
-		assert data["type"] == "class"
-		path = parentPath + "." + data["name"]
+	def _preprocess_class( self, data : model.ClassNode, parentPath : str ) -> None :
+		assert data.type == "class"
+		path = parentPath + "." + data.name
 
-		for member in data["members"] :
-			if member["type"] == "instancemethod" :
+		for member in data.members :
+			if member.type == "instancemethod" :
 				self._preprocess_function( member, path )
-			elif member["type"] == "property" :
+			elif member.type == "property" :
 				pass # Nothing to do
 			else :
 				if self._verbosity >= 1 :
-					print( f"Ignoring member {path}.{member['name']} of unknown type '{member['type']}'" )
+					print( f"Ignoring member {path}.{member.name} of unknown type '{member.type}'" )
 
-	def _preprocess_type( self, data : JsonObj, parentPath : str ) -> None :
-		assert data["type"] == "type"
-		for member in data["members"] :
+	def _preprocess_type( self, data : model.EnumNode, parentPath : str ) -> None :
+		assert data.type == "type"
+		for member in data.members :
 			# Types of enum members
 			# TODO: This might also be useful elsewhere
-			if member["type"].startswith( self._module_name + "." ) :
-				member["type"] = member["type"][len(self._module_name + "."):]
+			if member.type.startswith( self._module_name + "." ) :
+				member.type = sys.intern( member.type[len(self._module_name + "."):] )
 
-	def _preprocess_function( self, data : JsonObj, parentPath : str ) -> None :
-		assert data["type"] in ("function", "instancemethod")
-		path = parentPath + "." + data["name"]
+	def _preprocess_function( self, data : model.FunctionNode, parentPath : str ) -> None :
+		assert data.type in ("function", "instancemethod")
+		path = parentPath + "." + data.name
 
-		if "doc" in data and "-" in data["doc"] :
+		if data.doc is not None and "-" in data.doc :
 			# Try to split docstring into signature part and documentation part
-			doc : str = data["doc"]
+			doc = data.doc
 			idx = doc.index( "-" )
 			posSig = doc[:idx].strip() # This might be a signature
 
-			sig = sig_util.try_parse_signature( path, posSig, self._tc, self._verbosity )
+			sig = self._sigParseCache.parse( path, posSig )
 			if sig is not None :
-				data["signature"] = sig
-				data["doc"] = doc[idx+1:].strip()
+				data.signature = sig
+				data.doc = doc[idx+1:].strip()
 			# Otherwise, we leave the doc as is.
-		elif "doc" in data :
+		elif data.doc is not None :
 			# Try to parse whole docstring as signature
-			sig = sig_util.try_parse_signature( path, data["doc"], self._tc, self._verbosity )
+			sig = self._sigParseCache.parse( path, data.doc )
 			if sig is not None :
-				data["signature"] = sig
-				data["doc"] = ""
+				data.signature = sig
+				data.doc = ""
 		
 		# Try sig overrides
-		for sigOverride in self._sigOverrides :
-			newSig = sigOverride.try_make_new_sig( path )
-			if newSig is not None :
-				self._usedSigOverrides.add( sigOverride )
-				newSigParsed = sig_util.try_parse_signature( path, newSig, self._tc, self._verbosity )
-				if newSigParsed is not None :
-					data["signature"] = newSigParsed
-				else :
-					print( f"ERROR: sig override {sigOverride} produced invalid signature '{newSig}'" )
+		for sigOverride, newSig in self._sigOverrideIndex.matches( path ) :
+			self._usedSigOverrides.add( sigOverride )
+			newSigParsed = self._sigParseCache.parse( path, newSig )
+			if newSigParsed is not None :
+				data.signature = newSigParsed
+			else :
+				print( f"ERROR: sig override {sigOverride} produced invalid signature '{newSig}'" )
+
+
+
+class BaseMembers :
+	"""
+	The preprocessed base of a delta skeleton (see delta.py), to reuse the members that the delta takes unchanged from
+	its base instead of preprocessing them again. The base must have been preprocessed with the same configuration
+	and code. A member is only reused if no class or enum that only one of the skeletons has is mentioned in its names
+	and docs, in the signature overrides that apply to it or in the type overrides.
+	"""
+	def __init__( self, preprocessedBase : JsonObj, inherited : Set[str] ) -> None :
+		members = list( preprocessedBase.get( "members" ) or () )
+		self._moduleName = preprocessedBase["name"]
+		self._members : Dict[str, JsonObj] = {}
+		for member in members :
+			if member["name"] in inherited :
+				self._members.setdefault( member["name"], member )
+		self._types = { member["name"] for member in members if member["type"] in {"class", "type"} }
+		self._changedTypes : Optional[List[str]] = None
+		self.reused : Set[str] = set() # Names of the reused members
+
+	def _changed_types( self, mp : ModulePreprocessor ) -> List[str] :
+		if self._changedTypes is None :
+			self._changedTypes = sorted( self._types.symmetric_difference( mp.type_context.custom_types() ) )
+			typeOverrides = " ".join( f"{to['type']} {to.get( 'alt-type' ) or ''}"
+					for to in mp.config.get( "type-overrides", () ) )
+			if any( tp in typeOverrides for tp in self._changedTypes ) :
+				self._members = {} # Could apply to any member
+		return self._changedTypes
+
+	def reuse( self, mp : ModulePreprocessor, member : model.Node ) -> Optional[Tuple[model.Node, Set[SigOverride]]] :
+		""" Returns the preprocessed member and the signature overrides it used, or None if it can't be reused. """
+		if mp.module_name != self._moduleName :
+			return None
+		changedTypes = self._changed_types( mp )
+		preprocessed = self._members.get( member.name )
+		if preprocessed is None :
+			return None
+		matches = mp.member_sig_overrides( member )
+		texts = [newSig for _, newSig in matches]
+		for node in [member] + ( getattr( member, "members", None ) or [] ) :
+			texts.append( node.name )
+			if node.doc :
+				texts.append( node.doc )
+		if any( tp in text for text in texts for tp in changedTypes ) :
+			return None
+		self.reused.add( member.name )
+		return model.from_json( preprocessed ), { sigOverride for sigOverride, _ in matches }
+
+
+_workerPreprocessor : Optional[ModulePreprocessor] = None
+
+def _init_worker( moduleName : str, conf : Optional[JsonObj], verbosity : int, customTypes : List[JsonObj] ) -> None :
+	global _workerPreprocessor
+	with contextlib.redirect_stdout( io.StringIO() ) : # Known types are printed by the main process
+		_workerPreprocessor = ModulePreprocessor( moduleName, conf, verbosity )
+		_workerPreprocessor.add_custom_types( customTypes )
+
+_MemberResult = Tuple[model.Node, str, Set[SigOverride]] # Preprocessed member, printed output, used signature overrides
+
+def _preprocess_member_captured( mp : ModulePreprocessor, member : model.Node ) -> _MemberResult :
+	out = io.StringIO()
+	with contextlib.redirect_stdout( out ) :
+		mp.preprocess_member( member )
+	return member, out.getvalue(), mp.pop_used_sig_overrides()
+
+def _preprocess_members_in_worker( members : List[model.Node] ) -> List[_MemberResult] :
+	assert _workerPreprocessor is not None
+	return [_preprocess_member_captured( _workerPreprocessor, member ) for member in members]
+
+
+_WORKER_BATCH_SIZE = 16 # Number of members sent to a worker at once, to reduce communication overhead
+
+def _preprocess_members( mp : ModulePreprocessor, members : Iterable[model.Node], customTypes : List[JsonObj],
+		conf : Optional[JsonObj], jobs : int, memberCache : Optional["cache.PreprocessCache"] = None,
+		baseMembers : Optional[BaseMembers] = None ) -> Iterator[model.Node] :
+	"""
+	Preprocesses the given members and yields the results in the original order.
+	If jobs > 1, members are distributed to a pool of that many processes, each with its own ModulePreprocessor for
+	the same module, configuration and custom types. Output and used signature overrides are merged into mp, so the
+	result is the same as preprocessing serially with mp.
+	If a cache is given, members preprocessed before in the same context are taken from the cache, including their
+	output and used signature overrides. Members that can be reused from baseMembers are taken from there (without
+	output).
+	"""
+	if jobs <= 1 and memberCache is None and baseMembers is None :
+		for member in members :
+			mp.preprocess_member( member )
+			yield member
+		return
+
+	context = mp.fingerprint() if memberCache is not None else ""
+	with contextlib.ExitStack() as stack :
+		pool = None
+		if jobs > 1 :
+			import multiprocessing.pool
+			pool = stack.enter_context(
+					multiprocessing.Pool( jobs, _init_worker, ( mp.module_name, conf, mp.verbosity, customTypes ) ) )
+
+		# Batches of results in member order, with the cache keys to store them under (None for cache hits)
+		pending : Deque[Tuple[List[Optional[str]], Union[List[_MemberResult], multiprocessing.pool.AsyncResult]]] \
+				= collections.deque()
+		def pop_results() -> Iterator[model.Node] :
+			keys, results = pending.popleft()
+			if not isinstance( results, list ) :
+				results = results.get()
+			for key, ( member, output, used ) in zip( keys, results ) :
+				print( output, end = "" )
+				mp.add_used_sig_overrides( used )
+				if key is not None :
+					assert memberCache is not None
+					memberCache.put( key, {
+						"member" : member.to_json(),
+						"output" : output,
+						"used-sig-overrides" : mp.sig_override_indices( used )
+					} )
+				yield member
+
+		batch : List[model.Node] = []
+		batchKeys : List[Optional[str]] = []
+		def submit() -> None :
+			nonlocal batch, batchKeys
+			if pool is None :
+				pending.append( ( batchKeys, [_preprocess_member_captured( mp, member ) for member in batch] ) )
+			else :
+				pending.append( ( batchKeys, pool.apply_async( _preprocess_members_in_worker, ( batch, ) ) ) )
+			batch = []
+			batchKeys = []
+
+		for member in members :
+			reused = baseMembers.reuse( mp, member ) if baseMembers is not None else None
+			if reused is not None :
+				if batch :
+					submit()
+				pending.append( ( [None], [( reused[0], "", reused[1] )] ) )
+				continue
+			key = None
+			if memberCache is not None :
+				key = memberCache.key( context, member.to_json() )
+				entry = memberCache.get( key )
+				if entry is not None :
+					if batch :
+						submit()
+					pending.append( ( [None], [( model.from_json( entry["member"] ), entry["output"],
+							mp.sig_overrides_at( entry["used-sig-overrides"] ) )] ) )
+					continue
+			batch.append( member )
+			batchKeys.append( key )
+			if len( batch ) == _WORKER_BATCH_SIZE :
+				submit()
+			while len( pending ) >= 4 * jobs : # Limit the number of members in flight, so streaming stays bounded
+				yield from pop_results()
+		if batch :
+			submit()
+		while pending :
+			yield from pop_results()
+
+
+def _custom_type_members( members : Iterable[JsonObj] ) -> List[JsonObj] :
+	""" Strips the given members down to what is needed to collect custom types. """
+	if isinstance( members, compact.LazyMembers ) :
+		return members.types_and_names() # Don't convert the whole members
+	return [{ "type" : member["type"], "name" : member["name"] } for member in members]
+
+
+
+class Preprocess( ModulePreprocessor ) :
+	"""
+	Preprocesses a module
+	"""
+	def __init__( self, module : model.Module, conf : Optional[JsonObj], verbosity : int = 0, jobs : int = 1,
+			memberCache : Optional["cache.PreprocessCache"] = None, baseMembers : Optional[BaseMembers] = None ) -> None :
+		assert module.type == "module"
+		super().__init__( module.name, conf, verbosity )
+		members = module.members or []
+		if isinstance( members, compact.LazyNodes ) :
+			customTypes = members.types_and_names() # Members are converted one at a time while preprocessing
+		else :
+			customTypes = [{ "type" : member.type, "name" : member.name } for member in members]
+		self.add_custom_types( customTypes )
+		module.members = list( _preprocess_members( self, members, customTypes, conf, jobs, memberCache,
+				baseMembers ) )
+		self.warn_unused_sig_overrides()
+
+
+
+def preprocess_stream( inputPath : str, out : TextIO, conf : Optional[JsonObj], verbosity : int = 0,
+		jobs : int = 1, memberCache : Optional["cache.PreprocessCache"] = None ) -> ModulePreprocessor :
+	"""
+	Preprocesses the module in the given file and writes the result to out, holding only one module member in memory
+	at a time. The input is read twice: once to collect the custom types, and once to preprocess the members.
+	The output is identical to dumping the result of Preprocess with indent "\t".
+	Returns the ModulePreprocessor used.
+	"""
+	# First pass: module name and custom types
+	moduleName = None
+	customTypes : List[JsonObj] = []
+	with open( inputPath, "r" ) as fp :
+		for key, value in json_stream.JsonStreamReader( fp, "members" ).items() :
+			if key == "format" and value == compact.FORMAT_NAME :
+				raise ValueError( "Compact skeletons can't be preprocessed in streaming mode" )
+			elif key == "format" and value == delta.FORMAT_NAME :
+				raise ValueError( "Delta skeletons can't be preprocessed in streaming mode" )
+			elif key == "name" :
+				moduleName = value
+			elif key == "type" :
+				assert value == "module"
+			elif key == "members" :
+				customTypes = _custom_type_members( value )
+	assert moduleName is not None
+
+	mp = ModulePreprocessor( moduleName, conf, verbosity )
+	mp.add_custom_types( customTypes )
+
+	# Second pass: preprocess and write members one by one
+	writer = json_stream.JsonStreamWriter( out )
+	writer.begin()
+	with open( inputPath, "r" ) as fp :
+		for key, value in json_stream.JsonStreamReader( fp, "members" ).items() :
+			if key == "members" :
+				writer.begin_list( key )
+				members = ( model.from_json( memberData ) for memberData in value )
+				for member in _preprocess_members( mp, members, customTypes, conf, jobs, memberCache ) :
+					writer.write_element( member.to_json() )
+				writer.end_list()
+			else :
+				writer.write_item( key, value )
+	writer.end()
+
+	mp.warn_unused_sig_overrides()
+	return mp
 
 
 
@@ -155,22 +559,147 @@ def main() -> None :
 
 	parser = argparse.ArgumentParser()
 	parser.add_argument( "--config", help = "The configuration file to use." )
-	parser.add_argument( "input_json", help = "The input skeleton, generated by the CySkeleton-extract mod." )
+	parser.add_argument( "input_json",
+			help = "The input skeleton, generated by the CySkeleton-extract mod (in the usual or the compact format)." )
 	parser.add_argument( "output_json", help = "The output file." )
 	parser.add_argument( "-v", "--verbosity", type = int, default = 0, choices = (0,1,2,3),
 			help = "How much information to print (0: nothing, 3: everything; default:0)." )
+	parser.add_argument( "--stream", action = "store_true",
+			help = "Preprocess one class at a time instead of loading the whole skeleton into memory "
+				"(not for compact skeletons)." )
+	parser.add_argument( "-j", "--jobs", type = int, default = 1,
+			help = "Number of processes to preprocess classes in parallel (default: 1)." )
+	parser.add_argument( "--cache-dir",
+			help = "Directory to cache preprocessed classes in (default: .cyskeleton-cache next to the output file)." )
+	parser.add_argument( "--cache-size", type = int,
+			help = "Maximum size of the cache in MB (default: 256)." )
+	parser.add_argument( "--no-cache", action = "store_true", help = "Preprocess all classes, without using the cache." )
+	parser.add_argument( "--base-preprocessed", metavar = "PATH",
+			help = "For a delta skeleton, the preprocessed base skeleton, to reuse the unchanged members from "
+				"(not with --stream)." )
+	parser.add_argument( "--force", action = "store_true",
+			help = "Preprocess even if the input, configuration and code did not change since the last run." )
+	parser.add_argument( "--profile", action = "store_true",
+			help = "Print how long each phase took, the most expensive classes and functions and cache hit rates." )
+	parser.add_argument( "--profile-top", type = int, default = 10, metavar = "N",
+			help = "Number of most expensive classes and functions to print with --profile (default: %(default)s)." )
+	parser.add_argument( "--profile-dump", metavar = "PATH", help = "Write cProfile statistics to PATH (see pstats)." )
 	args = parser.parse_args()
 
+	if args.profile or args.profile_dump is not None :
+		with profiling.Profiler( args.profile, args.profile_top, args.profile_dump ) as profiler :
+			_instrument( profiler )
+			if args.jobs > 1 :
+				profiler.add_note( "Functions and classes preprocessed by worker processes (--jobs) are not timed." )
+			_run( args, profiler )
+	else :
+		_run( args, None )
+
+def _instrument( profiler : profiling.Profiler ) -> None :
+	profiler.time_function( ModulePreprocessor, "add_custom_types", "type collection" )
+	profiler.time_function( ModulePreprocessor, "preprocess_member", "preprocess_member", "module members",
+			lambda self, member : member.name )
+	profiler.time_function( ModulePreprocessor, "_preprocess_function", itemKind = "functions",
+			itemName = lambda self, data, parentPath : f"{parentPath}.{data.name}" )
+	profiler.time_function( sig_util.SigParseCache, "parse", "signature parsing" )
+	profiler.time_function( type_util.TypeContext, "cpp_to_python_type", "type conversion" )
+	profiler.time_function( _SigOverrideIndex, "matches", "override matching", generator = True )
+
+def _run( args : Any, profiler : Optional[profiling.Profiler] ) -> None :
+	with profiling.phase( profiler, "fingerprint" ) :
+		codeFingerprint = output.source_fingerprint( "cache", "compact", "delta", "json_stream", "model", "sig_util",
+				"type_util", "preprocess" )
+		inputPaths = delta.input_paths( args.input_json ) + [args.config]
+		if args.base_preprocessed is not None :
+			inputPaths += delta.input_paths( args.base_preprocessed )
+		fingerprint = output.fingerprint( inputPaths, codeFingerprint )
+	if not args.force and output.read_sidecar_fingerprint( args.output_json ) == fingerprint :
+		if args.verbosity >= 1 :
+			print( f"{args.output_json} is up to date" )
+		return
+
 	if args.config :
 		with open( args.config, "r" ) as fp :
 			confData = json.load( fp )
 	else :
 		confData = None
-	with open( args.input_json, "r" ) as fp :
-		data = json.load( fp )
-	Preprocess( data, confData, verbosity = args.verbosity )
-	with open( args.output_json, "w" ) as fp :
-		json.dump( data, fp, indent = "\t" )
+
+	memberCache = None
+	if not args.no_cache :
+		from cyskeleton import cache # Not needed if the output is up to date
+		cacheDir = args.cache_dir
+		if cacheDir is None :
+			cacheDir = os.path.join( os.path.dirname( os.path.abspath( args.output_json ) ), ".cyskeleton-cache" )
+		memberCache = cache.PreprocessCache( cacheDir,
+				cache.DEFAULT_MAX_SIZE if args.cache_size is None else args.cache_size * 1024 * 1024 )
+
+	baseMembers = None
+	if args.base_preprocessed is not None :
+		with profiling.phase( profiler, "load preprocessed base" ) :
+			baseMembers = _load_base_members( args.input_json, args.config, args.base_preprocessed, codeFingerprint )
+
+	outputFile = output.OutputFile( args.output_json )
+	if args.stream :
+		with profiling.phase( profiler, "preprocess (streaming)" ), outputFile as fp :
+			mp = preprocess_stream( args.input_json, fp, confData, verbosity = args.verbosity, jobs = args.jobs,
+					memberCache = memberCache )
+	else :
+		with profiling.phase( profiler, "load and convert" ) :
+			with open( args.input_json, "r" ) as fp :
+				module = compact.load_model( fp )
+		with profiling.phase( profiler, "preprocess" ) :
+			mp = Preprocess( module, confData, verbosity = args.verbosity, jobs = args.jobs, memberCache = memberCache,
+					baseMembers = baseMembers )
+		with profiling.phase( profiler, "dump" ), outputFile as fp :
+			if baseMembers is not None :
+				json.dump( _to_delta( module, baseMembers, args.base_preprocessed, args.output_json ), fp,
+						indent = "\t" )
+			else :
+				json.dump( module.to_json(), fp, indent = "\t" )
+	output.write_sidecar_fingerprint( args.output_json, fingerprint )
+	if not outputFile.changed and args.verbosity >= 1 :
+		print( f"{args.output_json} is unchanged" )
+
+	if baseMembers is not None and args.verbosity >= 1 :
+		print( f"Reused {len( baseMembers.reused )} members of the preprocessed base" )
+	if memberCache is not None :
+		with profiling.phase( profiler, "cache eviction" ) :
+			memberCache.evict()
+		if args.verbosity >= 1 :
+			print( f"Cache: {memberCache.hits} hits, {memberCache.misses} misses" )
+	if profiler is not None :
+		if memberCache is not None :
+			profiler.add_rate( "preprocessed members", memberCache.hits, memberCache.misses )
+		for label, ( hits, misses ) in mp.cache_stats().items() :
+			profiler.add_rate( label, hits, misses )
+
+def _load_base_members( inputPath : str, configPath : Optional[str], preprocessedBasePath : str,
+		codeFingerprint : str ) -> Optional[BaseMembers] :
+	"""
+	Loads the preprocessed base of the delta skeleton at inputPath. Returns None (with a warning) if it was not
+	preprocessed from the delta's base with the same configuration and code.
+	"""
+	with open( inputPath, "r" ) as fp :
+		deltaData = json.load( fp )
+	if not delta.is_delta( deltaData ) :
+		raise ValueError( f"{inputPath} is no delta skeleton, so it has no base" )
+	basePath = delta.base_path( deltaData, inputPath )
+	if output.read_sidecar_fingerprint( preprocessedBasePath ) \
+			!= output.fingerprint( delta.input_paths( basePath ) + [configPath], codeFingerprint ) :
+		print( f"WARNING: {preprocessedBasePath} was not preprocessed from {basePath} with the same configuration "
+				"and code; not reusing it" )
+		return None
+	with open( preprocessedBasePath, "r" ) as fp :
+		return BaseMembers( compact.load( fp ), delta.inherited_names( deltaData ) )
+
+def _to_delta( module : model.Module, baseMembers : BaseMembers, preprocessedBasePath : str, outputPath : str ) \
+		-> JsonObj :
+	""" Returns the preprocessed module as a delta to the preprocessed base, which holds the reused members. """
+	moduleFields = copy.copy( module )
+	moduleFields.members = None
+	basePath = os.path.relpath( preprocessedBasePath, os.path.dirname( os.path.abspath( outputPath ) ) )
+	members = [member.name if member.name in baseMembers.reused else member.to_json() for member in module.members]
+	return delta.new_delta( basePath, output.hash_file( preprocessedBasePath ), moduleFields.to_json(), members )
 
 if __name__ == "__main__" :
 	main()
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Optional profiling for the command line tools (--profile): per-phase timings, the most expensive items (e.g. classes
+and functions) and cache hit rates, and optionally a cProfile dump.
+
+Functions are timed by temporarily replacing them with timing wrappers, so nothing is changed, and nothing costs time,
+when profiling is off.
+"""
+
+import contextlib
+import cProfile
+import time
+
+from cyskeleton.common import *
+
+
+def phase( profiler : Optional["Profiler"], name : str ) -> ContextManager[None] :
+	""" Times a phase if profiler is not None. """
+	return profiler.phase( name ) if profiler is not None else contextlib.nullcontext()
+
+
+class Profiler :
+	def __init__( self, report : bool = True, topN : int = 10, dumpPath : Optional[str] = None ) -> None :
+		"""
+		If report is False, only the cProfile dump is written (if dumpPath is given).
+		"""
+		self._report = report
+		self._topN = topN
+		self._dumpPath = dumpPath
+		self._phases : Dict[str, float] = {}
+		self._functions : Dict[str, List[float]] = {} # Label -> [time, calls]
+		self._items : Dict[str, Dict[str, float]] = {} # Kind of item -> item name -> time
+		self._rates : List[Tuple[str, int, int]] = []
+		self._notes : List[str] = []
+		self._restore : List[Callable[[], None]] = []
+		self._cProfile : Optional[cProfile.Profile] = None
+
+	def __enter__( self ) -> "Profiler" :
+		if self._dumpPath is not None :
+			self._cProfile = cProfile.Profile()
+			self._cProfile.enable()
+		return self
+
+	def __exit__( self, *excInfo ) -> None :
+		for restore in reversed( self._restore ) :
+			restore()
+		self._restore.clear()
+		if self._cProfile is not None :
+			self._cProfile.disable()
+			self._cProfile.dump_stats( self._dumpPath )
+		if self._report and excInfo[0] is None :
+			self.print_report()
+
+	@contextlib.contextmanager
+	def phase( self, name : str ) -> Iterator[None] :
+		start = time.perf_counter()
+		try :
+			yield
+		finally :
+			self._phases[name] = self._phases.get( name, 0.0 ) + time.perf_counter() - start
+
+	def time_function( self, owner : Any, attr : str, label : Optional[str] = None, itemKind : Optional[str] = None,
+			itemName : Optional[Callable[..., Optional[str]]] = None, generator : bool = False ) -> None :
+		"""
+		Until the profiler is exited, replaces owner.attr (a function of a module, or a method of the class that
+		defines it) by a wrapper that adds the time of each call to label, and, if itemKind is given, to the item named
+		itemName( *args ) of that kind (unless that returns None). For generator functions, set generator, so the time
+		to produce all items is measured.
+		"""
+		if not self._report :
+			return
+		orig = vars( owner )[attr]
+		func = getattr( owner, attr )
+		perf_counter = time.perf_counter
+		stats = self._functions.setdefault( label, [0.0, 0] ) if label is not None else None
+		items = self._items.setdefault( itemKind, {} ) if itemKind is not None else None
+		def timed( *args, **kwargs ) :
+			start = perf_counter()
+			try :
+				result = func( *args, **kwargs )
+				if generator :
+					result = iter( list( result ) )
+				return result
+			finally :
+				elapsed = perf_counter() - start
+				if stats is not None :
+					stats[0] += elapsed
+					stats[1] += 1
+				if items is not None :
+					name = itemName( *args, **kwargs )
+					if name is not None :
+						items[name] = items.get( name, 0.0 ) + elapsed
+		setattr( owner, attr, timed )
+		self._restore.append( lambda : setattr( owner, attr, orig ) )
+
+	def add_rate( self, label : str, hits : int, misses : int ) -> None :
+		self._rates.append( ( label, hits, misses ) )
+
+	def add_note( self, note : str ) -> None :
+		self._notes.append( note )
+
+	def print_report( self ) -> None :
+		total = sum( self._phases.values() )
+		print( f"{'phase':<32} {'time':>10} {'share':>6}" )
+		for name, elapsed in self._phases.items() :
+			print( f"{name:<32} {elapsed * 1000:8.1f}ms {elapsed / total if total > 0 else 0:6.1%}" )
+		print( f"{'total':<32} {total * 1000:8.1f}ms" )
+		if self._functions :
+			print( f"\n{'function (inclusive)':<32} {'time':>10} {'calls':>8}" )
+			for label, ( elapsed, calls ) in self._functions.items() :
+				print( f"{label:<32} {elapsed * 1000:8.1f}ms {calls:8}" )
+		for kind, items in self._items.items() :
+			if not items :
+				continue
+			print( f"\nmost expensive {kind}" )
+			top = sorted( items.items(), key = lambda item : item[1], reverse = True )[:self._topN]
+			width = max( len( name ) for name, _ in top )
+			for name, elapsed in top :
+				print( f"  {name:<{width}} {elapsed * 1000:8.2f}ms" )
+		if self._rates :
+			print( "\ncache hit rates" )
+			for label, hits, misses in self._rates :
+				rate = hits / ( hits + misses ) if hits + misses > 0 else 0
+				print( f"  {label:<30} {hits:8} hits {misses:8} misses {rate:6.1%}" )
+		for note in self._notes :
+			print( f"\nNote: {note}" )
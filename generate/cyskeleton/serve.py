@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+A query server for editors: loads a (preprocessed) skeleton once and answers JSON-RPC 2.0 requests on stdin, one
+request per line, with one response per line on stdout.
+
+Methods (paths are relative to the module, e.g. "CyPlayer.getUnit"):
+* lookup( path ) or lookup( name ): The member at path, or all members with the given name (e.g. "getUnit").
+* complete( prefix, limit = 50 ): Members whose path starts with prefix, case-insensitively, e.g. "CyPlayer.getu".
+* signature( path ): The signature of the function or method at path.
+* methodsByType( type, role = None ): Paths of the functions and methods that return ("returns") or take ("takes")
+  the given type, or both.
+* reload(): Reloads the skeleton now.
+
+The skeleton is reloaded before answering a request if its file changed since it was loaded.
+"""
+
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+
+from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import model
+
+
+# JSON-RPC error codes
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INVALID_PARAMS = -32602
+_INTERNAL_ERROR = -32603
+
+_RE_IDENTIFIER = re.compile( r"\w+" )
+
+
+class InvalidParams( ValueError ) :
+	""" Raised for parameters of a request that are wrong, as opposed to errors while answering it """
+	pass
+
+
+def _matches_type( value : Any, annotation : Any ) -> bool :
+	""" Whether value is of the type given by a parameter annotation (a class, or Optional of a class) """
+	if annotation is inspect.Parameter.empty or annotation is Any :
+		return True
+	if getattr( annotation, "__origin__", None ) is Union :
+		return any( _matches_type( value, arg ) for arg in annotation.__args__ )
+	if annotation is type( None ) :
+		return value is None
+	if annotation is int and isinstance( value, bool ) :
+		return False
+	return isinstance( value, annotation )
+
+@functools.lru_cache( maxsize = None )
+def _method_signature( func : Callable[..., Any] ) -> inspect.Signature :
+	""" The signature of a method without self """
+	signature = inspect.signature( func )
+	return signature.replace( parameters = list( signature.parameters.values() )[1:] )
+
+def _check_params( method : Callable[..., Any], params : JsonObj ) -> None :
+	""" Raises InvalidParams if the (bound) method can't be called with params, by name and type. """
+	signature = _method_signature( method.__func__ )
+	try :
+		bound = signature.bind( **params )
+	except TypeError as e :
+		raise InvalidParams( str( e ) ) from None
+	for name, value in bound.arguments.items() :
+		if not _matches_type( value, signature.parameters[name].annotation ) :
+			raise InvalidParams( f"Parameter '{name}' has the wrong type" )
+
+
+class _TrieNode :
+	__slots__ = ( "children", "values" )
+
+	def __init__( self ) -> None :
+		self.children : Dict[str, Tuple[str, "_TrieNode"]] = {} # First character -> edge label and child
+		self.values : List[Any] = []
+
+
+class PrefixTrie :
+	""" A radix trie (with multi-character edges) that maps string keys to values, for prefix searches """
+	def __init__( self ) -> None :
+		self._root = _TrieNode()
+
+	def insert( self, key : str, value : Any ) -> None :
+		node = self._root
+		while key :
+			edge = node.children.get( key[0] )
+			if edge is None :
+				child = _TrieNode()
+				node.children[key[0]] = ( key, child )
+				node = child
+				break
+			label, child = edge
+			common = 1
+			while common < len( label ) and common < len( key ) and label[common] == key[common] :
+				common += 1
+			if common < len( label ) : # Split the edge
+				mid = _TrieNode()
+				mid.children[label[common]] = ( label[common:], child )
+				node.children[key[0]] = ( label[:common], mid )
+				child = mid
+			node = child
+			key = key[common:]
+		node.values.append( value )
+
+	def search( self, prefix : str, limit : int ) -> List[Any] :
+		""" Returns the values of up to limit keys that start with prefix, in the order of the keys. """
+		node = self._root
+		while prefix :
+			edge = node.children.get( prefix[0] )
+			if edge is None :
+				return []
+			label, child = edge
+			if prefix.startswith( label ) :
+				prefix = prefix[len( label ):]
+			elif label.startswith( prefix ) :
+				prefix = ""
+			else :
+				return []
+			node = child
+		result : List[Any] = []
+		stack = [node]
+		while stack and len( result ) < limit :
+			node = stack.pop()
+			result += node.values[:limit - len( result )]
+			stack += [node.children[first][1] for first in sorted( node.children, reverse = True )]
+		return result
+
+
+def _format_signature( name : str, sig : model.Signature ) -> str :
+	args = ", ".join( f"{arg.name}: {arg.type}" if arg.type is not None else arg.name for arg in sig.args )
+	return f"{name}({args}) -> {sig.returnType if sig.returnType is not None else 'Any'}"
+
+
+def _is_symbol( node : model.Node ) -> bool :
+	""" Whether the node is one of the kinds of members that are generated (e.g. not __init__ or descriptors) """
+	if node.name == "__init__" :
+		return False
+	return isinstance( node, ( model.FunctionNode, model.ClassNode, model.EnumNode ) ) or node.type == "property" \
+			or ( node.extra is not None and "value" in node.extra )
+
+
+class SkeletonIndex :
+	""" The members of a skeleton, indexed by path, name, prefix and type """
+	def __init__( self, skeleton : model.Module ) -> None :
+		self.moduleName = skeleton.name
+		self._byPath : Dict[str, model.Node] = {}
+		self._byName : Dict[str, List[str]] = {}
+		self._trie = PrefixTrie()
+		self._byType : Dict[str, Dict[str, List[str]]] = {} # Type -> role -> paths
+		for member in skeleton.members or () :
+			if _is_symbol( member ) :
+				self._add( member.name, member )
+				for classMember in getattr( member, "members", None ) or () :
+					if _is_symbol( classMember ) :
+						self._add( f"{member.name}.{classMember.name}", classMember )
+
+	def _add( self, path : str, node : model.Node ) -> None :
+		self._byPath[path] = node
+		self._byName.setdefault( node.name, [] ).append( path )
+		self._trie.insert( path.lower(), path )
+		if isinstance( node, model.FunctionNode ) and node.signature is not None :
+			sig = node.signature
+			for role, types in ( ( "returns", ( sig.returnType, sig.returnTypeAlt ) ),
+					( "takes", [arg.type for arg in sig.args] + [arg.altType for arg in sig.args] ) ) :
+				names = { name for tp in types if tp is not None for name in _RE_IDENTIFIER.findall( tp ) }
+				for name in names :
+					self._byType.setdefault( name, {} ).setdefault( role, [] ).append( path )
+
+	def describe( self, path : str ) -> JsonObj :
+		node = self._byPath[path]
+		result : JsonObj = { "path" : path, "name" : node.name, "kind" : node.type }
+		if node.doc :
+			result["doc"] = node.doc
+		if isinstance( node, model.FunctionNode ) and node.signature is not None :
+			result["signature"] = _format_signature( node.name, node.signature )
+		elif node.extra is not None and "value" in node.extra :
+			result["value"] = node.extra["value"]
+		members = getattr( node, "members", None )
+		if members is not None :
+			result["members"] = [member.name for member in members]
+		return result
+
+	def lookup( self, path : Optional[str] = None, name : Optional[str] = None ) -> Any :
+		if path is not None :
+			return self.describe( path ) if path in self._byPath else None
+		if name is not None :
+			return [self.describe( path ) for path in self._byName.get( name, () )]
+		raise InvalidParams( "lookup needs a path or a name" )
+
+	def complete( self, prefix : str, limit : int = 50 ) -> List[JsonObj] :
+		result = []
+		for path in self._trie.search( prefix.lower(), limit ) :
+			node = self._byPath[path]
+			item : JsonObj = { "path" : path, "name" : node.name, "kind" : node.type }
+			if isinstance( node, model.FunctionNode ) and node.signature is not None :
+				item["signature"] = _format_signature( node.name, node.signature )
+			result.append( item )
+		return result
+
+	def signature( self, path : str ) -> Optional[JsonObj] :
+		node = self._byPath.get( path )
+		if not isinstance( node, model.FunctionNode ) or node.signature is None :
+			return None
+		sig = node.signature
+		return {
+			"label" : _format_signature( node.name, sig ),
+			"args" : [arg.to_json() for arg in sig.args],
+			"return-type" : sig.returnType,
+			"return-type-alt" : sig.returnTypeAlt,
+			"doc" : node.doc,
+		}
+
+	def methods_by_type( self, type : str, role : Optional[str] = None ) -> List[str] :
+		roles = self._byType.get( type, {} )
+		if role is not None :
+			if role not in ( "returns", "takes" ) :
+				raise InvalidParams( f"Unknown role '{role}'" )
+			return sorted( roles.get( role, () ) )
+		return sorted( set( roles.get( "returns", () ) ) | set( roles.get( "takes", () ) ) )
+
+
+class Server :
+	def __init__( self, path : str, verbosity : int = 0 ) -> None :
+		self._path = path
+		self._verbosity = verbosity
+		self._fileState : Optional[Tuple[int, int]] = None
+		self.index : Optional[SkeletonIndex] = None
+		# Method -> function that returns the (bound) method to call
+		self._methods : Dict[str, Callable[[], Callable[..., Any]]] = {
+			"lookup" : lambda : self.index.lookup,
+			"complete" : lambda : self.index.complete,
+			"signature" : lambda : self.index.signature,
+			"methodsByType" : lambda : self.index.methods_by_type,
+			"reload" : lambda : self._reload_now,
+		}
+
+	def _log( self, message : str ) -> None :
+		# stdout is reserved for responses
+		print( message, file = sys.stderr, flush = True )
+
+	def _reload_now( self ) -> bool :
+		self._fileState = None
+		return self.reload_if_changed( raiseErrors = True ) # Errors are returned to the client
+
+	def reload_if_changed( self, raiseErrors : bool = False ) -> bool :
+		"""
+		Loads the skeleton if its file changed since it was last loaded. If that fails (e.g. because the file is still
+		being written), the previous skeleton is kept, and the error is raised only if raiseErrors is True or no
+		skeleton was loaded before. Returns whether the skeleton was loaded.
+		"""
+		try :
+			st = os.stat( self._path )
+		except OSError as e :
+			if self.index is None or raiseErrors :
+				raise
+			self._log( f"ERROR: {e}" )
+			return False
+		fileState = ( st.st_mtime_ns, st.st_size )
+		if fileState == self._fileState :
+			return False
+		self._fileState = fileState
+		try :
+			with open( self._path, "r" ) as fp :
+				skeleton = compact.load_model( fp )
+			index = SkeletonIndex( skeleton )
+		except Exception as e : # Also for skeletons of the wrong shape, which can fail in many ways
+			if self.index is None or raiseErrors :
+				raise
+			self._log( f"ERROR: Could not reload {self._path}: {e}" )
+			return False
+		self.index = index
+		if self._verbosity >= 1 :
+			self._log( f"Loaded {self._path}" )
+		return True
+
+	def handle( self, line : str ) -> Optional[JsonObj] :
+		""" Handles one request; returns the response, or None for notifications. """
+		try :
+			request = json.loads( line )
+		except ValueError as e :
+			return { "jsonrpc" : "2.0", "id" : None, "error" : { "code" : _PARSE_ERROR, "message" : str( e ) } }
+		if not isinstance( request, dict ) or not isinstance( request.get( "method" ), str ) :
+			return { "jsonrpc" : "2.0", "id" : None,
+					"error" : { "code" : _INVALID_REQUEST, "message" : "Invalid request" } }
+		requestId = request.get( "id" )
+		getMethod = self._methods.get( request["method"] )
+		params = request.get( "params", {} )
+		error = None
+		if getMethod is None :
+			error = { "code" : _METHOD_NOT_FOUND, "message" : f"Unknown method '{request['method']}'" }
+		elif not isinstance( params, dict ) :
+			error = { "code" : _INVALID_PARAMS, "message" : "Parameters must be given by name" }
+		else :
+			try :
+				self.reload_if_changed()
+				method = getMethod()
+				_check_params( method, params )
+				result = method( **params )
+			except InvalidParams as e :
+				error = { "code" : _INVALID_PARAMS, "message" : str( e ) }
+			except Exception as e :
+				self._log( f"ERROR: {request['method']} failed: {e!r}" )
+				error = { "code" : _INTERNAL_ERROR, "message" : str( e ) }
+		if "id" not in request :
+			return None
+		if error is not None :
+			return { "jsonrpc" : "2.0", "id" : requestId, "error" : error }
+		return { "jsonrpc" : "2.0", "id" : requestId, "result" : result }
+
+	def serve( self, inp : TextIO, out : TextIO ) -> None :
+		""" Answers requests until inp ends. """
+		for line in inp :
+			if not line.strip() :
+				continue
+			response = self.handle( line )
+			if response is not None :
+				out.write( json.dumps( response ) )
+				out.write( "\n" )
+				out.flush()
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser( description = "Answers JSON-RPC requests about a skeleton on stdin/stdout." )
+	parser.add_argument( "input_json", help = "The (preprocessed) skeleton, in the usual or the compact format." )
+	parser.add_argument( "-v", "--verbosity", type = int, default = 0, choices = (0,1),
+			help = "Whether to log (re)loading the skeleton to stderr (default: 0)." )
+	args = parser.parse_args()
+
+	server = Server( args.input_json, args.verbosity )
+	server.reload_if_changed()
+	try :
+		server.serve( sys.stdin, sys.stdout )
+	except KeyboardInterrupt :
+		pass
+
+if __name__ == "__main__" :
+	main()
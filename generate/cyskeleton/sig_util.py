@@ -5,195 +5,285 @@ Utilities to compute signatures from function docstrings.
 import re
 
 from cyskeleton.common import *
+from cyskeleton import model
 from cyskeleton import type_util
 
 
-# Type and "real type" in parenthesis or C-style comments
-_RE_RET_TYPE_AUGMENTED = re.compile( r"([^ ]+)\s*\(\s*([^ ()]+)\s*\)" ) # e.g. "int (UnitTypes)"
-_RE_RET_TYPE_AUGMENTED_ALT = re.compile( r"([^ ]+)\s*/\*\s*([^ ]+)\s*\*/" ) # e.g. "int /*UnitTypes*/"
+# A token is (kind, start, end), where kind is the name of the matching group of _RE_TOKEN and s[start:end] is its text.
+# Whitespace is not tokenized; there is whitespace between two tokens iff there is a gap between them.
+_Token = Tuple[str, int, int]
 
+_RE_TOKEN = re.compile( r"(?P<comment>/\*.*?\*/)|(?P<const>const(?![a-zA-Z0-9_]))|(?P<ident>[a-zA-Z_][a-zA-Z0-9_]*)"
+		r"|(?P<star>\*)|(?P<amp>&)|(?P<comma>,)|(?P<lparen>\()|(?P<rparen>\))|(?P<other>\S)", re.DOTALL )
 
-def _parse_type_0( tp : str, tc : type_util.TypeContext ) -> Tuple[Optional[str], Optional[str]] :
-	""" _parse_type, but the alternate type might be the same as the main type """
-	match = _RE_RET_TYPE_AUGMENTED.fullmatch( tp )
-	if match :
-		return tc.cpp_to_python_type( match.group( 1 ) ), tc.cpp_to_python_type( match.group( 2 ), altType = True )
+def _tokenize( s : str ) -> List[_Token] :
+	"""
+	Splits a (possible) signature into tokens, in a single pass.
+	"""
+	return [( match.lastgroup, match.start(), match.end() ) for match in _RE_TOKEN.finditer( s )]
+
+def _text( s : str, tokens : Sequence[_Token] ) -> str :
+	""" The part of s covered by the given (consecutive) tokens. """
+	if not tokens :
+		return ""
+	return s[tokens[0][1]:tokens[-1][2]]
 
-	match = _RE_RET_TYPE_AUGMENTED_ALT.fullmatch( tp )
-	if match :
-		return tc.cpp_to_python_type( match.group( 1 ) ), tc.cpp_to_python_type( match.group( 2 ), altType = True )
+def _last_space( s : str, tokens : Sequence[_Token] ) -> int :
+	"""
+	Returns the index of the first token after the last whitespace in the given tokens, or -1 if there is no whitespace.
+	A comment containing whitespace counts as whitespace.
+	"""
+	for idx in range( len( tokens ) - 1, -1, -1 ) :
+		kind, start, end = tokens[idx]
+		if kind == "comment" and " " in s[start:end] :
+			return idx + 1
+		if idx > 0 and tokens[idx-1][2] != start :
+			return idx
+	return -1
 
+
+def _parse_type_0( s : str, tokens : Sequence[_Token], tc : type_util.TypeContext ) -> Tuple[Optional[str], Optional[str]] :
+	""" _parse_type, but the alternate type might be the same as the main type """
+	lastKind = tokens[-1][0] if tokens else None
+	if lastKind == "rparen" :
+		# "[main] ([alt])"
+		openIdx = len( tokens ) - 2
+		while openIdx >= 0 and tokens[openIdx][0] not in ("lparen", "rparen") :
+			openIdx -= 1
+		if openIdx >= 0 and tokens[openIdx][0] == "lparen" :
+			mainTokens = tokens[:openIdx]
+			altTokens = tokens[openIdx+1:-1]
+			if mainTokens and altTokens and _last_space( s, mainTokens ) == -1 and _last_space( s, altTokens ) == -1 :
+				return tc.cpp_to_python_type( _text( s, mainTokens ) ), \
+						tc.cpp_to_python_type( _text( s, altTokens ), altType = True )
+	elif lastKind == "comment" :
+		# "[main] /*[alt]*/"
+		mainTokens = tokens[:-1]
+		alt = _text( s, tokens[-1:] )[2:-2].strip()
+		if mainTokens and alt and _last_space( s, mainTokens ) == -1 and " " not in alt :
+			return tc.cpp_to_python_type( _text( s, mainTokens ) ), tc.cpp_to_python_type( alt, altType = True )
+
+	tp = _text( s, tokens )
 	return tc.cpp_to_python_type( tp ), tc.cpp_to_python_type( tp, altType = True )
 
-def _parse_type( tp : str, tc : type_util.TypeContext ) -> Tuple[Optional[str], Optional[str]] :
+def _parse_type( s : str, tokens : Sequence[_Token], tc : type_util.TypeContext ) -> Tuple[Optional[str], Optional[str]] :
 	"""
-	Parses a type one of the following forms:
+	Parses a type (given as tokens of s) of one of the following forms:
 		"[main] ([alt])"
 		"[main] /*[alt]*/"
 		"[main]"
 	Returns main, alt. Both values might be None if the given TypeContext rejects the types.
 	"""
-	main, alt = _parse_type_0( tp, tc )
+	main, alt = _parse_type_0( s, tokens, tc )
 	if alt == main :
 		alt = None
 	return main, alt
 
 
-def _parse_rough_func_signature( sig : str ) -> Optional[Tuple[str, str]] :
+def _split_signature( tokens : Sequence[_Token] ) \
+		-> Optional[Tuple[Sequence[_Token], Sequence[_Token], Sequence[_Token]]] :
 	"""
 	Separates the first (return type/name) part from the argument part (in parenthesis).
-	Returns None if typeStr contains non-matching parenthesis. Otherwise, returns (first, second), where
-		second is the part inside the rightmost pair of top-level parenthesis, and
-		first is the part before this pair of parenthesis.
-	The rightmost pair of top-level parenthesis are not present in the result.
+	Returns None if the tokens contain non-matching parenthesis. Otherwise, returns (first, second, rest), where
+		second are the tokens inside the rightmost pair of top-level parenthesis,
+		first are the tokens before this pair of parenthesis, and
+		rest are the tokens after this pair of parenthesis.
 	"""
-	first = ""
-	second = None
+	openIdx = None
+	closeIdx = None
 	numOpenParens = 0
-	for c in sig :
-		if c == "(" :
+	for idx, ( kind, _, _ ) in enumerate( tokens ) :
+		if kind == "lparen" :
 			if numOpenParens == 0 :
-				# Start with second part!
-				# If we already started, then that was a fake second part.
-				if second is not None :
-					first += second
-				second = ""
+				openIdx = idx
 			numOpenParens += 1
-		elif c == ")" :
+		elif kind == "rparen" :
 			if numOpenParens == 0 :
 				return None # Missing opening parenthesis
 			numOpenParens -= 1
+			if numOpenParens == 0 :
+				closeIdx = idx
 
-		# Always do this
-		if second is None :
-			first += c
-		else :
-			second += c
-
-	if numOpenParens != 0 or second is None :
+	if numOpenParens != 0 or openIdx is None :
 		return None
-	else :
-		return first.strip(), second[1:-1].strip() # Remove parentheses around second part
+	assert closeIdx is not None
+	return tokens[:openIdx], tokens[openIdx+1:closeIdx], tokens[closeIdx+1:]
+
+def _split_arguments( tokens : Sequence[_Token] ) -> Iterator[Sequence[_Token]] :
+	""" Splits the tokens at top-level commas. """
+	start = 0
+	numOpenParens = 0
+	for idx, ( kind, _, _ ) in enumerate( tokens ) :
+		if kind == "lparen" :
+			numOpenParens += 1
+		elif kind == "rparen" :
+			numOpenParens -= 1
+		elif kind == "comma" and numOpenParens == 0 :
+			yield tokens[start:idx]
+			start = idx + 1
+	yield tokens[start:]
 
 
 class _SigParser :
-	def __init__( self, tc : type_util.TypeContext, verbosity : int ) -> None :
+	def __init__( self, tc : type_util.TypeContext, verbosity : int, messages : Optional[List[str]] = None ) -> None :
+		"""
+		If messages is given, messages are appended to it instead of printed.
+		"""
 		self._tc = tc
 		self._verbosity = verbosity
+		self._messages = messages
+
+	def _print( self, message : str ) -> None :
+		if self._messages is None :
+			print( message )
+		else :
+			self._messages.append( message )
 
-	def _parse_argument( self, path : str, argDoc : str, argIdx : int ) -> Optional[JsonObj] :
+	def _parse_argument( self, path : str, sig : str, tokens : Sequence[_Token], argIdx : int ) -> Optional[model.Arg] :
 		"""
-		Tries to parse an argument of one of the following forms:
+		Tries to parse an argument (given as tokens of sig) of one of the following forms:
 			"[type]"
 			"[type] [name]"
 			"[name]"
 		where [type] is something accepted by _parse_type
 		"""
-		argDoc = argDoc.strip()
+		argDoc = _text( sig, tokens )
 
-		if " " not in argDoc :
+		spaceIdx = _last_space( sig, tokens )
+		if spaceIdx == -1 :
 			# Special case: we try to guess whether it's a type of a param name
 
 			# Try parsing type, but also check whether we can be sure it's really a type
-			tp, altTp = _parse_type( argDoc, self._tc )
+			tp, altTp = _parse_type( sig, tokens, self._tc )
 			if tp is not None and self._tc.is_known_obj_type( tp ) and altTp is None or self._tc.is_known_obj_type( altTp ) :
-				return {
-					"name" : f"arg{argIdx}",
-					"type" : tp,
-					"alt-type" : altTp
-				}
-			elif type_util.is_python_identifier( argDoc ) :
-				return { "name" : argDoc } # The whole thing is probably a name
+				return model.Arg( f"arg{argIdx}", tp, altTp )
+			elif len( tokens ) == 1 and tokens[0][0] in ("ident", "const") :
+				return model.Arg( argDoc ) # The whole thing is probably a name
 			else :
 				if self._verbosity >= 2 :
-					print( f"{path} - Cannot parse argument '{argDoc}': Neither valid type nor valid identifier" )
+					self._print( f"{path} - Cannot parse argument '{argDoc}': Neither valid type nor valid identifier" )
 				return None
 
 		# Otherwise, we have a space.
 
 		# Still might be just a type (e.g. "int /*YieldTypes*/")
-		tp, altTp = _parse_type( argDoc, self._tc )
+		tp, altTp = _parse_type( sig, tokens, self._tc )
 		if tp is not None and altTp is not None :
 			# parse_type is rigorous if there is a space; this must be a type
-			return {
-				"name" : f"arg{argIdx}",
-				"type" : tp,
-				"alt-type" : altTp
-			}
+			return model.Arg( f"arg{argIdx}", tp, altTp )
 
 		# Only remaining case: should be of the form "[type] [name]".
-		idx = argDoc.rfind( " " ) # rfind, as [type] might still a space
-		typePart = argDoc[:idx].strip()
-		argNamePart = argDoc[idx+1:].strip()
-		tp, altTp = _parse_type( typePart, self._tc )
+		# Split at the last space, as [type] might still contain a space
+		typeTokens = tokens[:spaceIdx]
+		nameTokens = tokens[spaceIdx:]
+		tp, altTp = _parse_type( sig, typeTokens, self._tc )
 
 		if tp is not None :
 			# Special case like "CvPlot *plot"
-			if argNamePart.startswith( "*" ) :
-				argNamePart = argNamePart[1:].strip()
-			if argNamePart.startswith( "&" ) :
-				argNamePart = argNamePart[1:].strip()
+			if nameTokens and nameTokens[0][0] == "star" :
+				nameTokens = nameTokens[1:]
+			if nameTokens and nameTokens[0][0] == "amp" :
+				nameTokens = nameTokens[1:]
 
 			# Check if everything came out right
-			if type_util.is_python_identifier( argNamePart ) :
-				return {
-					"name" : f"arg{argIdx}",
-					"type" : tp,
-					"alt-type" : altTp
-				}
+			if len( nameTokens ) == 1 and nameTokens[0][0] in ("ident", "const") :
+				return model.Arg( f"arg{argIdx}", tp, altTp )
 			else :
 				if self._verbosity >= 2 :
-					print( f"{path} - Cannot parse argument '{argDoc}': assumed name '{argNamePart}' not valid" )
+					self._print( f"{path} - Cannot parse argument '{argDoc}': assumed name '{_text( sig, nameTokens )}' not valid" )
 				return None
 		else :
 			if self._verbosity >= 2 :
-				print( f"{path} - Cannot parse argument '{argDoc}': assumed type '{typePart}' not valid" )
+				self._print( f"{path} - Cannot parse argument '{argDoc}': assumed type '{_text( sig, typeTokens )}' not valid" )
 			return None
 
-	def parse( self, path : str, sig: str ) -> Optional[JsonObj] :
-		result = {}
+	def parse( self, path : str, sig: str, funcName : Optional[str] = None ) -> Optional[model.Signature] :
+		"""
+		Parses the signature of the function at path (only used in messages). funcName defaults to the last part of
+		path.
+		"""
+		result = model.Signature()
 
-		rfs = _parse_rough_func_signature( sig )
-		if rfs is None :
+		tokens = _tokenize( sig )
+		split = _split_signature( tokens )
+		if split is None :
+			if self._verbosity >= 3 :
+				self._print( f"{path} - Cannot parse signature '{sig}': missing or non-matching parentheses" )
+			return None
+		retTypeTokens, argsTokens, restTokens = split
+		if restTokens :
 			if self._verbosity >= 3 :
-				print( f"{path} - Cannot parse signature '{sig}': missing or non-matching parentheses" )
+				self._print( f"{path} - Cannot parse signature '{sig}': unexpected '{_text( sig, restTokens )}' after arguments" )
 			return None
-		retTypeDoc, argsDoc = rfs
 
 		# First, see if the function name is contained in the signature and we accidentally parsed it
-		funcName = path.split( "." )[-1] # TODO?
-		if retTypeDoc.endswith( funcName ) :
-			retTypeDoc = retTypeDoc[:-len(funcName)].strip()
+		if funcName is None :
+			funcName = path.rpartition( "." )[2]
+		if retTypeTokens and _text( sig, retTypeTokens[-1:] ) == funcName :
+			retTypeTokens = retTypeTokens[:-1]
 
 		# Parse return type
-		if retTypeDoc != "" :
-			retType, retTypeAlt = _parse_type( retTypeDoc, self._tc )
+		if retTypeTokens :
+			retType, retTypeAlt = _parse_type( sig, retTypeTokens, self._tc )
 			if retType is None :
 				if self._verbosity >= 3 :
-					print( f"{path} - Cannot parse signature '{sig}': invalid return type '{retTypeDoc}'" )
+					self._print( f"{path} - Cannot parse signature '{sig}': invalid return type '{_text( sig, retTypeTokens )}'" )
 				return None
-			result["return-type"] = retType
-			if retTypeAlt is not None :
-				result["return-type-alt"] = retTypeAlt
+			result.returnType = retType
+			result.returnTypeAlt = retTypeAlt
 
-		result["args"] = []
-
-		if argsDoc != "" :
+		if argsTokens :
 			argNames = set() # To catch duplicate argument names
-			for idx, arg in enumerate( argsDoc.split( "," ) ) :
-				parsed = self._parse_argument( f"{path}/arg{idx}", arg, idx )
+			for idx, argTokens in enumerate( _split_arguments( argsTokens ) ) :
+				parsed = self._parse_argument( f"{path}/arg{idx}", sig, argTokens, idx )
 				if parsed is None :
 					return None # Failed parsing that argument; error message already printed
-				assert parsed["name"] is not None
-				if parsed["name"] in argNames :
+				assert parsed.name is not None
+				if parsed.name in argNames :
 					if self._verbosity >= 1 :
-						print( f"{path} - Cannot parse signature '{sig}': duplicate arg name '{parsed['name']}" )
-				argNames.add( parsed["name"] )
-				result["args"].append( parsed )
+						self._print( f"{path} - Cannot parse signature '{sig}': duplicate arg name '{parsed.name}" )
+				argNames.add( parsed.name )
+				result.args.append( parsed )
 
 		return result
 
 
 
-def try_parse_signature( path : str, sig: str, tc : type_util.TypeContext, verbosity : int ) -> Optional[JsonObj] :
-	return _SigParser( tc, verbosity ).parse( path, sig )
\ No newline at end of file
+def try_parse_signature( path : str, sig: str, tc : type_util.TypeContext, verbosity : int ) \
+		-> Optional[model.Signature] :
+	return _SigParser( tc, verbosity ).parse( path, sig )
+
+
+class SigParseCache :
+	"""
+	Parses signatures like try_parse_signature, but parses each distinct signature only once. The result of parsing
+	only depends on the signature and, if it appears in the signature, the function name (see _SigParser.parse), as
+	long as the custom types of the TypeContext don't change. Messages are recorded on the first parse and printed
+	again, with the path of the function, whenever the result is reused.
+	Results are shared between functions, so they must not be modified.
+	"""
+	def __init__( self, tc : type_util.TypeContext, verbosity : int ) -> None :
+		self._messages : List[str] = []
+		self._parser = _SigParser( tc, verbosity, self._messages )
+		self._results : Dict[Tuple[str, Optional[str]], Tuple[Optional[model.Signature], Tuple[str, ...]]] = {}
+		self.parses = 0
+		self.hits = 0 # Parses avoided
+
+	def parse( self, path : str, sig : str ) -> Optional[model.Signature] :
+		funcName = path.rpartition( "." )[2]
+		key = ( sig, funcName if funcName in sig else None )
+		entry = self._results.get( key )
+		if entry is None :
+			# All messages start with the path, so parse with an empty one and prepend the path when printing
+			result = self._parser.parse( "", sig, funcName )
+			if result is not None :
+				result.args = tuple( result.args )
+			entry = self._results[key] = ( result, tuple( self._messages ) )
+			self._messages.clear()
+			self.parses += 1
+		else :
+			self.hits += 1
+		result, messages = entry
+		for message in messages :
+			print( path + message )
+		return result
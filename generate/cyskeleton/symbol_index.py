@@ -0,0 +1,189 @@
+"""
+An SQLite database of the symbols of a (preprocessed) skeleton, for tools that need to look up classes, methods and
+their types without parsing the generated module.
+
+Tables:
+* classes( id, name, kind, doc, hash ): The classes ("class"), enums ("enum") and the module itself ("module"), whose
+  methods are the module functions. hash identifies the content, so unchanged classes are not rewritten.
+* methods( id, class_id, name, kind, return_type, return_type_alt, doc ): Methods, module functions ("function") and
+  properties ("property"; without return type). Module values (e.g. true and false) are not included.
+* args( method_id, position, name, type, alt_type )
+* enum_values( class_id, name, value )
+* meta( key, value ): The fingerprint of the inputs (see output.fingerprint).
+
+All name and type columns are indexed, and names also case-insensitively, so prefix searches (LIKE 'get%') use an
+index, too. For example, the methods that take a PlayerTypes (usually declared as an int with an alt-type):
+	SELECT c.name, m.name FROM args a JOIN methods m ON m.id = a.method_id JOIN classes c ON c.id = m.class_id
+	WHERE a.type = 'PlayerTypes' OR a.alt_type = 'PlayerTypes'
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from cyskeleton.common import *
+from cyskeleton import model
+
+
+_APPLICATION_ID = 0x4379536B # "CySk", marks the file as a symbol index
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE classes (
+	id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL,
+	kind TEXT NOT NULL,
+	doc TEXT,
+	hash TEXT NOT NULL
+);
+CREATE TABLE methods (
+	id INTEGER PRIMARY KEY,
+	class_id INTEGER NOT NULL REFERENCES classes( id ) ON DELETE CASCADE,
+	name TEXT NOT NULL,
+	kind TEXT NOT NULL,
+	return_type TEXT,
+	return_type_alt TEXT,
+	doc TEXT
+);
+CREATE TABLE args (
+	method_id INTEGER NOT NULL REFERENCES methods( id ) ON DELETE CASCADE,
+	position INTEGER NOT NULL,
+	name TEXT NOT NULL,
+	type TEXT,
+	alt_type TEXT
+);
+CREATE TABLE enum_values (
+	class_id INTEGER NOT NULL REFERENCES classes( id ) ON DELETE CASCADE,
+	name TEXT NOT NULL,
+	value INTEGER
+);
+CREATE TABLE meta (
+	key TEXT PRIMARY KEY,
+	value TEXT
+);
+CREATE INDEX classes_name ON classes( name );
+CREATE INDEX classes_name_nocase ON classes( name COLLATE NOCASE );
+CREATE INDEX methods_class ON methods( class_id );
+CREATE INDEX methods_name ON methods( name );
+CREATE INDEX methods_name_nocase ON methods( name COLLATE NOCASE );
+CREATE INDEX methods_return_type ON methods( return_type );
+CREATE INDEX methods_return_type_alt ON methods( return_type_alt );
+CREATE INDEX args_method ON args( method_id );
+CREATE INDEX args_type ON args( type );
+CREATE INDEX args_alt_type ON args( alt_type );
+CREATE INDEX enum_values_class ON enum_values( class_id );
+CREATE INDEX enum_values_name ON enum_values( name );
+CREATE INDEX enum_values_name_nocase ON enum_values( name COLLATE NOCASE );
+"""
+
+_KINDS = { "class" : "class", "type" : "enum" } # Node type -> kind
+
+
+def _connect( path : str ) -> sqlite3.Connection :
+	"""
+	Opens the database at path, creating the tables if it is new. A symbol index with another schema version is
+	recreated. Raises ValueError if the file exists but is no symbol index, so other files are never overwritten.
+	"""
+	isNew = not os.path.exists( path ) or os.path.getsize( path ) == 0
+	conn = sqlite3.connect( path )
+	if not isNew :
+		try :
+			applicationId = conn.execute( "PRAGMA application_id" ).fetchone()[0]
+			version = conn.execute( "PRAGMA user_version" ).fetchone()[0]
+		except sqlite3.DatabaseError :
+			applicationId = version = None
+		if applicationId != _APPLICATION_ID :
+			conn.close()
+			raise ValueError( f"{path} exists and is no symbol index; remove it or choose another path" )
+		if version != _SCHEMA_VERSION :
+			conn.close()
+			os.remove( path )
+			conn = sqlite3.connect( path )
+			isNew = True
+	if isNew :
+		conn.executescript( _SCHEMA )
+		conn.execute( f"PRAGMA application_id = {_APPLICATION_ID}" )
+		conn.execute( f"PRAGMA user_version = {_SCHEMA_VERSION}" )
+		conn.commit()
+	conn.execute( "PRAGMA foreign_keys = ON" )
+	return conn
+
+def read_fingerprint( path : str ) -> Optional[str] :
+	""" Returns the fingerprint stored in the database at path, or None if it has none or does not exist. """
+	if not os.path.exists( path ) :
+		return None
+	try :
+		conn = sqlite3.connect( path )
+		try :
+			row = conn.execute( "SELECT value FROM meta WHERE key = 'fingerprint'" ).fetchone()
+		finally :
+			conn.close()
+	except sqlite3.Error :
+		return None
+	return row[0] if row is not None else None
+
+
+def _hash( doc : Optional[str], nodes : Iterable[model.Node] ) -> str :
+	h = hashlib.sha256( json.dumps( doc ).encode( "utf-8" ) )
+	for node in nodes :
+		h.update( json.dumps( node.to_json() ).encode( "utf-8" ) )
+		h.update( b"\0" )
+	return h.hexdigest()
+
+def _insert_members( conn : sqlite3.Connection, classId : int, kind : str, members : Iterable[model.Node] ) -> None :
+	for member in members :
+		if isinstance( member, model.FunctionNode ) :
+			sig = member.signature
+			cursor = conn.execute( "INSERT INTO methods( class_id, name, kind, return_type, return_type_alt, doc ) "
+					"VALUES ( ?, ?, ?, ?, ?, ? )", ( classId, member.name, member.type,
+					sig.returnType if sig is not None else None, sig.returnTypeAlt if sig is not None else None,
+					member.doc ) )
+			if sig is not None :
+				conn.executemany( "INSERT INTO args( method_id, position, name, type, alt_type ) "
+						"VALUES ( ?, ?, ?, ?, ? )", [( cursor.lastrowid, position, arg.name, arg.type, arg.altType )
+						for position, arg in enumerate( sig.args )] )
+		elif member.type == "property" :
+			conn.execute( "INSERT INTO methods( class_id, name, kind ) VALUES ( ?, ?, ? )",
+					( classId, member.name, member.type ) )
+		elif kind == "enum" and member.extra is not None and "value" in member.extra :
+			conn.execute( "INSERT INTO enum_values( class_id, name, value ) VALUES ( ?, ?, ? )",
+					( classId, member.name, member.extra["value"] ) )
+
+def write_index( skeleton : model.Module, path : str, fingerprint : Optional[str] = None ) -> Tuple[int, int, int] :
+	"""
+	Writes the symbols of the skeleton into the database at path. Classes and enums whose content did not change
+	since the last run are kept as they are. fingerprint is stored for read_fingerprint.
+	Returns the number of written, unchanged and removed classes (including enums and the module).
+	"""
+	assert skeleton.type == "module"
+	members = skeleton.members or []
+	# The module's own entry holds the module functions
+	owners : List[Tuple[str, str, Optional[str], List[model.Node]]] = [( skeleton.name, "module", skeleton.doc,
+			[member for member in members if member.type not in _KINDS] )]
+	owners += [( member.name, _KINDS[member.type], member.doc, member.members or [] )
+			for member in members if member.type in _KINDS]
+
+	written = unchanged = 0
+	conn = _connect( path )
+	try :
+		with conn : # One transaction
+			existing = { ( name, kind ) : ( classId, contentHash ) for classId, name, kind, contentHash
+					in conn.execute( "SELECT id, name, kind, hash FROM classes" ) }
+			for name, kind, doc, ownerMembers in owners :
+				contentHash = _hash( doc, ownerMembers )
+				old = existing.pop( ( name, kind ), None )
+				if old is not None :
+					if old[1] == contentHash :
+						unchanged += 1
+						continue
+					conn.execute( "DELETE FROM classes WHERE id = ?", ( old[0], ) )
+				cursor = conn.execute( "INSERT INTO classes( name, kind, doc, hash ) VALUES ( ?, ?, ?, ? )",
+						( name, kind, doc, contentHash ) )
+				_insert_members( conn, cursor.lastrowid, kind, ownerMembers )
+				written += 1
+			conn.executemany( "DELETE FROM classes WHERE id = ?", [( classId, ) for classId, _ in existing.values()] )
+			conn.execute( "INSERT OR REPLACE INTO meta( key, value ) VALUES ( 'fingerprint', ? )", ( fingerprint, ) )
+	finally :
+		conn.close()
+	return written, unchanged, len( existing )
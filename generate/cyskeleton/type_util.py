@@ -47,6 +47,7 @@ _BUILTIN_TYPES : Mapping[str, str] = {
 	"std::vector<CvString>" : "List[str]",
 	"python::tuple" : "Tuple"
 }
+_BUILTIN_PY_TYPES : FrozenSet[str] = frozenset( _BUILTIN_TYPES.values() )
 
 @dataclass
 class _TypeOverride :
@@ -65,14 +66,85 @@ class _TypeOverride :
 		)
 
 
+# Backreferences (and conditionals) refer to group numbers or names, which change in a combined pattern
+_RE_BACKREFERENCE = re.compile( r"\\[1-9]|\(\?P=|\(\?\(" )
+
+class _TypeOverrideDispatch :
+	"""
+	All type overrides, compiled into as few alternations as possible (for types that are known, and for types that
+	are not). The leftmost alternative that matches is the first applicable override. Patterns that can't be
+	combined (e.g. with backreferences) are tried on their own, in order.
+	"""
+	def __init__( self, typeOverrides : Sequence[_TypeOverride] ) -> None :
+		self._typeOverrides = list( typeOverrides )
+		self._stepsAll = self._compile( range( len( self._typeOverrides ) ) )
+		self._stepsUnknown = self._compile(
+				idx for idx, to in enumerate( self._typeOverrides ) if not to.mustBeKnown )
+
+	def _compile( self, indices : Iterable[int] ) -> List[Tuple[re.Pattern, Optional[_TypeOverride]]] :
+		"""
+		Returns the steps to try in order: a combined pattern of consecutive overrides (with None), or the pattern of
+		a single override (with that override).
+		"""
+		steps : List[Tuple[re.Pattern, Optional[_TypeOverride]]] = []
+		run : List[int] = []
+		def flush() -> None :
+			if len( run ) > 1 :
+				try :
+					steps.append( ( re.compile( "|".join(
+							f"(?P<_to{idx}>{self._typeOverrides[idx].pattern.pattern})" for idx in run ) ), None ) )
+					run.clear()
+					return
+				except re.error :
+					pass # e.g. conflicting group names; try them one by one
+			steps.extend( ( self._typeOverrides[idx].pattern, self._typeOverrides[idx] ) for idx in run )
+			run.clear()
+		for idx in indices :
+			to = self._typeOverrides[idx]
+			if _RE_BACKREFERENCE.search( to.pattern.pattern ) :
+				flush()
+				steps.append( ( to.pattern, to ) )
+			else :
+				run.append( idx )
+		flush()
+		return steps
+
+	def find( self, cppType : str, known : bool ) -> Tuple[Optional[_TypeOverride], Optional["re.Match[str]"]] :
+		"""
+		Returns the first override that applies to the given type, and the match of its pattern.
+		"""
+		for pattern, to in self._stepsAll if known else self._stepsUnknown :
+			match = pattern.fullmatch( cppType )
+			if match :
+				if to is None :
+					assert match.lastgroup is not None
+					to = self._typeOverrides[int( match.lastgroup[len( "_to" ):] )]
+					match = to.pattern.fullmatch( cppType )
+				return to, match
+		return None, None
+
+
 class TypeContext :
-	def __init__( self ) -> None :
+	def __init__( self, cacheSize : int = 4096 ) -> None :
+		"""
+		cacheSize is the maximum number of results of cpp_to_python_type to remember (0 disables the cache).
+		"""
 		self._knownCustomTypes : Set[str] = set()
 		self._typeOverrides : List[_TypeOverride] = []
+		self._dispatch = _TypeOverrideDispatch( () )
+		self._cacheSize = cacheSize
+		self._cache : Dict[Tuple[str, bool], Optional[str]] = {}
+		self.cacheHits = 0
+		self.cacheMisses = 0
+
+	def _invalidate( self ) -> None :
+		self._cache.clear()
 
 	def add_custom_type( self, name : str ) -> None :
 		assert is_python_identifier( name )
-		self._knownCustomTypes.add( name )
+		if name not in self._knownCustomTypes :
+			self._knownCustomTypes.add( name )
+			self._invalidate()
 
 	def _add_type_override( self, to : _TypeOverride ) -> None :
 		self._typeOverrides.append( to )
@@ -80,6 +152,8 @@ class TypeContext :
 	def read_type_overrides( self, config : JsonObj ) -> None :
 		for toData in config.get( "type-overrides", () ) :
 			self._add_type_override( _TypeOverride.parse( toData ) )
+		self._dispatch = _TypeOverrideDispatch( self._typeOverrides )
+		self._invalidate()
 
 	def custom_types( self ) -> Iterator[str] :
 		yield from self._knownCustomTypes
@@ -88,6 +162,24 @@ class TypeContext :
 		"""
 		Returns a valid python type (assuming correct config) or None
 		"""
+		key = ( cppType, altType )
+		try :
+			result = self._cache[key]
+		except KeyError :
+			pass
+		else :
+			self.cacheHits += 1
+			return result
+
+		self.cacheMisses += 1
+		result = self._cpp_to_python_type( cppType, altType )
+		if self._cacheSize > 0 :
+			if len( self._cache ) >= self._cacheSize :
+				del self._cache[next( iter( self._cache ) )] # Evict oldest entry
+			self._cache[key] = result
+		return result
+
+	def _cpp_to_python_type( self, cppType : str, altType : bool ) -> Optional[str] :
 		if cppType in _BUILTIN_TYPES :
 			return _BUILTIN_TYPES[cppType] # We trust these are valid
 
@@ -96,17 +188,16 @@ class TypeContext :
 		if cppType in _BUILTIN_TYPES :
 			return _BUILTIN_TYPES[cppType] # We trust these are valid
 
-		for to in self._typeOverrides :
-			if not to.mustBeKnown or self.is_known_obj_type( cppType ) :
-				match = to.pattern.fullmatch( cppType )
-				if match :
-					if not altType :
-						return to.newType.format( *match.groups() ) # We trust these are valid
-					else :
-						if to.newTypeAlt is None :
-							return cppType
-						else :
-							return to.newTypeAlt.format( *match.groups() ) # We trust these are valid
+		to, match = self._dispatch.find( cppType, self.is_known_obj_type( cppType ) )
+		if to is not None :
+			assert match is not None
+			if not altType :
+				return to.newType.format( *match.groups() ) # We trust these are valid
+			else :
+				if to.newTypeAlt is None :
+					return cppType
+				else :
+					return to.newTypeAlt.format( *match.groups() ) # We trust these are valid
 
 		# We don't trust that this is a valid python identifier
 		return python_identifier_or_none( cppType )
@@ -116,12 +207,34 @@ class TypeContext :
 		Whether we can be sure that the specified type is a conventional type, e.g. int, str, List[str] or CyGame
 		(as opposed to something like function or instancemethod).
 		"""
-		return pyType in _BUILTIN_TYPES.values() or pyType in self._knownCustomTypes
+		return pyType in _BUILTIN_PY_TYPES or pyType in self._knownCustomTypes
 
 
 def test() -> None :
 	tc = TypeContext()
 	assert tc.cpp_to_python_type( "CvTutorialMessage*" ) == "CvTutorialMessage"
+
+	# Cached results must not survive changes to the known types or type overrides
+	tc.read_type_overrides( { "type-overrides" : [{ "pattern" : "[a-zA-Z]+Types", "type" : "int", "must-be-known" : True }] } )
+	assert tc.cpp_to_python_type( "PlayerTypes" ) == "PlayerTypes"
+	tc.add_custom_type( "PlayerTypes" )
+	assert tc.cpp_to_python_type( "PlayerTypes" ) == "int"
+	assert tc.cpp_to_python_type( "PlayerTypes", altType = True ) == "PlayerTypes"
+
+	# Backreferences must refer to the groups of their own pattern, and the first applicable override wins
+	tc = TypeContext()
+	tc.read_type_overrides( { "type-overrides" : [
+		{ "pattern" : "(Foo)Bar", "type" : "FooBar" },
+		{ "pattern" : "(\\w+)_\\1", "type" : "Twice" },
+		{ "pattern" : "(?P<x>\\w+)-(?P=x)", "type" : "TwiceNamed" },
+		{ "pattern" : "[a-z]+_[a-z]+", "type" : "Snake" },
+	] } )
+	assert tc.cpp_to_python_type( "FooBar" ) == "FooBar"
+	assert tc.cpp_to_python_type( "abc_abc" ) == "Twice"
+	assert tc.cpp_to_python_type( "Foo_Foo" ) == "Twice"
+	assert tc.cpp_to_python_type( "abc_def" ) == "Snake"
+	assert tc.cpp_to_python_type( "abc-abc" ) == "TwiceNamed"
+	assert tc.cpp_to_python_type( "abc-def" ) is None
 	print( "All tests passed." )
 
 if __name__ == "__main__" :
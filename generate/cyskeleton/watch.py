@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Watches a skeleton and a configuration file, and preprocesses and generates the skeleton again whenever they change.
+
+The skeleton, the preprocessor (with its type context and parsed signatures) and the results for each module member
+are kept in memory, and only the members affected by a change are preprocessed and generated again:
+* If members of the skeleton changed, only these are rebuilt.
+* If only signature overrides changed, only members with a function whose applicable overrides changed are rebuilt.
+* If the set of classes and enums or anything else in the configuration changed, all members are rebuilt.
+Files are polled for changes, so this works the same on every platform.
+"""
+
+import contextlib
+import io
+import json
+import os
+import time
+
+from cyskeleton.common import *
+from cyskeleton import compact
+from cyskeleton import generate
+from cyskeleton import json_stream
+from cyskeleton import model
+from cyskeleton import output
+from cyskeleton import preprocess
+
+
+class _MemberState :
+	""" A module member and the results of building it """
+	__slots__ = ( "data", "key", "node", "output", "usedSigOverrides", "code", "json" )
+
+	def __init__( self, data : JsonObj, key : str ) -> None :
+		self.data = data # As read from the skeleton
+		self.key = key # data as JSON, to detect changes
+		self.node : Optional[model.Node] = None # Preprocessed; None if not built yet
+		self.output = "" # Printed while building
+		self.usedSigOverrides : Set[preprocess.SigOverride] = set()
+		self.code = "" # Generated code
+		self.json : Optional[str] = None # Preprocessed JSON, as written by json_stream.JsonStreamWriter
+
+
+def _function_paths( moduleName : str, data : JsonObj ) -> Iterator[str] :
+	""" Yields the paths of the functions that preprocessing the given module member looks at. """
+	if data["type"] == "function" :
+		yield f"{moduleName}.{data['name']}"
+	elif data["type"] == "class" :
+		for member in data.get( "members", () ) :
+			if member["type"] == "instancemethod" :
+				yield f"{moduleName}.{data['name']}.{member['name']}"
+
+
+def _file_state( path : Optional[str] ) -> Optional[Tuple[int, int]] :
+	if path is None :
+		return None
+	try :
+		st = os.stat( path )
+	except OSError :
+		return None
+	return st.st_mtime_ns, st.st_size
+
+
+class Watcher :
+	def __init__( self, inputPath : str, configPath : Optional[str], outputPath : str,
+			preprocessedPath : Optional[str] = None, package : bool = False, verbosity : int = 0 ) -> None :
+		"""
+		outputPath is the generated module, or the package directory if package is True. If preprocessedPath is given,
+		the preprocessed skeleton is written there, too.
+		"""
+		self._inputPath = inputPath
+		self._configPath = configPath
+		self._outputPath = outputPath
+		self._preprocessedPath = preprocessedPath
+		self._package = package
+		self._verbosity = verbosity
+
+		self._inputState : Optional[Tuple[int, int]] = None
+		self._configState : Optional[Tuple[int, int]] = None
+		self._conf : Optional[JsonObj] = None
+		self._moduleData : Optional[JsonObj] = None # The module without members
+		self._members : List[_MemberState] = []
+		self._mp : Optional[preprocess.ModulePreprocessor] = None
+		self._rebuildAll = False # Kept if reading the other file fails
+
+	def _read_config( self ) -> bool :
+		"""
+		Reads the configuration and updates the preprocessor. Returns whether all members need to be rebuilt;
+		otherwise, only members affected by changed signature overrides are marked for rebuilding.
+		"""
+		if self._configPath is None :
+			conf : JsonObj = {}
+		else :
+			with open( self._configPath, "r" ) as fp :
+				conf = json.load( fp )
+		oldConf = self._conf
+		if oldConf is None or self._mp is None \
+				or { key : value for key, value in conf.items() if key != "sig-overrides" } \
+				!= { key : value for key, value in oldConf.items() if key != "sig-overrides" } :
+			self._conf = conf
+			return True
+		if conf.get( "sig-overrides", [] ) != oldConf.get( "sig-overrides", [] ) :
+			moduleName = self._moduleData["name"]
+			oldMatches = { state.key : [self._mp.sig_overrides_for( path )
+					for path in _function_paths( moduleName, state.data )] for state in self._members }
+			self._mp.set_sig_overrides( conf.get( "sig-overrides", [] ) )
+			for state in self._members :
+				if oldMatches[state.key] != [self._mp.sig_overrides_for( path )
+						for path in _function_paths( moduleName, state.data )] :
+					state.node = None
+		self._conf = conf
+		return False
+
+	def _read_skeleton( self ) -> bool :
+		"""
+		Reads the skeleton, reusing the states of unchanged members. Returns whether all members need to be rebuilt.
+		"""
+		with open( self._inputPath, "r" ) as fp :
+			data = compact.load( fp )
+		oldMembers = { state.key : state for state in self._members }
+		members = []
+		for memberData in data.get( "members", () ) :
+			key = json.dumps( memberData )
+			state = oldMembers.get( key )
+			members.append( state if state is not None else _MemberState( memberData, key ) )
+		oldTypes = sorted( ( state.data["type"], state.data["name"] ) for state in self._members
+				if state.data["type"] in ("class", "type") )
+		self._members = members
+		self._moduleData = { key : value for key, value in data.items() if key != "members" }
+		newTypes = sorted( ( state.data["type"], state.data["name"] ) for state in self._members
+				if state.data["type"] in ("class", "type") )
+		return newTypes != oldTypes
+
+	def build( self, force : bool = False ) -> bool :
+		"""
+		Rebuilds the output if the input files changed since the last build (or if force is True).
+		Returns whether anything was built.
+		"""
+		inputState = _file_state( self._inputPath )
+		configState = _file_state( self._configPath )
+		if not force and inputState == self._inputState and configState == self._configState and self._conf is not None :
+			return False
+		start = time.perf_counter()
+		self._rebuildAll |= force
+		# The configuration state is only set once the file was read, so a broken configuration is read again on the
+		# next check; nothing can be built without it
+		if force or configState != self._configState or self._conf is None :
+			self._rebuildAll |= self._read_config()
+			self._configState = configState
+		# The skeleton state is set first, so a broken skeleton (e.g. one that is still being written) is not read
+		# again until it changes
+		if force or inputState != self._inputState :
+			self._inputState = inputState
+			self._rebuildAll |= self._read_skeleton()
+		if self._moduleData is None or self._conf is None :
+			raise ValueError( f"{self._inputPath} could not be read; waiting for it to change" )
+
+		moduleName = self._moduleData["name"]
+		if self._rebuildAll :
+			with contextlib.redirect_stdout( io.StringIO() ) as out :
+				self._mp = preprocess.ModulePreprocessor( moduleName, self._conf, self._verbosity )
+				self._mp.add_custom_types( state.data for state in self._members )
+			print( out.getvalue(), end = "" )
+			for state in self._members :
+				state.node = None
+			self._rebuildAll = False
+
+		rebuilt = 0
+		for state in self._members :
+			if state.node is None :
+				self._build_member( state, moduleName )
+				print( state.output, end = "" )
+				rebuilt += 1
+		self._mp.pop_used_sig_overrides()
+		for state in self._members :
+			self._mp.add_used_sig_overrides( state.usedSigOverrides )
+		self._mp.warn_unused_sig_overrides()
+
+		changed = self._write()
+		print( f"Rebuilt {rebuilt} of {len( self._members )} members in {time.perf_counter() - start:.2f} s"
+				+ ( "" if changed else ", output unchanged" ) )
+		return True
+
+	def _build_member( self, state : _MemberState, moduleName : str ) -> None :
+		assert self._mp is not None
+		node = model.from_json( state.data )
+		with contextlib.redirect_stdout( io.StringIO() ) as out :
+			self._mp.preprocess_member( node )
+			if self._preprocessedPath is not None :
+				state.json = json_stream.JsonStreamWriter.dumps_element( node.to_json() )
+			state.code = generate.gen_member_to_string( node, moduleName ) # Prints warnings
+		state.node = node
+		state.output = out.getvalue()
+		state.usedSigOverrides = self._mp.pop_used_sig_overrides()
+
+	def _write( self ) -> bool :
+		""" Writes the outputs. Returns whether any output changed. """
+		module = model.from_json( self._moduleData )
+		changed = False
+		if self._preprocessedPath is not None :
+			preprocessedFile = output.OutputFile( self._preprocessedPath )
+			with preprocessedFile as fp :
+				writer = json_stream.JsonStreamWriter( fp )
+				writer.begin()
+				for key, value in self._moduleData.items() :
+					writer.write_item( key, value )
+				writer.begin_list( "members" )
+				for state in self._members :
+					writer.write_element_text( state.json )
+				writer.end_list()
+				writer.end()
+			changed = preprocessedFile.changed
+		if self._package :
+			module.members = [state.node for state in self._members]
+			with contextlib.redirect_stdout( io.StringIO() ) : # Warnings were printed when the members were built
+				written, _, removed = generate.write_package( module, self._outputPath )
+			changed = changed or written > 0 or removed > 0
+		else :
+			outputFile = output.OutputFile( self._outputPath )
+			with outputFile as fp :
+				fp.write( generate.gen_module_header( module ) )
+				for state in self._members :
+					fp.write( "\n" )
+					fp.write( state.code )
+			changed = changed or outputFile.changed
+		return changed
+
+	def watch( self, interval : float ) -> None :
+		""" Builds whenever the input files change, until interrupted. """
+		print( f"Watching {self._inputPath}" + ( f" and {self._configPath}" if self._configPath else "" ) )
+		lastError = None
+		while True :
+			try :
+				self.build()
+				lastError = None
+			except ( OSError, ValueError ) as e :
+				# E.g. a file that is still being written; it is read again when it changes. A broken configuration
+				# is read again on every check, so the same error is only printed once.
+				if str( e ) != lastError :
+					print( f"ERROR: {e}" )
+				lastError = str( e )
+			time.sleep( interval )
+
+
+def main() -> None :
+	import argparse
+
+	parser = argparse.ArgumentParser( description = "Preprocesses and generates a skeleton whenever the skeleton or "
+			"the configuration change, rebuilding only the affected classes." )
+	parser.add_argument( "--config", help = "The configuration file to use." )
+	parser.add_argument( "input_json", help = "The input skeleton (in the usual or the compact format)." )
+	parser.add_argument( "output_py", help = "The path to the output file, usually named 'CvPythonExtensions.py'. "
+			"With --package, the package directory, usually named 'CvPythonExtensions'." )
+	parser.add_argument( "--package", action = "store_true",
+			help = "Write a package with one module per class instead of a single module." )
+	parser.add_argument( "--preprocessed", metavar = "PATH", help = "Also write the preprocessed skeleton to PATH." )
+	parser.add_argument( "-v", "--verbosity", type = int, default = 0, choices = (0,1,2,3),
+			help = "How much information to print (0: nothing, 3: everything; default:0)." )
+	parser.add_argument( "--interval", type = float, default = 0.5,
+			help = "Seconds between checks for changes (default: %(default)s)." )
+	args = parser.parse_args()
+
+	watcher = Watcher( args.input_json, args.config, args.output_py, args.preprocessed, args.package, args.verbosity )
+	try :
+		watcher.watch( args.interval )
+	except KeyboardInterrupt :
+		pass
+
+if __name__ == "__main__" :
+	main()
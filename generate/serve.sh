@@ -0,0 +1,2 @@
+#!/bin/bash
+PYTHONPATH=.:$PYTHONPATH ./cyskeleton/serve.py $@
\ No newline at end of file